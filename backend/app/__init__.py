@@ -35,4 +35,15 @@ def create_app(config_name):
     from app.api.v1 import api as api_v1_blueprint
     app.register_blueprint(api_v1_blueprint, url_prefix='/api/v1')
     
+    # 注册知识库初始化任务，需要在应用上下文中执行
+    from app.utils.background_jobs import background_job_queue, register_app_job
+    from app.api.v1.tech_summaries import KNOWLEDGE_BASE_INIT_KIND, run_knowledge_base_init
+    register_app_job(app, KNOWLEDGE_BASE_INIT_KIND, run_knowledge_base_init)
+
+    # 启动爬取任务和后台任务的worker，继续执行重启前未完成的任务
+    if not app.testing:
+        from app.utils.crawl_jobs import crawl_job_queue
+        crawl_job_queue.start()
+        background_job_queue.start()
+    
     return app 
\ No newline at end of file
@@ -1,5 +1,6 @@
 from flask import request, jsonify, Blueprint
 from app.utils.flashrag_service import flashrag_service
+from app.utils.sse import sse_response
 import logging
 
 rag_bp = Blueprint('rag', __name__)
@@ -59,20 +60,67 @@ def rag_chat():
             "message": f"处理请求时出错: {str(e)}"
         }), 500
 
+@rag_bp.route('/chat/stream', methods=['POST'])
+def rag_chat_stream():
+    """
+    RAG智能问答接口（SSE流式返回）
+    ---
+    请求体同 /chat
+    
+    响应（text/event-stream）:
+    event: sources  data: {"sources": [{"title": "来源标题", "id": "来源ID"}, ...]}
+    event: delta    data: {"content": "新生成的文本"}（多次）
+    event: done     data: {"model": "模型名称"}
+    出错时以 event: error  data: {"message": "错误信息"} 结束
+    """
+    data = request.get_json(silent=True)
+    if not data or 'query' not in data:
+        return jsonify({
+            "success": False,
+            "message": "缺少必要参数"
+        }), 400
+    
+    return sse_response(flashrag_service.stream_rag_query(data['query'], data.get('provider', 'deepseek')))
+
 @rag_bp.route('/init_flashrag', methods=['POST'])
 def init_flashrag():
     """
     初始化FlashRAG索引
     ---
+    请求体(可选):
+    {
+        "doc_ids": ["文档ID", ...]  // 只增量重建这些文档，不传则全量重建
+    }
+    
     响应:
     {
         "success": 布尔值,
         "message": "结果信息"
     }
     """
+    data = request.get_json(silent=True) or {}
+    doc_ids = data.get('doc_ids')
+    
     try:
+        if doc_ids:
+            # 增量更新指定文档，知识库中已不存在的文档从索引中删除
+            updated, removed = 0, 0
+            for doc_id in doc_ids:
+                doc_id = str(doc_id)
+                doc = flashrag_service.knowledge_base.get_document(doc_id)
+                if doc:
+                    flashrag_service.upsert_document(doc_id, doc['title'], doc['content'], doc.get('metadata', {}))
+                    updated += 1
+                elif flashrag_service.delete_document(doc_id):
+                    removed += 1
+            
+            return jsonify({
+                "success": True,
+                "message": f"FlashRAG索引增量更新成功：更新{updated}篇，删除{removed}篇"
+            })
+        
         # 重新初始化FlashRAG服务
-        flashrag_service._init_index()
+        flashrag_service.rebuild()
         
         return jsonify({
             "success": True,
@@ -83,4 +131,40 @@ def init_flashrag():
         return jsonify({
             "success": False,
             "message": f"初始化FlashRAG索引时出错: {str(e)}"
-        }), 500
\ No newline at end of file
+        }), 500
+
+@rag_bp.route('/cache_stats', methods=['GET'])
+def rag_cache_stats():
+    """
+    RAG缓存统计接口
+    返回查询向量缓存、检索结果缓存、问答结果缓存和语义问答缓存的命中、未命中、淘汰和失效次数，用于调整缓存大小
+    """
+    from app.utils.rag_service import rag_service
+    return jsonify({
+        "success": True,
+        "data": {
+            "embedding": flashrag_service.embedding_service.cache_stats(),
+            "search_results": flashrag_service.cache.stats(),
+            "semantic_answers": flashrag_service.semantic_cache.stats() if flashrag_service.semantic_cache is not None else None,
+            "answers": rag_service.query_cache.stats(),
+            "persistent_answers": rag_service.answer_cache.stats() if rag_service.answer_cache is not None else None
+        }
+    })
+
+@rag_bp.route('/llm_stats', methods=['GET'])
+def rag_llm_stats():
+    """
+    LLM调用统计接口
+    返回LLM网关的请求数、新建连接数和TLS握手次数，每个提供商熔断器的状态，以及路由统计的延迟分位数、错误率和对冲次数
+    """
+    from app.utils.llm_gateway import llm_gateway
+    from app.utils.llm_retry import breaker_stats
+    from app.utils.llm_router import llm_router
+    return jsonify({
+        "success": True,
+        "data": {
+            "gateway": llm_gateway.stats(),
+            "breakers": breaker_stats(),
+            "routing": llm_router.stats()
+        }
+    })
@@ -5,10 +5,19 @@ from app.models import TechSummary, User, db
 from app.api.v1.errors import bad_request, not_found, unauthorized
 import logging
 from datetime import datetime
-from app.utils.crawler import crawl_url
-from app.utils.llm_api import llm_service
-from app.utils.chat_with_doc import chat_with_document, chat_with_knowledge_base
+from app.utils.crawler import is_valid_url
+from app.utils.crawl_jobs import (
+    crawl_job_queue, crawl_dedup_key, crawl_and_summarize as run_crawl_and_summarize, CrawlError, CRAWL_JOB_KIND,
+    bulk_crawl_and_summarize, CRAWL_BATCH_MAX_URLS
+)
+from app.utils.chat_with_doc import (
+    chat_with_document, chat_with_knowledge_base,
+    stream_chat_with_document, stream_chat_with_knowledge_base, stream_pure_ai_chat
+)
+from app.utils.sse import sse_response
 from app.utils.knowledge_base import knowledge_base
+from app.utils.flashrag_service import flashrag_service
+from app.utils.background_jobs import background_job_queue
 
 @api.route('/tech_summaries', methods=['GET'])
 def get_tech_summaries():
@@ -242,6 +251,12 @@ def delete_tech_summary(id):
     except Exception as e:
         logging.error(f"从知识库中移除技术总结时出错: {str(e)}")
     
+    # 从FlashRAG索引中增量删除技术总结
+    try:
+        flashrag_service.delete_document(str(id))
+    except Exception as e:
+        logging.error(f"从FlashRAG索引中删除技术总结时出错: {str(e)}")
+    
     db.session.delete(summary)
     db.session.commit()
     logging.info(f"技术总结删除成功 - ID: {id}")
@@ -251,7 +266,10 @@ def delete_tech_summary(id):
 @api.route('/tech_summaries/crawl', methods=['POST'])
 @jwt_required()
 def crawl_and_summarize():
-    """爬取URL内容并使用大语言模型进行总结"""
+    """
+    爬取URL内容并使用大语言模型进行总结
+    在当前请求中同步执行，可能占用worker几分钟；新代码应使用 /tech_summaries/crawl/jobs
+    """
     data = request.get_json() or {}
     
     # 检查必填字段
@@ -262,57 +280,151 @@ def crawl_and_summarize():
     provider = data.get('provider', 'deepseek')  # 默认使用DeepSeek
     custom_prompt = data.get('custom_prompt', None)  # 可选的自定义提示词
     
-    # 爬取URL内容
-    crawl_result = crawl_url(url)
+    if not is_valid_url(url):
+        return jsonify({
+            'success': False,
+            'message': '无效的URL格式'
+        }), 400
     
-    if not crawl_result['success']:
+    try:
+        result = run_crawl_and_summarize(url, provider, custom_prompt)
+    except CrawlError as e:
         return jsonify({
             'success': False,
-            'message': crawl_result['message']
+            'message': str(e)
         }), 400
     
-    # 提取爬取的内容
-    crawled_data = crawl_result['data']
-    content = crawled_data['content']
-    original_title = crawled_data['title']
-    
-    # 使用大语言模型进行总结
-    summary_result = llm_service.summarize_content(
-        content=content,
-        url=url,
-        provider=provider,
-        prompt=custom_prompt
-    )
+    # 返回结果
+    return jsonify({
+        'success': True,
+        'message': '爬取和总结成功',
+        'data': result
+    })
+
+@api.route('/tech_summaries/crawl/jobs', methods=['POST'])
+@jwt_required()
+def submit_crawl_job():
+    """
+    提交爬取和总结任务，立即返回任务ID
+    相同URL、提供商和提示词的任务在执行中或刚完成时直接返回已有的任务
+    """
+    data = request.get_json() or {}
+    
+    # 检查必填字段
+    if 'url' not in data:
+        return bad_request('URL是必填项')
     
-    if not summary_result['success']:
+    url = data.get('url', '')
+    provider = data.get('provider', 'deepseek')
+    custom_prompt = data.get('custom_prompt', None)
+    
+    if not is_valid_url(url):
+        return bad_request('无效的URL格式')
+    
+    try:
+        job, created = crawl_job_queue.submit(
+            CRAWL_JOB_KIND,
+            {'url': url, 'provider': provider, 'custom_prompt': custom_prompt},
+            dedup_key=crawl_dedup_key(url, provider, custom_prompt)
+        )
+    except Exception as e:
+        logging.exception(f"提交爬取任务时出错: {str(e)}")
         return jsonify({
             'success': False,
-            'message': summary_result['message']
-        }), 400
+            'message': f'提交爬取任务时出错: {str(e)}'
+        }), 500
     
-    # 提取总结内容
-    summary_data = summary_result['data']
-    summary = summary_data['summary']
+    return jsonify({
+        'success': True,
+        'message': '已提交爬取任务，可通过任务ID查询进度' if created else '相同的爬取任务已存在',
+        'data': job
+    }), 202 if job['status'] in ('pending', 'running') else 200
+
+@api.route('/tech_summaries/crawl/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_crawl_job(job_id):
+    """查询爬取任务的状态（pending / running / completed / failed）和当前阶段（fetching / summarizing）"""
+    job = crawl_job_queue.get(job_id)
+    if not job:
+        return not_found('任务不存在')
     
-    # 使用AI生成的标题，如果没有则使用原始标题
-    ai_title = summary_data.get('title', '')
-    title = ai_title if ai_title else original_title
+    return jsonify({
+        'success': True,
+        'data': job
+    })
+
+@api.route('/tech_summaries/crawl/jobs/<job_id>/result', methods=['GET'])
+@jwt_required()
+def get_crawl_job_result(job_id):
+    """获取爬取任务的结果，格式与 /tech_summaries/crawl 相同；任务未完成时返回202"""
+    job = crawl_job_queue.get(job_id)
+    if not job:
+        return not_found('任务不存在')
+    
+    if job['status'] == 'failed':
+        return jsonify({
+            'success': False,
+            'message': job['error']
+        }), 400
+    if job['status'] != 'completed':
+        return jsonify({
+            'success': False,
+            'message': '任务尚未完成',
+            'data': job
+        }), 202
     
-    # 返回结果
     return jsonify({
         'success': True,
         'message': '爬取和总结成功',
-        'data': {
-            'title': title,
-            'content': summary,
-            'url': url,
-            'original_content': content,
-            'original_title': original_title,
-            'provider': summary_data['provider'],
-            'model': summary_data['model'],
-            'tags': summary_data.get('tags', '')
-        }
-    }) 
+        'data': job['result']
+    })
+
+@api.route('/tech_summaries/crawl/batch', methods=['POST'])
+@jwt_required()
+def crawl_and_summarize_batch():
+    """
+    批量爬取URL并总结（SSE流式返回）
+    事件：start（URL总数）、result（每个URL完成时一条，data字段与 /tech_summaries/crawl 相同）、done（统计）
+    """
+    data = request.get_json() or {}
+    
+    urls = data.get('urls')
+    if not isinstance(urls, list) or not urls:
+        return bad_request('urls必须是非空的URL列表')
+    if len(urls) > CRAWL_BATCH_MAX_URLS:
+        return bad_request(f'一次最多提交{CRAWL_BATCH_MAX_URLS}个URL')
+    
+    provider = data.get('provider', 'deepseek')
+    custom_prompt = data.get('custom_prompt', None)
+    
+    urls = [url.strip() if isinstance(url, str) else '' for url in urls]
+    valid = [(index, url) for index, url in enumerate(urls) if is_valid_url(url)]
+    
+    def events():
+        succeeded = failed = 0
+        yield 'start', {'total': len(urls)}
+        
+        # 无效的URL直接返回失败
+        valid_indexes = {index for index, _ in valid}
+        for index, url in enumerate(urls):
+            if index not in valid_indexes:
+                failed += 1
+                yield 'result', {'index': index, 'url': url, 'success': False, 'data': None,
+                                 'message': '无效的URL格式', 'stage': 'validating', 'elapsed': 0}
+        
+        elapsed = 0
+        for result in bulk_crawl_and_summarize([url for _, url in valid], provider, custom_prompt):
+            result['index'] = valid[result['index']][0]
+            elapsed = result['elapsed']
+            if result['success']:
+                succeeded += 1
+            else:
+                failed += 1
+            yield 'result', result
+        
+        yield 'done', {'total': len(urls), 'succeeded': succeeded, 'failed': failed, 'elapsed': elapsed}
+    
+    return sse_response(events())
 
 @api.route('/tech_summaries/<int:id>/chat', methods=['POST'])
 def chat_with_tech_summary(id):
@@ -363,6 +475,24 @@ def chat_with_tech_summary(id):
             'message': f'处理请求时出错: {str(e)}'
         }), 500
 
+@api.route('/tech_summaries/<int:id>/chat/stream', methods=['POST'])
+def stream_chat_with_tech_summary(id):
+    """基于技术总结内容进行聊天（SSE流式返回）"""
+    summary = TechSummary.query.get(id)
+    if not summary:
+        return not_found('技术总结不存在')
+    
+    data = request.get_json() or {}
+    if 'query' not in data:
+        return bad_request('问题是必填项')
+    
+    provider = data.get('provider', 'deepseek')
+    if data.get('use_knowledge_base', False):
+        events = stream_chat_with_knowledge_base(data['query'], str(id), provider)
+    else:
+        events = stream_chat_with_document(summary.content, data['query'], provider)
+    return sse_response(events)
+
 @api.route('/knowledge_base/chat', methods=['POST'])
 def chat_with_global_knowledge_base():
     """基于全局知识库进行聊天"""
@@ -400,6 +530,16 @@ def chat_with_global_knowledge_base():
             'message': f'处理请求时出错: {str(e)}'
         }), 500
 
+@api.route('/knowledge_base/chat/stream', methods=['POST'])
+def stream_chat_with_global_knowledge_base():
+    """基于全局知识库进行聊天（SSE流式返回）"""
+    data = request.get_json() or {}
+    if 'query' not in data:
+        return bad_request('问题是必填项')
+    
+    provider = data.get('provider', 'deepseek')
+    return sse_response(stream_chat_with_knowledge_base(data['query'], None, provider))
+
 @api.route('/ai/chat', methods=['POST'])
 def pure_ai_chat():
     """纯AI聊天，不使用知识库"""
@@ -415,29 +555,17 @@ def pure_ai_chat():
     
     try:
         # 直接调用AI API，不使用知识库
-        from app.utils.chat_with_doc import _call_ai_api
-        
-        # 构建系统提示
-        system_prompt = """你是一个专业的AI助手。请直接回答用户的问题，提供准确、详细、有用的信息。
-
-请用中文回答，要准确、详细、全面。请提供完整的解释和具体的步骤，包括：
-1. 详细的概念解释
-2. 具体的实施步骤或方法
-3. 相关的技术细节
-4. 实际应用场景或示例
-5. 注意事项或最佳实践
-
-回答应该具有教学性质，帮助用户深入理解相关内容。"""
+        from app.utils.chat_with_doc import _call_ai_api, PURE_AI_SYSTEM_PROMPT
         
-        # 调用AI API
-        ai_answer = _call_ai_api(data['query'], system_prompt, provider)
+        # 调用AI API，路由可能改用其他提供商回答
+        ai_answer, answered_by = _call_ai_api(data['query'], PURE_AI_SYSTEM_PROMPT, provider)
         
         if ai_answer:
             return jsonify({
                 'success': True,
                 'data': {
                     'answer': ai_answer,
-                    'provider': provider,
+                    'provider': answered_by,
                     'mode': 'pure_ai'
                 }
             })
@@ -454,44 +582,123 @@ def pure_ai_chat():
             'message': f'处理请求时出错: {str(e)}'
         }), 500
 
+@api.route('/ai/chat/stream', methods=['POST'])
+def stream_pure_ai_chat_endpoint():
+    """纯AI聊天，不使用知识库（SSE流式返回）"""
+    data = request.get_json() or {}
+    if 'query' not in data:
+        return bad_request('问题是必填项')
+    
+    provider = data.get('provider', 'deepseek')
+    return sse_response(stream_pure_ai_chat(data['query'], provider))
+
+def _tech_summary_document(tech_summary):
+    """将技术总结转换为知识库文档"""
+    return {
+        'id': str(tech_summary.id),
+        'title': tech_summary.title,
+        'content': tech_summary.content,
+        'metadata': {
+            'summary_type': tech_summary.summary_type,
+            'tags': tech_summary.tags,
+            'created_at': tech_summary.created_at.isoformat() if tech_summary.created_at else None,
+            'updated_at': tech_summary.updated_at.isoformat() if tech_summary.updated_at else None,
+            'user_id': tech_summary.user_id,
+            'source_url': tech_summary.source_url
+        }
+    }
+
 # 添加技术总结到知识库的钩子函数
-def add_tech_summary_to_knowledge_base(tech_summary):
-    """将技术总结添加到知识库"""
+def add_tech_summary_to_knowledge_base(tech_summary, update_index=True):
+    """将技术总结添加到知识库，并增量更新FlashRAG索引"""
+    document = _tech_summary_document(tech_summary)
     try:
         knowledge_base.add_document(
-            doc_id=str(tech_summary.id),
-            title=tech_summary.title,
-            content=tech_summary.content,
-            metadata={
-                'summary_type': tech_summary.summary_type,
-                'tags': tech_summary.tags,
-                'created_at': tech_summary.created_at.isoformat() if tech_summary.created_at else None,
-                'updated_at': tech_summary.updated_at.isoformat() if tech_summary.updated_at else None,
-                'user_id': tech_summary.user_id,
-                'source_url': tech_summary.source_url
-            }
+            doc_id=document['id'],
+            title=document['title'],
+            content=document['content'],
+            metadata=document['metadata']
         )
         logging.info(f"已将技术总结 '{tech_summary.title}' (ID: {tech_summary.id}) 添加到知识库")
     except Exception as e:
         logging.error(f"将技术总结添加到知识库时出错: {str(e)}")
+        return
+    
+    if not update_index:
+        return
+    
+    # 只重新向量化这一篇技术总结，而不是全量重建索引
+    try:
+        flashrag_service.upsert_document(document['id'], document['title'], document['content'], document['metadata'])
+    except Exception as e:
+        logging.error(f"增量更新FlashRAG索引时出错: {str(e)}")
+
+# 知识库初始化每批处理的技术总结数量
+KNOWLEDGE_BASE_INIT_BATCH_SIZE = 200
+KNOWLEDGE_BASE_INIT_KIND = 'knowledge_base_init'
+
+def run_knowledge_base_init(job, params):
+    """
+    后台执行知识库初始化（在应用上下文中由任务队列的worker调用）
+    按主键顺序分批读取技术总结（只查询需要的列，不构造ORM对象），每批依次：
+    批量写入知识库、把内容有变化的文档向量化写入本进程的FlashRAG索引、预先编码向量知识库的向量缓存。
+    任务完成时知识库和共享的向量缓存已更新；其他worker进程的FlashRAG索引和向量知识库在各自下一次检索时按知识库版本号同步
+    """
+    from app.utils.rag_service import rag_service
+    
+    batch_size = params.get('batch_size', KNOWLEDGE_BASE_INIT_BATCH_SIZE)
+    columns = (TechSummary.id, TechSummary.title, TechSummary.content, TechSummary.summary_type,
+               TechSummary.tags, TechSummary.created_at, TechSummary.updated_at,
+               TechSummary.user_id, TechSummary.source_url)
+    total = db.session.query(TechSummary.id).count()
+    job.update(f'indexing 0/{total}')
+    
+    processed = 0
+    batch = []
+    
+    def flush():
+        knowledge_base.add_documents(batch)
+        # 只重新向量化内容有变化的文档；FlashRAG索引不可用时不做处理，最后整体重建
+        flashrag_service.sync(persist=False)
+        rag_service.precompute_embeddings(batch)
+        job.update(f'indexing {processed}/{total}')
+        batch.clear()
+    
+    try:
+        rows = db.session.query(*columns).order_by(TechSummary.id).yield_per(batch_size)
+        for row in rows:
+            batch.append(_tech_summary_document(row))
+            processed += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        db.session.remove()
+    
+    job.update('persisting')
+    flashrag_service.commit_bulk_upsert()
+    
+    return {'documents': processed}
 
 # 添加初始化知识库的API
 @api.route('/knowledge_base/init', methods=['POST'])
 @jwt_required()
 def init_knowledge_base():
-    """初始化知识库，将所有技术总结添加到知识库"""
+    """
+    初始化知识库，在后台分批将所有技术总结添加到知识库，返回可轮询的任务
+    任务保存在所有worker进程共享的任务队列中，初始化正在执行时直接返回该任务
+    """
     try:
-        # 获取所有技术总结
-        summaries = TechSummary.query.all()
-        
-        # 添加到知识库
-        for summary in summaries:
-            add_tech_summary_to_knowledge_base(summary)
-        
+        job, created = background_job_queue.submit(
+            KNOWLEDGE_BASE_INIT_KIND, {'batch_size': KNOWLEDGE_BASE_INIT_BATCH_SIZE},
+            dedup_key=KNOWLEDGE_BASE_INIT_KIND
+        )
         return jsonify({
             'success': True,
-            'message': f'已成功将{len(summaries)}篇技术总结添加到知识库'
-        })
+            'message': '已开始初始化知识库，可通过任务ID查询进度' if created else '知识库正在初始化，可通过任务ID查询进度',
+            'data': job
+        }), 202
     except Exception as e:
         logging.exception(f"初始化知识库时出错: {str(e)}")
         return jsonify({
@@ -499,6 +706,22 @@ def init_knowledge_base():
             'message': f'初始化知识库时出错: {str(e)}'
         }), 500
 
+@api.route('/knowledge_base/init/<job_id>', methods=['GET'])
+@jwt_required()
+def get_knowledge_base_init_status(job_id):
+    """
+    查询知识库初始化任务的状态和当前阶段（indexing 已处理数/总数、persisting）
+    完成表示知识库和执行任务的进程的索引已更新，其他worker进程在各自下一次检索时同步
+    """
+    job = background_job_queue.get(job_id)
+    if not job:
+        return not_found('任务不存在')
+    
+    return jsonify({
+        'success': True,
+        'data': job
+    })
+
 # 添加调试API端点
 @api.route('/tech_summaries/<int:id>/debug', methods=['GET'])
 @jwt_required()
@@ -0,0 +1,179 @@
+"""
+持久化问答缓存
+问答结果保存在本地SQLite文件（WAL模式）中，同一台机器上的多个worker进程共享，重启后仍然有效。
+每条记录带有生成时的知识库版本（内容哈希），版本不一致的记录视为未命中；条目数超过上限时按最近访问时间淘汰
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Optional
+from .startup_optimizer import startup_optimizer
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 记录最近访问时间的最小间隔（秒），避免每次命中都写数据库
+TOUCH_INTERVAL = 60
+
+
+class AnswerCache:
+    """
+    基于SQLite的跨进程问答缓存
+    每个线程使用独立的数据库连接；数据库出错时记录日志并视为未命中，不影响问答本身
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: Optional[float] = None):
+        """
+        初始化问答缓存
+
+        Args:
+            path: SQLite数据库文件路径
+            max_entries: 最大条目数，超出后淘汰最久未访问的条目
+            ttl: 过期时间（秒），None表示不过期
+        """
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """当前线程的数据库连接，首次使用时创建数据库和表"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, kb_version TEXT NOT NULL, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_accessed_at ON answers (accessed_at)")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key: str, kb_version: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存的回答
+
+        Args:
+            key: 缓存键
+            kb_version: 当前知识库版本
+
+        Returns:
+            缓存的回答，不存在、已过期或知识库版本不一致时返回None
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT kb_version, value, created_at, accessed_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[0] != kb_version or (self.ttl is not None and row[2] + self.ttl <= now):
+                self._count('misses')
+                return None
+            if now - row[3] >= TOUCH_INTERVAL:
+                conn.execute("UPDATE answers SET accessed_at = ? WHERE key = ?", (now, key))
+            value = json.loads(row[1])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"读取问答缓存失败: {str(e)}")
+            self._count('errors')
+            return None
+
+        self._count('hits')
+        return value
+
+    def set(self, key: str, kb_version: str, value: Dict[str, Any]) -> None:
+        """
+        写入回答
+
+        Args:
+            key: 缓存键
+            kb_version: 生成回答时的知识库版本
+            value: 回答（可JSON序列化的字典）
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (key, kb_version, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kb_version, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._count('writes')
+            # 每写入max_entries/10次检查一次容量，超出上限的部分一次淘汰
+            if self.writes % max(1, self.max_entries // 10) == 0:
+                self.prune(kb_version)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"写入问答缓存失败: {str(e)}")
+            self._count('errors')
+
+    def prune(self, kb_version: Optional[str] = None) -> int:
+        """
+        清理缓存：删除其他知识库版本和已过期的条目，条目数超过上限时淘汰最久未访问的条目
+
+        Args:
+            kb_version: 当前知识库版本，提供时删除其他版本的条目
+
+        Returns:
+            删除的条目数
+        """
+        conn = self._connect()
+        deleted = 0
+        if kb_version is not None:
+            deleted += conn.execute("DELETE FROM answers WHERE kb_version != ?", (kb_version,)).rowcount
+        if self.ttl is not None:
+            deleted += conn.execute("DELETE FROM answers WHERE created_at <= ?", (time.time() - self.ttl,)).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+        if excess > 0:
+            deleted += conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY accessed_at LIMIT ?)", (excess,)
+            ).rowcount
+        return deleted
+
+    def clear(self) -> None:
+        """清空缓存"""
+        try:
+            self._connect().execute("DELETE FROM answers")
+        except sqlite3.Error as e:
+            logger.warning(f"清空问答缓存失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计（命中次数等只统计当前进程）"""
+        try:
+            size = self._connect().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        lookups = self.hits + self.misses
+        return {
+            'path': self.path,
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'writes': self.writes,
+            'errors': self.errors
+        }
+
+
+# 创建全局实例（数据库在首次读写时才创建），关闭时为None
+answer_cache = AnswerCache(
+    startup_optimizer.get_answer_cache_path(),
+    max_entries=startup_optimizer.get_answer_cache_size(),
+    ttl=startup_optimizer.get_answer_cache_ttl()
+) if startup_optimizer.should_enable_answer_cache() else None
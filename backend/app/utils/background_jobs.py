@@ -0,0 +1,42 @@
+"""
+后台任务
+耗时的维护操作（如知识库初始化）放到持久化任务队列中执行，调用方通过任务ID轮询进度，避免HTTP请求超时。
+任务保存在SQLite中，所有worker进程共享：任一进程都能查询任务，同一时间只执行一个同名任务，重启后未完成的任务继续执行
+"""
+
+import os
+import logging
+from typing import Any, Callable, Dict
+
+from .job_queue import JobQueue, JobHandle
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 任务队列配置
+BACKGROUND_JOB_DB_PATH = os.environ.get(
+    'BACKGROUND_JOB_DB_PATH', os.path.join(os.path.dirname(__file__), '..', 'cache', 'background_jobs.db')
+)
+BACKGROUND_JOB_WORKERS = int(os.environ.get('BACKGROUND_JOB_WORKERS', '1'))
+BACKGROUND_JOB_LEASE = float(os.environ.get('BACKGROUND_JOB_LEASE', '1800'))
+
+
+def register_app_job(app, kind: str, handler: Callable[[JobHandle, Dict[str, Any]], Any]) -> None:
+    """
+    注册需要Flask应用上下文的任务，处理函数在app.app_context()中执行
+
+    Args:
+        app: Flask应用
+        kind: 任务类型
+        handler: 处理函数，参数为 (JobHandle, 任务参数)
+    """
+    def run(job: JobHandle, params: Dict[str, Any]) -> Any:
+        with app.app_context():
+            return handler(job, params)
+
+    background_job_queue.register(kind, run)
+
+
+# 创建全局任务队列；维护任务每次提交都应重新执行，只有执行中的同名任务会被复用
+background_job_queue = JobQueue(BACKGROUND_JOB_DB_PATH, workers=BACKGROUND_JOB_WORKERS,
+                                lease=BACKGROUND_JOB_LEASE, dedup_ttl=0)
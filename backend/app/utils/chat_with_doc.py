@@ -1,14 +1,12 @@
 import logging
-import random
-import time
-import requests
-import json
 import os
-from typing import Dict, Any, Optional, List
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from typing import Dict, Any, Optional, List, Callable, Iterator, Tuple
 
 from app.utils.knowledge_base import knowledge_base
+from app.utils.llm_stream import stream_chat_completion, LLMStreamError
+from app.utils.llm_gateway import LLMGatewayError
+from app.utils.llm_retry import retry_policy, CircuitOpenError
+from app.utils.llm_router import llm_router, configured_providers
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -23,167 +21,96 @@ DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "")
 OPENAI_API_URL = os.environ.get("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 
-# 超时配置
-API_CONNECT_TIMEOUT = int(os.environ.get("API_CONNECT_TIMEOUT", "10"))
-API_READ_TIMEOUT = int(os.environ.get("API_READ_TIMEOUT", "90"))
-API_MAX_RETRIES = int(os.environ.get("API_MAX_RETRIES", "3"))
+# 非流式问答支持的提供商
+SUPPORTED_PROVIDERS = ('deepseek', 'openai')
 
-# 创建会话对象以复用连接
-def create_session():
-    """创建带有重试策略的会话"""
-    session = requests.Session()
-    
-    # 配置重试策略
-    retry_strategy = Retry(
-        total=3,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["HEAD", "GET", "OPTIONS", "POST"],
-        backoff_factor=1
-    )
-    
-    adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=10, pool_maxsize=20)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    
-    return session
+# 纯AI聊天（不使用知识库）的系统提示
+PURE_AI_SYSTEM_PROMPT = """你是一个专业的AI助手。请直接回答用户的问题，提供准确、详细、有用的信息。
 
-# 全局会话对象
-_session = create_session()
+请用中文回答，要准确、详细、全面。请提供完整的解释和具体的步骤，包括：
+1. 详细的概念解释
+2. 具体的实施步骤或方法
+3. 相关的技术细节
+4. 实际应用场景或示例
+5. 注意事项或最佳实践
+
+回答应该具有教学性质，帮助用户深入理解相关内容。"""
+
+# 超时配置（连接超时由LLM网关统一配置，重试次数和总时限由LLM重试策略统一配置）
+API_READ_TIMEOUT = int(os.environ.get("API_READ_TIMEOUT", "90"))
 
-def _call_ai_api(query: str, system_prompt: str, provider: str = 'deepseek') -> str:
+def _request_ai_api(provider: str, query: str, system_prompt: str) -> str:
     """
-    调用AI API生成回答
+    向指定的提供商请求回答，重试和熔断由LLM重试策略统一处理
     
     Args:
+        provider: AI提供商
         query: 用户查询
         system_prompt: 系统提示
-        provider: AI提供商
         
     Returns:
         AI生成的回答
+        
+    Raises:
+        LLMGatewayError: 提供商未配置、请求失败或处于熔断状态
     """
-    max_retries = API_MAX_RETRIES
-    retry_delay = 2  # 秒
-    
-    for attempt in range(max_retries):
-        try:
-            if provider == "deepseek" and DEEPSEEK_API_KEY:
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                    "Connection": "close"  # 避免连接复用问题
-                }
-                
-                payload = {
-                    "model": "deepseek-chat",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": query}
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 1500,  # 进一步减少token数量以提高响应速度
-                    "stream": False  # 确保不使用流式响应
-                }
-                
-                # 分别设置连接超时和读取超时
-                timeout_config = (API_CONNECT_TIMEOUT, API_READ_TIMEOUT)  # (连接超时, 读取超时)
-                
-                logger.info(f"正在调用DeepSeek API (尝试 {attempt + 1}/{max_retries})...")
-                
-                response = _session.post(
-                    DEEPSEEK_API_URL,
-                    headers=headers,
-                    json=payload,
-                    timeout=timeout_config,
-                    verify=True  # 确保SSL验证
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info("DeepSeek API调用成功")
-                    return result['choices'][0]['message']['content']
-                else:
-                    logger.error(f"DeepSeek API请求失败: {response.status_code}, 响应: {response.text}")
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay * (attempt + 1))  # 递增延迟
-                        continue
-                    
-            elif provider == "openai" and OPENAI_API_KEY:
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {OPENAI_API_KEY}",
-                    "Connection": "close"
-                }
-                
-                payload = {
-                    "model": "gpt-3.5-turbo",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": query}
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 1500,
-                    "stream": False
-                }
-                
-                timeout_config = (API_CONNECT_TIMEOUT, API_READ_TIMEOUT)
-                
-                logger.info(f"正在调用OpenAI API (尝试 {attempt + 1}/{max_retries})...")
-                
-                response = _session.post(
-                    OPENAI_API_URL,
-                    headers=headers,
-                    json=payload,
-                    timeout=timeout_config,
-                    verify=True
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info("OpenAI API调用成功")
-                    return result['choices'][0]['message']['content']
-                else:
-                    logger.error(f"OpenAI API请求失败: {response.status_code}, 响应: {response.text}")
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay * (attempt + 1))
-                        continue
-                        
-        except requests.exceptions.Timeout as e:
-            logger.warning(f"调用{provider} API超时 (尝试 {attempt + 1}/{max_retries}): {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay * (attempt + 1))
-                continue
-        except requests.exceptions.ConnectionError as e:
-            logger.warning(f"调用{provider} API连接错误 (尝试 {attempt + 1}/{max_retries}): {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay * (attempt + 1))
-                continue
-        except Exception as e:
-            logger.exception(f"调用{provider} API时出错 (尝试 {attempt + 1}/{max_retries}): {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay * (attempt + 1))
-                continue
-    
-    # 如果所有重试都失败，返回None
-    logger.error(f"所有{max_retries}次API调用尝试都失败，将使用后备方案")
-    return None
+    if provider == "deepseek" and DEEPSEEK_API_KEY:
+        url, api_key, model = DEEPSEEK_API_URL, DEEPSEEK_API_KEY, "deepseek-chat"
+    elif provider == "openai" and OPENAI_API_KEY:
+        url, api_key, model = OPENAI_API_URL, OPENAI_API_KEY, "gpt-3.5-turbo"
+    else:
+        raise LLMGatewayError(f"{provider} API未配置")
+    
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": query}
+        ],
+        "temperature": 0.3,
+        "max_tokens": 1500,  # 进一步减少token数量以提高响应速度
+        "stream": False  # 确保不使用流式响应
+    }
+    
+    logger.info(f"正在调用{provider} API...")
+    response = retry_policy.post(provider, url, json=payload, headers=headers, timeout=API_READ_TIMEOUT)
+    result = response.json()
+    logger.info(f"{provider} API调用成功")
+    return result['choices'][0]['message']['content']
 
-def chat_with_document(document_content: str, user_query: str, provider: str = 'deepseek') -> Dict[str, Any]:
+def _call_ai_api(query: str, system_prompt: str, provider: str = 'deepseek') -> Tuple[Optional[str], str]:
     """
-    基于单个文档内容回答用户问题
+    调用AI API生成回答
+    由LLM路由决定实际使用的提供商：首选提供商不可用时改用其他已配置的提供商，开启对冲时响应过慢会发出对冲请求
     
     Args:
-        document_content: 文档内容
-        user_query: 用户问题
-        provider: 使用的AI提供商，默认为deepseek
+        query: 用户查询
+        system_prompt: 系统提示
+        provider: 首选的AI提供商
         
     Returns:
-        包含回答的字典
+        (AI生成的回答, 实际回答的提供商)，所有提供商都失败时回答为None，由调用方使用后备方案
     """
-    logger.info(f"使用{provider}基于单个文档进行问答，问题: {user_query}")
-    
-    # 构建系统提示
-    system_prompt = f"""你是一个助手。请基于以下文档内容回答用户的问题。如果文档中没有相关信息，请说'文档中没有找到相关信息'。
+    providers = configured_providers(provider, SUPPORTED_PROVIDERS)
+    try:
+        answered_by, answer = llm_router.call(provider, lambda p: _request_ai_api(p, query, system_prompt), providers)
+        return answer, answered_by
+    except CircuitOpenError as e:
+        logger.warning(f"{str(e)}，将使用后备方案")
+    except LLMGatewayError as e:
+        logger.error(f"调用{provider} API失败，将使用后备方案: {str(e)}")
+    except Exception as e:
+        logger.exception(f"调用{provider} API时出错，将使用后备方案: {str(e)}")
+    return None, provider
+
+def _document_system_prompt(document_content: str) -> str:
+    """基于单个文档问答的系统提示"""
+    return f"""你是一个助手。请基于以下文档内容回答用户的问题。如果文档中没有相关信息，请说'文档中没有找到相关信息'。
 
 文档内容：
 {document_content}
@@ -196,46 +123,37 @@ def chat_with_document(document_content: str, user_query: str, provider: str = '
 5. 注意事项或最佳实践
 
 回答应该具有教学性质，帮助用户深入理解相关内容。"""
+
+def _document_fallback_answer(document_content: str, user_query: str) -> str:
+    """AI API不可用时，用关键词匹配文档段落生成的后备回答"""
+    keywords = user_query.lower().split()
+    relevant_sentences = []
     
-    # 尝试调用真实的AI API
-    ai_answer = _call_ai_api(user_query, system_prompt, provider)
+    # 将文档分成段落
+    paragraphs = document_content.split('\n\n')
     
-    if ai_answer:
-        # 使用AI生成的回答
-        answer = ai_answer
-        provider_name = provider
-    else:
-        # 如果API调用失败，使用简单的关键词匹配作为后备
-        logger.warning(f"AI API调用失败，使用后备方案")
-        
-        keywords = user_query.lower().split()
-        relevant_sentences = []
-        
-        # 将文档分成段落
-        paragraphs = document_content.split('\n\n')
-        
-        # 在段落中查找包含关键词的内容
-        for paragraph in paragraphs:
-            paragraph_lower = paragraph.lower()
-            if any(keyword in paragraph_lower for keyword in keywords):
-                relevant_sentences.append(paragraph)
+    # 在段落中查找包含关键词的内容
+    for paragraph in paragraphs:
+        paragraph_lower = paragraph.lower()
+        if any(keyword in paragraph_lower for keyword in keywords):
+            relevant_sentences.append(paragraph)
+    
+    # 如果找到相关内容，生成回答
+    if relevant_sentences:
+        answer = f"根据文档内容，关于\"{user_query}\"的信息如下：\n\n"
         
-        # 如果找到相关内容，生成回答
-        if relevant_sentences:
-            answer = f"根据文档内容，关于\"{user_query}\"的信息如下：\n\n"
+        # 添加找到的相关内容
+        for i, sentence in enumerate(relevant_sentences[:3]):  # 最多使用3个相关段落
+            answer += f"{sentence}\n\n"
             
-            # 添加找到的相关内容
-            for i, sentence in enumerate(relevant_sentences[:3]):  # 最多使用3个相关段落
-                answer += f"{sentence}\n\n"
-                
-            answer += "\n### 深入学习建议\n\n"
-            answer += "1. **仔细研读**：建议您详细阅读上述内容，理解每个要点\n"
-            answer += "2. **实际操作**：尝试按照文档中的方法进行实践\n"
-            answer += "3. **扩展阅读**：查找相关的补充资料和最新资讯\n"
-            answer += "4. **记录总结**：将学到的知识整理成自己的笔记\n\n"
-            answer += "如果您需要更详细的解释或有其他相关问题，请继续提问。"
-        else:
-            answer = f"""在提供的文档中没有找到与"{user_query}"直接相关的信息。
+        answer += "\n### 深入学习建议\n\n"
+        answer += "1. **仔细研读**：建议您详细阅读上述内容，理解每个要点\n"
+        answer += "2. **实际操作**：尝试按照文档中的方法进行实践\n"
+        answer += "3. **扩展阅读**：查找相关的补充资料和最新资讯\n"
+        answer += "4. **记录总结**：将学到的知识整理成自己的笔记\n\n"
+        answer += "如果您需要更详细的解释或有其他相关问题，请继续提问。"
+    else:
+        answer = f"""在提供的文档中没有找到与"{user_query}"直接相关的信息。
 
 ### 建议您可以尝试：
 
@@ -255,101 +173,20 @@ def chat_with_document(document_content: str, user_query: str, provider: str = '
 - **问题导向**：带着具体问题去阅读文档
 
 如果您能提供更具体的问题或指出文档中您感兴趣的部分，我可以为您提供更有针对性的帮助。"""
-        
-        provider_name = f"fallback_{provider}"
-    
-    return {
-        "success": True,
-        "answer": answer,
-        "provider": provider_name
-    }
-
-def chat_with_knowledge_base(user_query: str, doc_id: Optional[str] = None, provider: str = 'deepseek') -> Dict[str, Any]:
-    """
-    基于知识库回答用户问题
     
-    Args:
-        user_query: 用户问题
-        doc_id: 文档ID，如果提供则只在该文档中搜索
-        provider: 使用的AI提供商，默认为deepseek
-        
-    Returns:
-        包含回答的字典
-    """
-    logger.info(f"使用{provider}基于知识库进行问答，问题: {user_query}，文档ID: {doc_id}")
+    return answer
+
+def _knowledge_base_system_prompt(documents: List[Dict]) -> str:
+    """基于知识库文档问答的系统提示"""
+    # 构建上下文
+    context_parts = []
+    for doc in documents:
+        context_parts.append(f"标题: {doc['title']}\n内容: {doc['content']}")
     
-    # 如果指定了文档ID，则只在该文档中搜索
-    if doc_id:
-        document = knowledge_base.get_document(doc_id)
-        if not document:
-            return {
-                "success": False,
-                "message": f"文档ID {doc_id} 不存在于知识库中",
-                "provider": f"mock_{provider}"
-            }
-        
-        # 使用单个文档内容回答问题
-        return chat_with_document(document['content'], user_query, provider)
-    
-    # 否则，在整个知识库中搜索
-    # 改进的关键词匹配
-    query_lower = user_query.lower()
-    keywords = user_query.lower().split()
-    relevant_documents = []
-    
-    # 在所有文档中搜索
-    for doc_id, doc in knowledge_base.get_all_documents().items():
-        doc_content = doc['content'].lower()
-        doc_title = doc['title'].lower()
-        
-        # 计算关键词匹配度
-        match_score = 0
-        
-        # 检查完整查询是否在文档中
-        if query_lower in doc_title:
-            match_score += 5
-        if query_lower in doc_content:
-            match_score += 3
-            
-        # 检查单个关键词
-        for keyword in keywords:
-            if len(keyword) > 1:  # 忽略单字符关键词
-                if keyword in doc_title:
-                    match_score += 2  # 标题匹配权重更高
-                if keyword in doc_content:
-                    match_score += 1
-        
-        # 特殊处理一些技术术语
-        tech_terms = ['rag', 'retrieval', 'augmented', 'generation', 'opencv', 'python', 'java', 'docker']
-        for term in tech_terms:
-            if term in query_lower and term in doc_content:
-                match_score += 3
-        
-        if match_score > 0:
-            relevant_documents.append({
-                'id': doc_id,
-                'title': doc['title'],
-                'content': doc['content'],
-                'match_score': match_score
-            })
+    context = "\n\n---\n\n".join(context_parts)
     
-    # 按匹配度排序
-    relevant_documents.sort(key=lambda x: x['match_score'], reverse=True)
-    
-    # 如果找到相关文档，生成回答
-    if relevant_documents:
-        # 最多使用前3个最相关的文档
-        top_documents = relevant_documents[:3]
-        
-        # 构建上下文
-        context_parts = []
-        for doc in top_documents:
-            context_parts.append(f"标题: {doc['title']}\n内容: {doc['content']}")
-        
-        context = "\n\n---\n\n".join(context_parts)
-        
-        # 构建系统提示
-        system_prompt = f"""你是一个知识库助手。请基于以下知识库内容回答用户的问题。如果知识库中没有相关信息，请说'知识库中没有找到相关信息'。
+    # 构建系统提示
+    return f"""你是一个知识库助手。请基于以下知识库内容回答用户的问题。如果知识库中没有相关信息，请说'知识库中没有找到相关信息'。
 
 知识库内容：
 {context}
@@ -362,57 +199,52 @@ def chat_with_knowledge_base(user_query: str, doc_id: Optional[str] = None, prov
 5. 注意事项或最佳实践
 
 回答应该具有教学性质，帮助用户深入理解相关内容。直接回答问题，不需要引用具体的文档编号。"""
+
+def _knowledge_base_fallback_answer(user_query: str, documents: List[Dict]) -> str:
+    """AI API不可用时，从知识库文档中摘取相关段落生成的后备回答"""
+    query_lower = user_query.lower()
+    keywords = user_query.lower().split()
+    
+    answer = f"根据知识库内容，关于\"{user_query}\"的信息如下：\n\n"
+    
+    # 从每个文档中提取相关段落
+    for doc in documents:
+        # 将文档分成段落
+        paragraphs = doc['content'].split('\n\n')
         
-        # 尝试调用真实的AI API
-        ai_answer = _call_ai_api(user_query, system_prompt, provider)
+        # 在段落中查找包含关键词的内容
+        relevant_paragraphs = []
+        for paragraph in paragraphs:
+            paragraph_lower = paragraph.lower()
+            # 检查完整查询或关键词
+            if (query_lower in paragraph_lower or 
+                any(keyword in paragraph_lower for keyword in keywords if len(keyword) > 1)):
+                relevant_paragraphs.append(paragraph)
         
-        if ai_answer:
-            # 使用AI生成的回答
-            answer = ai_answer
-            provider_name = provider
-        else:
-            # 如果API调用失败，使用后备方案
-            logger.warning(f"AI API调用失败，使用后备方案")
-            
-            answer = f"根据知识库内容，关于\"{user_query}\"的信息如下：\n\n"
-            
-            # 从每个文档中提取相关段落
-            for doc in top_documents:
-                # 将文档分成段落
-                paragraphs = doc['content'].split('\n\n')
-                
-                # 在段落中查找包含关键词的内容
-                relevant_paragraphs = []
-                for paragraph in paragraphs:
-                    paragraph_lower = paragraph.lower()
-                    # 检查完整查询或关键词
-                    if (query_lower in paragraph_lower or 
-                        any(keyword in paragraph_lower for keyword in keywords if len(keyword) > 1)):
-                        relevant_paragraphs.append(paragraph)
-                
-                # 如果没有找到相关段落，使用文档的前几个段落
-                if not relevant_paragraphs:
-                    relevant_paragraphs = paragraphs[:2]
-                
-                # 最多使用每个文档中的2个最相关段落
-                if relevant_paragraphs:
-                    answer += f"### 来自《{doc['title']}》的内容：\n\n"
-                    for paragraph in relevant_paragraphs[:2]:
-                        if paragraph.strip():  # 确保段落不为空
-                            answer += f"{paragraph}\n\n"
-            
-            # 添加一些通用的结束语
-            answer += "\n### 学习建议\n\n"
-            answer += "1. **深入理解**：建议您仔细阅读上述内容，理解核心概念\n"
-            answer += "2. **实践应用**：尝试将理论知识应用到实际项目中\n"
-            answer += "3. **持续学习**：关注相关技术的最新发展和最佳实践\n"
-            answer += "4. **交流讨论**：与同事或社区成员分享经验和心得\n\n"
-            answer += "如果您需要更详细的解释或有其他相关问题，请随时提问。"
-            provider_name = f"fallback_{provider}"
-    else:
-        # 没有找到相关文档，提供通用的学习建议
-        if any(keyword in user_query.lower() for keyword in ['java', 'python', 'javascript', '编程', '学习']):
-            answer = f"""关于"{user_query}"，虽然知识库中没有找到直接相关的信息，但我可以为您提供一些通用的学习建议：
+        # 如果没有找到相关段落，使用文档的前几个段落
+        if not relevant_paragraphs:
+            relevant_paragraphs = paragraphs[:2]
+        
+        # 最多使用每个文档中的2个最相关段落
+        if relevant_paragraphs:
+            answer += f"### 来自《{doc['title']}》的内容：\n\n"
+            for paragraph in relevant_paragraphs[:2]:
+                if paragraph.strip():  # 确保段落不为空
+                    answer += f"{paragraph}\n\n"
+    
+    # 添加一些通用的结束语
+    answer += "\n### 学习建议\n\n"
+    answer += "1. **深入理解**：建议您仔细阅读上述内容，理解核心概念\n"
+    answer += "2. **实践应用**：尝试将理论知识应用到实际项目中\n"
+    answer += "3. **持续学习**：关注相关技术的最新发展和最佳实践\n"
+    answer += "4. **交流讨论**：与同事或社区成员分享经验和心得\n\n"
+    answer += "如果您需要更详细的解释或有其他相关问题，请随时提问。"
+    return answer
+
+def _no_documents_answer(user_query: str) -> str:
+    """知识库中没有相关文档时的通用回答"""
+    if any(keyword in user_query.lower() for keyword in ['java', 'python', 'javascript', '编程', '学习']):
+        answer = f"""关于"{user_query}"，虽然知识库中没有找到直接相关的信息，但我可以为您提供一些通用的学习建议：
 
 ### 编程学习通用指南
 
@@ -441,8 +273,8 @@ def chat_with_knowledge_base(user_query: str, doc_id: Optional[str] = None, prov
 - **持续学习**：关注技术发展趋势，不断更新知识
 
 建议您可以尝试更具体的问题，或者查看知识库中的其他技术文档。"""
-        else:
-            answer = f"""在知识库中没有找到与"{user_query}"直接相关的信息。
+    else:
+        answer = f"""在知识库中没有找到与"{user_query}"直接相关的信息。
 
 ### 建议您可以尝试：
 
@@ -467,10 +299,201 @@ def chat_with_knowledge_base(user_query: str, doc_id: Optional[str] = None, prov
 - **在线教程**：寻找相关的视频教程或博客文章
 
 如果您有其他问题或需要特定技术的帮助，请随时提问。我会尽力为您提供有用的信息和建议。"""
+    
+    return answer
+
+def chat_with_document(document_content: str, user_query: str, provider: str = 'deepseek') -> Dict[str, Any]:
+    """
+    基于单个文档内容回答用户问题
+    
+    Args:
+        document_content: 文档内容
+        user_query: 用户问题
+        provider: 使用的AI提供商，默认为deepseek
+        
+    Returns:
+        包含回答的字典
+    """
+    logger.info(f"使用{provider}基于单个文档进行问答，问题: {user_query}")
+    
+    # 构建系统提示
+    system_prompt = _document_system_prompt(document_content)
+    
+    # 尝试调用真实的AI API
+    ai_answer, answered_by = _call_ai_api(user_query, system_prompt, provider)
+    
+    if ai_answer:
+        # 使用AI生成的回答
+        answer = ai_answer
+        provider_name = answered_by
+    else:
+        # 如果API调用失败，使用简单的关键词匹配作为后备
+        logger.warning(f"AI API调用失败，使用后备方案")
+        answer = _document_fallback_answer(document_content, user_query)
+        provider_name = f"fallback_{provider}"
+    
+    return {
+        "success": True,
+        "answer": answer,
+        "provider": provider_name
+    }
+
+def chat_with_knowledge_base(user_query: str, doc_id: Optional[str] = None, provider: str = 'deepseek') -> Dict[str, Any]:
+    """
+    基于知识库回答用户问题
+    
+    Args:
+        user_query: 用户问题
+        doc_id: 文档ID，如果提供则只在该文档中搜索
+        provider: 使用的AI提供商，默认为deepseek
+        
+    Returns:
+        包含回答的字典
+    """
+    logger.info(f"使用{provider}基于知识库进行问答，问题: {user_query}，文档ID: {doc_id}")
+    
+    # 如果指定了文档ID，则只在该文档中搜索
+    if doc_id:
+        document = knowledge_base.get_document(doc_id)
+        if not document:
+            return {
+                "success": False,
+                "message": f"文档ID {doc_id} 不存在于知识库中",
+                "provider": f"mock_{provider}"
+            }
+        
+        # 使用单个文档内容回答问题
+        return chat_with_document(document['content'], user_query, provider)
+    
+    # 否则，在整个知识库中搜索
+    # 使用BM25从倒排索引中取得分最高的文档
+    relevant_documents = knowledge_base.rank_documents(user_query, top_k=3)
+    
+    # 如果找到相关文档，生成回答
+    if relevant_documents:
+        # 最多使用前3个最相关的文档
+        top_documents = relevant_documents
+        
+        # 构建系统提示
+        system_prompt = _knowledge_base_system_prompt(top_documents)
+        
+        # 尝试调用真实的AI API
+        ai_answer, answered_by = _call_ai_api(user_query, system_prompt, provider)
+        
+        if ai_answer:
+            # 使用AI生成的回答
+            answer = ai_answer
+            provider_name = answered_by
+        else:
+            # 如果API调用失败，使用后备方案
+            logger.warning(f"AI API调用失败，使用后备方案")
+            
+            answer = _knowledge_base_fallback_answer(user_query, top_documents)
+            provider_name = f"fallback_{provider}"
+    else:
+        # 没有找到相关文档，提供通用的学习建议
+        answer = _no_documents_answer(user_query)
         provider_name = f"fallback_{provider}"
     
     return {
         "success": True,
         "answer": answer,
         "provider": provider_name
-    }
\ No newline at end of file
+    }
+
+def _stream_answer(user_query: str, system_prompt: str, provider: str,
+                   fallback: Optional[Callable[[], str]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    流式生成回答
+    模型输出的每一段文本作为delta事件转发；开始输出前调用失败时，以后备回答代替（没有后备方案时返回error事件）
+    
+    Args:
+        user_query: 用户问题
+        system_prompt: 系统提示
+        provider: AI提供商
+        fallback: 生成后备回答的函数
+        
+    Yields:
+        (事件名, 数据)：delta事件包含content，done事件包含provider，error事件包含message
+    """
+    started = False
+    try:
+        for content in stream_chat_completion(user_query, system_prompt, provider):
+            started = True
+            yield 'delta', {'content': content}
+    except LLMStreamError as e:
+        if started:
+            # 已经输出了部分回答，不能再换成后备回答
+            yield 'error', {'message': str(e)}
+            return
+        logger.warning(f"流式调用AI API失败: {str(e)}")
+    
+    if started:
+        yield 'done', {'provider': provider}
+    elif fallback is not None:
+        logger.warning(f"AI API调用失败，使用后备方案")
+        yield 'delta', {'content': fallback()}
+        yield 'done', {'provider': f"fallback_{provider}"}
+    else:
+        yield 'error', {'message': f'{provider} API调用失败，请稍后重试'}
+
+def stream_chat_with_document(document_content: str, user_query: str, provider: str = 'deepseek') -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    基于单个文档内容流式回答用户问题
+    
+    Args:
+        document_content: 文档内容
+        user_query: 用户问题
+        provider: 使用的AI提供商，默认为deepseek
+        
+    Yields:
+        (事件名, 数据)，见_stream_answer
+    """
+    logger.info(f"使用{provider}基于单个文档进行流式问答，问题: {user_query}")
+    system_prompt = _document_system_prompt(document_content)
+    yield from _stream_answer(user_query, system_prompt, provider,
+                              lambda: _document_fallback_answer(document_content, user_query))
+
+def stream_chat_with_knowledge_base(user_query: str, doc_id: Optional[str] = None, provider: str = 'deepseek') -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    基于知识库流式回答用户问题
+    
+    Args:
+        user_query: 用户问题
+        doc_id: 文档ID，如果提供则只在该文档中搜索
+        provider: 使用的AI提供商，默认为deepseek
+        
+    Yields:
+        (事件名, 数据)，见_stream_answer
+    """
+    logger.info(f"使用{provider}基于知识库进行流式问答，问题: {user_query}，文档ID: {doc_id}")
+    
+    if doc_id:
+        document = knowledge_base.get_document(doc_id)
+        if not document:
+            yield 'error', {'message': f"文档ID {doc_id} 不存在于知识库中"}
+            return
+        yield from stream_chat_with_document(document['content'], user_query, provider)
+        return
+    
+    relevant_documents = knowledge_base.rank_documents(user_query, top_k=3)
+    if relevant_documents:
+        system_prompt = _knowledge_base_system_prompt(relevant_documents)
+        yield from _stream_answer(user_query, system_prompt, provider,
+                                  lambda: _knowledge_base_fallback_answer(user_query, relevant_documents))
+    else:
+        yield 'delta', {'content': _no_documents_answer(user_query)}
+        yield 'done', {'provider': f"fallback_{provider}"}
+
+def stream_pure_ai_chat(user_query: str, provider: str = 'deepseek') -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    不使用知识库，流式回答用户问题
+    
+    Args:
+        user_query: 用户问题
+        provider: 使用的AI提供商，默认为deepseek
+        
+    Yields:
+        (事件名, 数据)，见_stream_answer；调用失败时返回error事件
+    """
+    yield from _stream_answer(user_query, PURE_AI_SYSTEM_PROMPT, provider)
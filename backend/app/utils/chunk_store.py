@@ -0,0 +1,130 @@
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+class ChunkStore:
+    """
+    文档块位置存储
+    文档块记录按行号连续存放，行号即FAISS向量ID，查找为O(1)；
+    同一文档的所有分块占用一段连续行号，通过 parent_id -> 行号区间 索引定位
+    """
+
+    def __init__(self):
+        """初始化文档块存储"""
+        self.records: List[Optional[Dict[str, Any]]] = []  # 行号 -> 文档块记录，已删除的行为None
+        self.doc_rows: Dict[str, Tuple[int, int]] = {}  # 原始文档ID -> [start, end) 行号区间
+        self.tombstones = 0  # 已删除但尚未压缩的行数
+
+    def __len__(self) -> int:
+        """有效文档块数量"""
+        return len(self.records) - self.tombstones
+
+    @property
+    def total_rows(self) -> int:
+        """已分配的行数（包括已删除的行）"""
+        return len(self.records)
+
+    def get(self, row: int) -> Optional[Dict[str, Any]]:
+        """
+        按行号获取文档块记录
+
+        Args:
+            row: 行号（即FAISS向量ID）
+
+        Returns:
+            文档块记录，行号无效或已删除时返回None
+        """
+        if 0 <= row < len(self.records):
+            return self.records[row]
+        return None
+
+    def get_rows(self, doc_id: str) -> Optional[range]:
+        """获取文档占用的行号区间"""
+        span = self.doc_rows.get(doc_id)
+        return range(*span) if span else None
+
+    def append(self, doc_id: str, records: List[Dict[str, Any]]) -> range:
+        """
+        追加一个文档的所有分块，分配连续的行号
+        调用方需先调用remove移除该文档的旧分块
+
+        Args:
+            doc_id: 原始文档ID
+            records: 文档块记录列表
+
+        Returns:
+            新分配的行号区间
+        """
+        start = len(self.records)
+        self.records.extend(records)
+        end = len(self.records)
+        self.doc_rows[doc_id] = (start, end)
+        return range(start, end)
+
+    def remove(self, doc_id: str) -> Optional[range]:
+        """
+        删除一个文档的所有分块（标记为已删除，行号不复用）
+
+        Args:
+            doc_id: 原始文档ID
+
+        Returns:
+            被删除的行号区间，文档不存在时返回None
+        """
+        span = self.doc_rows.pop(doc_id, None)
+        if span is None:
+            return None
+
+        start, end = span
+        for row in range(start, end):
+            self.records[row] = None
+        self.tombstones += end - start
+        return range(start, end)
+
+    def needs_compaction(self, min_rows: int = 1024, ratio: float = 0.5) -> bool:
+        """已删除行过多时需要压缩"""
+        return self.tombstones >= min_rows and self.tombstones > len(self.records) * ratio
+
+    def compact(self) -> List[int]:
+        """
+        压缩存储，移除已删除的行并重新分配连续行号
+
+        Returns:
+            旧行号到新行号的映射列表，已删除的行映射为-1
+        """
+        mapping = [-1] * len(self.records)
+        records = []
+        doc_rows = {}
+
+        # 按原有行号顺序遍历文档，保证同一文档的分块仍然连续
+        for doc_id, (start, end) in sorted(self.doc_rows.items(), key=lambda item: item[1][0]):
+            new_start = len(records)
+            for row in range(start, end):
+                mapping[row] = len(records)
+                records.append(self.records[row])
+            doc_rows[doc_id] = (new_start, len(records))
+
+        logger.info(f"已压缩文档块存储: {len(self.records)} -> {len(records)} 行")
+        self.records = records
+        self.doc_rows = doc_rows
+        self.tombstones = 0
+        return mapping
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可JSON序列化的字典，用于持久化"""
+        return {
+            'records': self.records,
+            'doc_rows': {doc_id: list(span) for doc_id, span in self.doc_rows.items()},
+            'tombstones': self.tombstones
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ChunkStore':
+        """从持久化的字典恢复"""
+        store = cls()
+        store.records = data.get('records', [])
+        store.doc_rows = {doc_id: tuple(span) for doc_id, span in data.get('doc_rows', {}).items()}
+        store.tombstones = data.get('tombstones', 0)
+        return store
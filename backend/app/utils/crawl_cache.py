@@ -0,0 +1,312 @@
+"""
+网页爬取缓存
+下载的网页保存在本地SQLite文件（WAL模式）中，多个worker进程共享：按Cache-Control/Expires判断是否仍然新鲜，
+新鲜时不发请求；过期后带上If-None-Match/If-Modified-Since重新请求，服务器返回304时直接使用缓存的HTML，
+不再下载和检测编码。
+提取的正文和总结结果按网页内容的哈希保存，页面没有变化时跳过解析和大语言模型总结
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 缓存配置
+CRAWL_CACHE_ENABLED = os.environ.get('CRAWL_CACHE_ENABLED', 'true').lower() == 'true'
+CRAWL_CACHE_PATH = os.environ.get(
+    'CRAWL_CACHE_PATH', os.path.join(os.path.dirname(__file__), '..', 'cache', 'crawl_cache.db')
+)
+CRAWL_CACHE_SIZE = int(os.environ.get('CRAWL_CACHE_SIZE', '2000'))  # 每张表的最大条目数
+
+# 记录最近访问时间的最小间隔（秒），避免每次命中都写数据库
+TOUCH_INTERVAL = 60
+
+# 保存提取结果和总结结果的表
+RESULT_TABLES = ('extracted', 'summaries')
+
+_CACHE_DIRECTIVE = re.compile(r'([\w-]+)\s*(?:=\s*"?([^",]*)"?)?')
+
+
+def content_hash(text: str) -> str:
+    """网页内容的哈希"""
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """解析Cache-Control头，返回 {指令(小写): 参数或None}"""
+    directives = {}
+    for match in _CACHE_DIRECTIVE.finditer(value or ''):
+        directives.setdefault(match.group(1).lower(), match.group(2))
+    return directives
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def freshness_lifetime(headers: Mapping[str, str], now: float) -> Optional[float]:
+    """
+    按响应头计算缓存的新鲜时间
+
+    Args:
+        headers: 响应头（键不区分大小写）
+        now: 当前时间戳
+
+    Returns:
+        新鲜时间（秒），0表示每次使用前都要重新验证；None表示不允许缓存（no-store）
+    """
+    directives = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0.0
+    # 缓存由多个worker共享，s-maxage优先
+    for name in ('s-maxage', 'max-age'):
+        if directives.get(name) is not None:
+            try:
+                return max(0.0, float(directives[name]))
+            except ValueError:
+                return 0.0
+    expires = _http_date(headers.get('Expires'))
+    if expires is not None:
+        date = _http_date(headers.get('Date')) or now
+        return max(0.0, expires - date)
+    return 0.0
+
+
+@dataclass
+class CachedPage:
+    """缓存的网页"""
+
+    url: str
+    text: str
+    encoding: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh_until: float
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return (now if now is not None else time.time()) < self.fresh_until
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """重新验证时附加的请求头"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class CrawlCache:
+    """
+    基于SQLite的跨进程爬取缓存
+    每个线程使用独立的数据库连接；数据库出错时记录日志并视为未命中，不影响爬取本身
+    """
+
+    def __init__(self, path: str, max_entries: int = 2000):
+        """
+        初始化爬取缓存
+
+        Args:
+            path: SQLite数据库文件路径
+            max_entries: 每张表的最大条目数，超出后淘汰最久未访问的条目
+        """
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.stats_counts = {'fresh': 0, 'revalidated': 0, 'downloaded': 0, 'extracted_hits': 0,
+                             'summary_hits': 0, 'writes': 0, 'errors': 0}
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """当前线程的数据库连接，首次使用时创建数据库和表"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url TEXT PRIMARY KEY, text TEXT NOT NULL, encoding TEXT, etag TEXT, last_modified TEXT, "
+                "fresh_until REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_accessed_at ON pages (accessed_at)")
+            for table in RESULT_TABLES:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_accessed_at ON {table} (accessed_at)")
+            self._local.conn = conn
+        return conn
+
+    def count(self, name: str) -> None:
+        """统计计数（fresh、revalidated、downloaded等），只统计当前进程"""
+        with self._stats_lock:
+            self.stats_counts[name] += 1
+
+    def _wrote(self) -> None:
+        self.count('writes')
+        # 每写入max_entries/10次检查一次容量，超出上限的部分一次淘汰
+        if self.stats_counts['writes'] % max(1, self.max_entries // 10) == 0:
+            self.prune()
+
+    def get_page(self, url: str) -> Optional[CachedPage]:
+        """读取缓存的网页（包括已过期、需要重新验证的），不存在时返回None"""
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT text, encoding, etag, last_modified, fresh_until, accessed_at FROM pages WHERE url = ?",
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[5] >= TOUCH_INTERVAL:
+                conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (now, url))
+        except sqlite3.Error as e:
+            logger.warning(f"读取爬取缓存失败: {str(e)}")
+            self.count('errors')
+            return None
+        return CachedPage(url, row[0], row[1], row[2], row[3], row[4])
+
+    def store_page(self, url: str, text: str, encoding: Optional[str], headers: Mapping[str, str]) -> None:
+        """
+        保存下载的网页；响应禁止缓存，或既没有新鲜时间也没有验证器（ETag、Last-Modified）时不保存
+
+        Args:
+            url: 网页地址
+            text: 解码后的HTML
+            encoding: 解码使用的编码
+            headers: 响应头
+        """
+        now = time.time()
+        lifetime = freshness_lifetime(headers, now)
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        try:
+            if lifetime is None or (lifetime <= 0 and not etag and not last_modified):
+                # 之前缓存的版本也不再可用
+                self._connect().execute("DELETE FROM pages WHERE url = ?", (url,))
+                return
+            self._connect().execute(
+                "INSERT OR REPLACE INTO pages (url, text, encoding, etag, last_modified, fresh_until, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, text, encoding, etag, last_modified, now + lifetime, now)
+            )
+            self._wrote()
+        except sqlite3.Error as e:
+            logger.warning(f"写入爬取缓存失败: {str(e)}")
+            self.count('errors')
+
+    def revalidated(self, page: CachedPage, headers: Mapping[str, str]) -> None:
+        """服务器返回304：按新的响应头更新新鲜时间和验证器"""
+        now = time.time()
+        lifetime = freshness_lifetime(headers, now)
+        try:
+            if lifetime is None:
+                self._connect().execute("DELETE FROM pages WHERE url = ?", (page.url,))
+                return
+            page.etag = headers.get('ETag') or page.etag
+            page.last_modified = headers.get('Last-Modified') or page.last_modified
+            page.fresh_until = now + lifetime
+            self._connect().execute(
+                "UPDATE pages SET etag = ?, last_modified = ?, fresh_until = ?, accessed_at = ? WHERE url = ?",
+                (page.etag, page.last_modified, page.fresh_until, now, page.url)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"更新爬取缓存失败: {str(e)}")
+            self.count('errors')
+
+    def get_result(self, table: str, key: str) -> Optional[Dict[str, Any]]:
+        """
+        读取按内容哈希保存的结果
+
+        Args:
+            table: 'extracted'（提取的正文）或 'summaries'（总结结果）
+            key: 缓存键，包含网页内容的哈希
+
+        Returns:
+            缓存的结果，不存在时返回None
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(f"SELECT value, accessed_at FROM {table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] >= TOUCH_INTERVAL:
+                conn.execute(f"UPDATE {table} SET accessed_at = ? WHERE key = ?", (now, key))
+            value = json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"读取爬取缓存失败: {str(e)}")
+            self.count('errors')
+            return None
+        self.count('extracted_hits' if table == 'extracted' else 'summary_hits')
+        return value
+
+    def set_result(self, table: str, key: str, value: Dict[str, Any]) -> None:
+        """保存结果（可JSON序列化的字典）"""
+        try:
+            self._connect().execute(
+                f"INSERT OR REPLACE INTO {table} (key, value, accessed_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self._wrote()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"写入爬取缓存失败: {str(e)}")
+            self.count('errors')
+
+    def prune(self) -> int:
+        """条目数超过上限时淘汰每张表中最久未访问的条目，返回删除的条目数"""
+        conn = self._connect()
+        deleted = 0
+        for table, key in (('pages', 'url'),) + tuple((table, 'key') for table in RESULT_TABLES):
+            excess = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - self.max_entries
+            if excess > 0:
+                deleted += conn.execute(
+                    f"DELETE FROM {table} WHERE {key} IN (SELECT {key} FROM {table} ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                ).rowcount
+        return deleted
+
+    def clear(self) -> None:
+        """清空缓存"""
+        try:
+            conn = self._connect()
+            for table in ('pages',) + RESULT_TABLES:
+                conn.execute(f"DELETE FROM {table}")
+        except sqlite3.Error as e:
+            logger.warning(f"清空爬取缓存失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计（命中次数等只统计当前进程）"""
+        sizes = {}
+        try:
+            conn = self._connect()
+            for table in ('pages',) + RESULT_TABLES:
+                sizes[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        except sqlite3.Error:
+            sizes = None
+        return dict(self.stats_counts, path=self.path, sizes=sizes, max_entries=self.max_entries)
+
+
+# 创建全局实例（数据库在首次读写时才创建），关闭时为None
+crawl_cache = CrawlCache(CRAWL_CACHE_PATH, max_entries=CRAWL_CACHE_SIZE) if CRAWL_CACHE_ENABLED else None
@@ -0,0 +1,165 @@
+"""
+网页爬取与总结任务
+把"下载网页 → 提取正文 → 调用大语言模型总结"放到持久化任务队列中执行，
+提交接口立即返回任务ID，前端轮询任务状态，不再在一个HTTP请求里等待几分钟
+"""
+
+import os
+import hashlib
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+from .crawler import fetch_url, fetch_and_extract, extract_main_content_cached
+from .crawl_cache import crawl_cache, content_hash
+from .llm_api import llm_service
+from .job_queue import JobQueue
+from .crawl_pipeline import CrawlPipeline, HostLimiter, RateLimiter
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 任务队列配置
+CRAWL_JOB_DB_PATH = os.environ.get(
+    'CRAWL_JOB_DB_PATH', os.path.join(os.path.dirname(__file__), '..', 'cache', 'crawl_jobs.db')
+)
+CRAWL_JOB_WORKERS = int(os.environ.get('CRAWL_JOB_WORKERS', '2'))
+CRAWL_JOB_LEASE = float(os.environ.get('CRAWL_JOB_LEASE', '600'))
+CRAWL_JOB_DEDUP_TTL = float(os.environ.get('CRAWL_JOB_DEDUP_TTL', '3600'))
+
+CRAWL_JOB_KIND = 'crawl_summarize'
+CRAWL_BATCH_MAX_URLS = int(os.environ.get('CRAWL_BATCH_MAX_URLS', '500'))
+
+
+class CrawlError(Exception):
+    """爬取或总结失败，消息可以直接返回给用户"""
+
+
+def normalize_url(url: str) -> str:
+    """规范化URL用于去重：去掉首尾空白和片段，协议和域名转为小写"""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.query, ''))
+
+
+def crawl_dedup_key(url: str, provider: str, custom_prompt: Optional[str]) -> str:
+    """相同URL、提供商和提示词的提交共用一个任务"""
+    prompt_hash = hashlib.md5((custom_prompt or '').encode('utf-8')).hexdigest()
+    return f"{normalize_url(url)}|{provider}|{prompt_hash}"
+
+
+def crawl_and_summarize(url: str, provider: str = 'deepseek', custom_prompt: Optional[str] = None,
+                        progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    爬取网页并总结
+
+    Args:
+        url: 网页地址
+        provider: AI提供商
+        custom_prompt: 自定义提示词
+        progress: 进入每个阶段（fetching：下载网页，同时提取正文；summarizing）时调用
+
+    Returns:
+        总结结果，字段与 /tech_summaries/crawl 接口返回的data相同
+
+    Raises:
+        CrawlError: 下载、提取或总结失败
+    """
+    report = progress or (lambda stage: None)
+
+    report('fetching')
+    try:
+        crawled_data = fetch_and_extract(url)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"请求错误: {e}")
+        raise CrawlError(f'请求错误: {str(e)}')
+
+    report('summarizing')
+    return summarize_page(crawled_data, url, provider, custom_prompt)
+
+
+def summarize_page(crawled_data: Dict[str, Any], url: str, provider: str = 'deepseek',
+                   custom_prompt: Optional[str] = None) -> Dict[str, Any]:
+    """
+    总结已提取的网页正文；正文、提供商和提示词都相同时直接使用缓存的总结
+
+    Args:
+        crawled_data: extract_main_content 的返回值
+        url: 网页地址
+        provider: AI提供商
+        custom_prompt: 自定义提示词
+
+    Returns:
+        总结结果，字段与 /tech_summaries/crawl 接口返回的data相同
+
+    Raises:
+        CrawlError: 总结失败
+    """
+    content = crawled_data['content']
+    original_title = crawled_data['title']
+
+    cache_key = None
+    if crawl_cache is not None:
+        cache_key = f"{content_hash(original_title + chr(0) + content)}|{crawl_dedup_key(url, provider, custom_prompt)}"
+        cached = crawl_cache.get_result('summaries', cache_key)
+        if cached is not None:
+            return dict(cached, url=url)
+
+    summary_result = llm_service.summarize_content(
+        content=content,
+        url=url,
+        provider=provider,
+        prompt=custom_prompt
+    )
+    if not summary_result['success']:
+        raise CrawlError(summary_result['message'])
+
+    summary_data = summary_result['data']
+    # 使用AI生成的标题，如果没有则使用原始标题
+    title = summary_data.get('title', '') or original_title
+
+    result = {
+        'title': title,
+        'content': summary_data['summary'],
+        'url': url,
+        'original_content': content,
+        'original_title': original_title,
+        'provider': summary_data['provider'],
+        'model': summary_data['model'],
+        'tags': summary_data.get('tags', '')
+    }
+    if cache_key is not None:
+        crawl_cache.set_result('summaries', cache_key, result)
+    return result
+
+
+def bulk_crawl_and_summarize(urls: List[str], provider: str = 'deepseek',
+                             custom_prompt: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    批量爬取并总结，每个URL完成时产出一条结果（格式见 CrawlPipeline.run），
+    data字段与 /tech_summaries/crawl 接口返回的data相同
+    """
+    pipeline = CrawlPipeline(
+        fetch=fetch_url,
+        extract=extract_main_content_cached,
+        summarize=lambda crawled_data, url: summarize_page(crawled_data, url, provider, custom_prompt),
+        host_limiter=crawl_host_limiter,
+        rate_limiter=crawl_llm_limiter
+    )
+    return pipeline.run(urls)
+
+
+def _run_crawl_job(job, params: Dict[str, Any]) -> Dict[str, Any]:
+    return crawl_and_summarize(params['url'], params.get('provider', 'deepseek'), params.get('custom_prompt'),
+                               progress=job.update)
+
+
+# 创建全局任务队列
+crawl_job_queue = JobQueue(CRAWL_JOB_DB_PATH, workers=CRAWL_JOB_WORKERS, lease=CRAWL_JOB_LEASE,
+                           dedup_ttl=CRAWL_JOB_DEDUP_TTL)
+crawl_job_queue.register(CRAWL_JOB_KIND, _run_crawl_job)
+
+# 所有批量爬取共用的域名限制和总结限速，多个批次同时执行时也不会超过限制
+crawl_host_limiter = HostLimiter()
+crawl_llm_limiter = RateLimiter()
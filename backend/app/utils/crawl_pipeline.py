@@ -0,0 +1,301 @@
+"""
+批量网页爬取流水线
+一批URL依次经过三个阶段：下载（线程池并发，限制每个域名的并发数和请求间隔）、
+提取正文（BeautifulSoup解析是CPU密集型，在进程池中并行）、总结（限制并发数和每分钟请求数）。
+每个URL完成后立即产出结果，不等待整批结束
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 流水线配置
+CRAWL_FETCH_WORKERS = int(os.environ.get('CRAWL_FETCH_WORKERS', '16'))
+CRAWL_MAX_PER_HOST = int(os.environ.get('CRAWL_MAX_PER_HOST', '2'))  # 每个域名同时下载的页面数
+CRAWL_HOST_INTERVAL = float(os.environ.get('CRAWL_HOST_INTERVAL', '0.5'))  # 同一域名两次请求之间的最小间隔（秒）
+CRAWL_EXTRACT_WORKERS = int(os.environ.get('CRAWL_EXTRACT_WORKERS', str(os.cpu_count() or 1)))  # 0表示在线程中提取
+CRAWL_LLM_WORKERS = int(os.environ.get('CRAWL_LLM_WORKERS', '4'))
+CRAWL_LLM_RPM = float(os.environ.get('CRAWL_LLM_RPM', '60'))  # 每分钟最多的总结请求数，0表示不限制
+
+
+class HostLimiter:
+    """限制每个域名的并发请求数和请求间隔，避免批量爬取时压垮同一个站点"""
+
+    def __init__(self, max_per_host: int = CRAWL_MAX_PER_HOST, min_interval: float = CRAWL_HOST_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        初始化限制器
+
+        Args:
+            max_per_host: 每个域名同时进行的请求数
+            min_interval: 同一域名两次请求开始之间的最小间隔（秒）
+            clock: 时钟函数，便于测试
+            sleep: 等待函数，便于测试
+        """
+        self.max_per_host = max(1, max_per_host)
+        self.min_interval = min_interval
+        self.clock = clock
+        self.sleep = sleep
+        self._semaphores: Dict[str, threading.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    @contextmanager
+    def slot(self, url: str):
+        """占用url所在域名的一个请求名额，必要时等待到允许的开始时间"""
+        host = self.host(url)
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.Semaphore(self.max_per_host))
+        semaphore.acquire()
+        try:
+            with self._lock:
+                now = self.clock()
+                start = max(now, self._next_start.get(host, now))
+                self._next_start[host] = start + self.min_interval
+            if start > now:
+                self.sleep(start - now)
+            yield
+        finally:
+            semaphore.release()
+
+
+class RateLimiter:
+    """令牌桶限速，按固定速率补充令牌，最多积攒burst个"""
+
+    def __init__(self, per_minute: float = CRAWL_LLM_RPM, burst: int = 1,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        初始化限速器
+
+        Args:
+            per_minute: 每分钟允许的次数，0表示不限制
+            burst: 最多积攒的令牌数
+            clock: 时钟函数，便于测试
+            sleep: 等待函数，便于测试
+        """
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """取得一个令牌，没有令牌时等待"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # 令牌可以透支：先预订，再在锁外等待到预订的令牌补满
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self.sleep(wait)
+
+
+def interleave_by_host(urls: Iterable[str]) -> List[str]:
+    """按域名轮流排列URL，避免同一域名的URL连续占满下载线程"""
+    groups: Dict[str, List[str]] = OrderedDict()
+    for url in urls:
+        groups.setdefault(HostLimiter.host(url), []).append(url)
+    ordered = []
+    columns = list(groups.values())
+    for i in range(max((len(column) for column in columns), default=0)):
+        ordered.extend(column[i] for column in columns if i < len(column))
+    return ordered
+
+
+_extract_pool: Optional[ProcessPoolExecutor] = None
+_extract_pool_lock = threading.Lock()
+
+
+def _get_extract_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """共享的提取进程池；使用spawn启动，避免在多线程的服务进程中fork"""
+    global _extract_pool
+    if workers <= 0:
+        return None
+    if _extract_pool is None:
+        with _extract_pool_lock:
+            if _extract_pool is None:
+                _extract_pool = ProcessPoolExecutor(max_workers=workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+    return _extract_pool
+
+
+def _reset_extract_pool(pool: ProcessPoolExecutor) -> None:
+    """进程池损坏（子进程被杀）后丢弃，下次使用时重新创建"""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is pool:
+            _extract_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class CrawlPipeline:
+    """
+    批量爬取流水线
+    三个阶段的函数由调用方提供：fetch(url) -> html，extract(html, url) -> 正文数据（需要可以pickle，
+    在进程池中执行时必须是模块级函数），summarize(extracted, url) -> 结果；任何阶段抛出异常时该URL失败
+    """
+
+    def __init__(self, fetch: Callable[[str], str], extract: Callable[[str, str], Any],
+                 summarize: Optional[Callable[[Any, str], Any]] = None,
+                 fetch_workers: int = CRAWL_FETCH_WORKERS, host_limiter: Optional[HostLimiter] = None,
+                 extract_workers: int = CRAWL_EXTRACT_WORKERS, llm_workers: int = CRAWL_LLM_WORKERS,
+                 rate_limiter: Optional[RateLimiter] = None):
+        """
+        初始化流水线
+
+        Args:
+            fetch: 下载函数
+            extract: 提取正文的函数
+            summarize: 总结函数，为None时跳过总结，结果为提取的正文
+            fetch_workers: 下载线程数
+            host_limiter: 域名限制器，默认按环境变量配置
+            extract_workers: 提取进程数，0表示在下载线程中直接提取
+            llm_workers: 同时进行的总结请求数
+            rate_limiter: 总结请求的限速器，默认按环境变量配置
+        """
+        self.fetch = fetch
+        self.extract = extract
+        self.summarize = summarize
+        self.fetch_workers = max(1, fetch_workers)
+        self.host_limiter = host_limiter or HostLimiter()
+        self.extract_workers = extract_workers
+        self.llm_workers = max(1, llm_workers)
+        self.rate_limiter = rate_limiter or RateLimiter()
+
+    def run(self, urls: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """
+        处理一批URL
+
+        Args:
+            urls: URL列表
+
+        Yields:
+            每个URL完成时产出 {'index', 'url', 'success', 'data', 'message', 'stage', 'elapsed'}，
+            顺序为完成顺序；index是URL在输入中的位置，失败时stage为出错的阶段。
+            提前关闭生成器会取消尚未开始的任务
+        """
+        urls = list(urls)
+        if not urls:
+            return
+        indexes: Dict[str, List[int]] = {}
+        for index, url in enumerate(urls):
+            indexes.setdefault(url, []).append(index)
+
+        results: 'queue.Queue[Dict[str, Any]]' = queue.Queue()
+        cancelled = threading.Event()
+        start = time.monotonic()
+        fetch_executor = ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix='crawl-fetch')
+        llm_executor = ThreadPoolExecutor(max_workers=self.llm_workers, thread_name_prefix='crawl-llm')
+        extract_pool = _get_extract_pool(self.extract_workers)
+
+        def finish(url: str, stage: str, data: Any = None, error: Optional[BaseException] = None) -> None:
+            if error is not None:
+                logger.warning(f"批量爬取 {url} 在{stage}阶段失败: {str(error)}")
+            results.put({
+                'url': url,
+                'success': error is None,
+                'data': data,
+                'message': str(error) if error is not None else '',
+                'stage': stage,
+                'elapsed': round(time.monotonic() - start, 3)
+            })
+
+        def summarize(url: str, extracted: Any) -> None:
+            if cancelled.is_set():
+                return
+            try:
+                self.rate_limiter.acquire()
+                data = self.summarize(extracted, url)
+            except Exception as e:
+                finish(url, 'summarizing', error=e)
+            else:
+                finish(url, 'summarizing', data)
+
+        def extracted(url: str, data: Any) -> None:
+            if self.summarize is None:
+                finish(url, 'extracting', data)
+                return
+            try:
+                llm_executor.submit(summarize, url, data)
+            except RuntimeError:
+                # 生成器已关闭，执行器不再接受任务
+                pass
+
+        def extract_locally(url: str, html: str) -> None:
+            try:
+                data = self.extract(html, url)
+            except Exception as e:
+                finish(url, 'extracting', error=e)
+                return
+            extracted(url, data)
+
+        def extract_done(url: str, html: str, future: Future) -> None:
+            try:
+                data = future.result()
+            except BrokenProcessPool:
+                # 子进程异常退出（或无法启动进程），丢弃进程池并在线程中提取
+                _reset_extract_pool(extract_pool)
+                try:
+                    fetch_executor.submit(extract_locally, url, html)
+                except RuntimeError:
+                    pass
+                return
+            except Exception as e:
+                finish(url, 'extracting', error=e)
+                return
+            extracted(url, data)
+
+        def fetch(url: str) -> None:
+            if cancelled.is_set():
+                return
+            try:
+                with self.host_limiter.slot(url):
+                    html = self.fetch(url)
+            except Exception as e:
+                finish(url, 'fetching', error=e)
+                return
+
+            if extract_pool is None:
+                extract_locally(url, html)
+                return
+            try:
+                extract_pool.submit(self.extract, html, url).add_done_callback(
+                    lambda future: extract_done(url, html, future))
+            except (BrokenProcessPool, RuntimeError):
+                extract_locally(url, html)
+
+        unique_urls = interleave_by_host(indexes)
+        try:
+            for url in unique_urls:
+                fetch_executor.submit(fetch, url)
+            for _ in range(len(unique_urls)):
+                result = results.get()
+                # 重复的URL只处理一次，结果按输入中的每个位置产出
+                for index in indexes[result['url']]:
+                    yield dict(result, index=index)
+        finally:
+            cancelled.set()
+            fetch_executor.shutdown(wait=False, cancel_futures=True)
+            llm_executor.shutdown(wait=False, cancel_futures=True)
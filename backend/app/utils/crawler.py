@@ -1,15 +1,50 @@
+import os
+import codecs
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import logging
 import re
 from urllib.parse import urlparse
+from requests.compat import chardet
+from .html_markdown import MarkdownExtractor, CONTENT_SELECTORS, LXML_AVAILABLE
+from .crawl_cache import crawl_cache, content_hash
 
-def extract_main_content(html, url):
+# 是否使用单遍转换提取正文（false时始终使用基于BeautifulSoup逐轮替换的实现）
+CRAWL_FAST_EXTRACT = os.environ.get('CRAWL_FAST_EXTRACT', 'true').lower() == 'true'
+# 提取正文使用的解析器：html.parser 或 lxml（需要安装lxml，解析更快，但格式错误的页面上补全标签的方式不同）
+CRAWL_HTML_PARSER = os.environ.get('CRAWL_HTML_PARSER', 'html.parser')
+if CRAWL_HTML_PARSER == 'lxml' and not LXML_AVAILABLE:
+    logging.warning("未安装lxml，提取正文改用html.parser")
+    CRAWL_HTML_PARSER = 'html.parser'
+
+def extract_main_content(html, url, extractor=None):
+    """
+    从HTML中提取主要内容，尽量保留原始结构
+    使用单遍转换（html_markdown），遇到它不支持的结构时使用 extract_main_content_bs4，两者输出相同
+    extractor: 下载时已经读入了html的MarkdownExtractor，为None时在这里解析
+    """
+    if CRAWL_FAST_EXTRACT:
+        try:
+            if extractor is None:
+                extractor = MarkdownExtractor(url, CRAWL_HTML_PARSER)
+                extractor.feed(html)
+            result = extractor.close()
+        except Exception as e:
+            logging.warning(f"单遍提取内容失败，改用BeautifulSoup: {e}")
+            result = None
+        if result is not None:
+            return result
+    return extract_main_content_bs4(html, url, CRAWL_HTML_PARSER)
+
+def extract_main_content_bs4(html, url, parser='html.parser'):
     """
     从HTML中提取主要内容，尽量保留原始结构
+    先用BeautifulSoup建树，再按元素类型逐轮替换为Markdown文本
     """
     try:
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = BeautifulSoup(html, parser)
         
         # 移除不需要的元素，但保留更多内容
         for tag in soup(['script', 'style', 'iframe', 'form']):
@@ -18,15 +53,8 @@ def extract_main_content(html, url):
         # 尝试找到主要内容区域
         main_content = None
         
-        # 常见的主要内容容器ID和类名
-        content_selectors = [
-            'article', 'main', '.content', '#content', '.post', '.article', 
-            '.post-content', '.entry-content', '.main-content', '#main-content',
-            '.blog-post', '.document', '.documentation', '.page-content', '.container'
-        ]
-        
         # 尝试找到主要内容区域
-        for selector in content_selectors:
+        for selector in CONTENT_SELECTORS:
             if selector.startswith('.'):
                 elements = soup.select(selector)
             elif selector.startswith('#'):
@@ -142,36 +170,210 @@ def extract_main_content(html, url):
             'url': url
         }
 
+def extract_main_content_cached(html, url, cache=crawl_cache, extractor=None):
+    """
+    提取正文，结果按网页内容的哈希缓存，内容没有变化的页面不再解析
+    """
+    if cache is None:
+        return extract_main_content(html, url, extractor)
+    key = f"{content_hash(html)}|{url}|{CRAWL_HTML_PARSER}"
+    data = cache.get_result('extracted', key)
+    if data is None:
+        data = extract_main_content(html, url, extractor)
+        cache.set_result('extracted', key, data)
+    return data
+
+# 模拟浏览器的请求头
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+}
+
+def is_valid_url(url):
+    """URL是否包含协议和域名"""
+    parsed_url = urlparse(url)
+    return bool(parsed_url.scheme and parsed_url.netloc)
+
+# 连接池配置：保留连接的域名数、每个域名最多同时打开的连接数（用完时等待，不再新建连接）
+CRAWL_POOL_HOSTS = int(os.environ.get('CRAWL_POOL_HOSTS', '64'))
+CRAWL_HOST_CONNECTIONS = int(os.environ.get('CRAWL_HOST_CONNECTIONS', '4'))
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """所有爬取共用的会话，复用到同一域名的连接"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers.update(REQUEST_HEADERS)
+                adapter = HTTPAdapter(pool_connections=CRAWL_POOL_HOSTS,
+                                      pool_maxsize=max(1, CRAWL_HOST_CONNECTIONS), pool_block=True)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+# 下载配置：单个网页的最大字节数（解压后），超过时放弃
+CRAWL_MAX_PAGE_BYTES = int(os.environ.get('CRAWL_MAX_PAGE_BYTES', str(10 * 1024 * 1024)))
+CRAWL_CHUNK_SIZE = 64 * 1024
+# 在网页开头查找<meta charset>的范围；响应头和meta都没有声明编码时，按开头这么多字节检测编码
+META_SNIFF_BYTES = 4096
+DETECT_SNIFF_BYTES = 64 * 1024
+
+_CONTENT_TYPE_CHARSET = re.compile(r'charset\s*=\s*["\']?\s*([\w.:+-]+)', re.I)
+_META_CHARSET = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([\w.:+-]+)', re.I)
+_BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+# 与浏览器相同，把这些声明当作它们的超集解码
+_ENCODING_ALIASES = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'iso8859-1': 'cp1252', 'ascii': 'cp1252'}
+
+class PageTooLarge(requests.exceptions.RequestException):
+    """网页超过CRAWL_MAX_PAGE_BYTES"""
+
+def _normalize_encoding(name):
+    """规范化编码名称，不认识的编码返回None"""
+    try:
+        name = codecs.lookup(name).name
+    except (LookupError, TypeError):
+        return None
+    return _ENCODING_ALIASES.get(name, name)
+
+def declared_encoding(content_type, head):
+    """
+    按BOM、Content-Type响应头、网页开头的<meta>确定编码，都没有声明时返回None
+    """
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    match = _CONTENT_TYPE_CHARSET.search(content_type or '')
+    if match and _normalize_encoding(match.group(1)):
+        return _normalize_encoding(match.group(1))
+    match = _META_CHARSET.search(head[:META_SNIFF_BYTES])
+    if match:
+        return _normalize_encoding(match.group(1).decode('ascii', 'ignore'))
+    return None
+
+def iter_page_text(response, max_bytes):
+    """
+    逐块读取响应并解码，返回生成器；读取的字节数超过max_bytes时抛出PageTooLarge
+    编码在开头确定（见declared_encoding），都没有声明时只对开头DETECT_SNIFF_BYTES字节做检测，
+    确定后设置到response.encoding
+    """
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise PageTooLarge(f'网页大小{int(length)}字节，超过上限{max_bytes}字节', response=response)
+
+    head = b''
+    decoder = None
+    received = 0
+    for chunk in response.iter_content(CRAWL_CHUNK_SIZE):
+        received += len(chunk)
+        if received > max_bytes:
+            raise PageTooLarge(f'网页超过大小上限{max_bytes}字节', response=response)
+        if decoder is None:
+            head += chunk
+            encoding = declared_encoding(response.headers.get('Content-Type'), head)
+            if encoding is None:
+                if len(head) < DETECT_SNIFF_BYTES:
+                    continue
+                encoding = _normalize_encoding(chardet.detect(head)['encoding']) or 'utf-8'
+            response.encoding = encoding
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            chunk, head = head, b''
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+
+    if decoder is None:
+        # 整个网页都不足检测所需的长度
+        encoding = declared_encoding(response.headers.get('Content-Type'), head)
+        if encoding is None:
+            encoding = _normalize_encoding(chardet.detect(head)['encoding']) if head else None
+        response.encoding = encoding or 'utf-8'
+        decoder = codecs.getincrementaldecoder(response.encoding)(errors='replace')
+    text = decoder.decode(head, final=True)
+    if text:
+        yield text
+
+def fetch_page(url, cache=crawl_cache, on_text=None, max_bytes=None):
+    """
+    下载网页，返回 (解码后的HTML, 来源)，来源为fresh（缓存仍然新鲜，没有发请求）、
+    revalidated（服务器返回304，使用缓存）或downloaded
+    下载时逐块读取，超过max_bytes（默认CRAWL_MAX_PAGE_BYTES）时放弃；on_text在下载时依次收到解码后的每一段
+    请求失败、状态码错误或网页过大时抛出requests.exceptions.RequestException
+    """
+    cached = cache.get_page(url) if cache is not None else None
+    if cached is not None and cached.is_fresh():
+        cache.count('fresh')
+        return cached.text, 'fresh'
+
+    headers = cached.conditional_headers() if cached is not None else {}
+    with get_session().get(url, headers=headers, timeout=10, stream=True) as response:
+        if cached is not None and response.status_code == 304:
+            cache.revalidated(cached, response.headers)
+            cache.count('revalidated')
+            return cached.text, 'revalidated'
+        response.raise_for_status()  # 如果请求失败，抛出异常
+
+        parts = []
+        for text in iter_page_text(response, max_bytes or CRAWL_MAX_PAGE_BYTES):
+            parts.append(text)
+            if on_text is not None:
+                on_text(text)
+        text = ''.join(parts)
+    if cache is not None:
+        cache.store_page(url, text, response.encoding, response.headers)
+        cache.count('downloaded')
+    return text, 'downloaded'
+
+def fetch_url(url):
+    """
+    下载网页，返回解码后的HTML，使用HTTP缓存（见fetch_page）
+    请求失败、状态码错误或网页过大时抛出requests.exceptions.RequestException
+    """
+    return fetch_page(url)[0]
+
+def fetch_and_extract(url, cache=crawl_cache):
+    """
+    下载网页并提取正文，下载的同时把已收到的部分交给解析器
+    请求失败、状态码错误或网页过大时抛出requests.exceptions.RequestException
+    """
+    extractor = None
+    if CRAWL_FAST_EXTRACT:
+        extractor = MarkdownExtractor(url, CRAWL_HTML_PARSER)
+
+    def feed(text):
+        nonlocal extractor
+        if extractor is None:
+            return
+        try:
+            extractor.feed(text)
+        except Exception as e:
+            # 下载完成后再整体提取
+            logging.warning(f"边下载边解析失败: {e}")
+            extractor = None
+
+    html, source = fetch_page(url, cache, on_text=feed)
+    return extract_main_content_cached(html, url, cache, extractor if source == 'downloaded' else None)
+
 def crawl_url(url):
     """
     爬取指定URL的内容
     """
     try:
         # 验证URL格式
-        parsed_url = urlparse(url)
-        if not parsed_url.scheme or not parsed_url.netloc:
+        if not is_valid_url(url):
             return {
                 'success': False,
                 'message': '无效的URL格式',
                 'data': None
             }
         
-        # 设置请求头，模拟浏览器
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-        }
-        
-        # 发送请求
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()  # 如果请求失败，抛出异常
-        
-        # 检测编码
-        response.encoding = response.apparent_encoding
-        
-        # 提取内容
-        data = extract_main_content(response.text, url)
+        # 下载并提取内容
+        data = fetch_and_extract(url)
         
         return {
             'success': True,
@@ -191,4 +393,4 @@ def crawl_url(url):
             'success': False,
             'message': f'爬取内容时出错: {str(e)}',
             'data': None
-        } 
\ No newline at end of file
+        }
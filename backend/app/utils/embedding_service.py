@@ -0,0 +1,317 @@
+"""
+句向量模型服务
+进程内共享同一个句向量模型，FlashRAG、向量知识库和RAG服务都通过它编码文本
+"""
+
+import os
+import time
+import queue
+import unicodedata
+import logging
+import threading
+import numpy as np
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+from .startup_optimizer import startup_optimizer
+from .lru_cache import LRUCache
+
+try:
+    import resource
+except ImportError:  # Windows下没有resource
+    resource = None
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 句向量模型名称（多语言模型，支持中英文）
+MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+# 模型的向量维度，模型加载前用于创建空索引
+EMBEDDING_DIMENSION = 384
+
+
+def _current_rss_mb() -> Optional[float]:
+    """当前进程的常驻内存（MB），无法获取时返回None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1 << 20)
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        # 退化为峰值内存，macOS下单位为字节，Linux下为KB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1 << 20) if peak > 1 << 30 else peak / 1024
+    return None
+
+
+class _EncodeRequest:
+    """一次编码请求，结果通过Future返回"""
+
+    __slots__ = ('texts', 'future')
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future = Future()
+
+
+class BatchingEncoder:
+    """
+    合并批处理编码器
+    等待窗口内到达的编码请求合并为一次前向计算，由单个后台线程执行，结果通过Future交还给各个调用方；
+    并发查询较多时用一次较大的前向计算代替许多次单条计算
+    """
+
+    def __init__(self, encode_func: Callable[[List[str]], np.ndarray], max_batch: int, wait_ms: float):
+        """
+        初始化合并批处理编码器
+
+        Args:
+            encode_func: 实际执行批量编码的函数
+            max_batch: 每次前向计算最多的文本数
+            wait_ms: 收到第一个请求后等待更多请求的时间（毫秒）
+        """
+        self.encode_func = encode_func
+        self.max_batch = max(1, max_batch)
+        self.wait_seconds = max(0.0, wait_ms) / 1000
+        self.batches = 0  # 已执行的前向计算次数
+        self.requests = 0  # 已处理的请求数
+        self._queue: 'queue.Queue[_EncodeRequest]' = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        提交编码请求
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            结果为 (len(texts), 维度) 矩阵的Future
+        """
+        request = _EncodeRequest(list(texts))
+        self._ensure_worker()
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """提交编码请求并等待结果"""
+        return self.submit(texts).result()
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[_EncodeRequest]:
+        """取出一批请求：阻塞等待第一个请求，然后在等待窗口内继续收集，直到达到批次上限"""
+        batch = [self._queue.get()]
+        count = len(batch[0].texts)
+        deadline = time.monotonic() + self.wait_seconds
+        while count < self.max_batch:
+            try:
+                # 已经在排队的请求直接取出，不必等待
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(request)
+            count += len(request.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                embeddings = self.encode_func(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            offset = 0
+            for request in batch:
+                request.future.set_result(embeddings[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+
+class EmbeddingService:
+    """
+    句向量模型服务
+    模型在第一次编码时才加载，加载过程线程安全，整个进程只保留一份模型权重
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME):
+        """
+        初始化句向量模型服务
+
+        Args:
+            model_name: 句向量模型名称
+        """
+        self.model_name = model_name
+        self.dimension = EMBEDDING_DIMENSION  # 模型加载后更新为实际维度
+        self.load_seconds = None  # 模型加载耗时
+        self.load_memory_mb = None  # 模型加载前后常驻内存的增量
+        self._model = None
+        self._lock = threading.Lock()
+        self._batcher = None  # 查询编码的合并批处理器，首次使用时创建
+        cache_size = startup_optimizer.get_query_embedding_cache_size()
+        # 查询向量缓存，键为 (模型名称, 规范化后的查询)
+        self.query_cache = LRUCache(cache_size, startup_optimizer.get_query_embedding_cache_ttl()) if cache_size > 0 else None
+
+    @property
+    def is_loaded(self) -> bool:
+        """模型是否已加载"""
+        return self._model is not None
+
+    def load(self):
+        """
+        加载句向量模型（只加载一次）
+
+        Returns:
+            SentenceTransformer模型
+
+        Raises:
+            RuntimeError: 模型加载失败
+        """
+        if self._model is not None:
+            return self._model
+
+        with self._lock:
+            if self._model is None:
+                if startup_optimizer.is_verbose_startup():
+                    logger.info(f"正在加载句向量模型: {self.model_name}")
+                else:
+                    logger.info("正在加载句向量模型...")
+
+                rss_before = _current_rss_mb()
+                start = time.perf_counter()
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    model = SentenceTransformer(self.model_name)
+                except Exception as e:
+                    logger.error(f"加载句向量模型失败: {str(e)}")
+                    raise RuntimeError(f"加载句向量模型失败: {str(e)}")
+
+                self.load_seconds = time.perf_counter() - start
+                rss_after = _current_rss_mb()
+                if rss_before is not None and rss_after is not None:
+                    self.load_memory_mb = rss_after - rss_before
+                self.dimension = model.get_sentence_embedding_dimension()
+                self._model = model
+
+                if startup_optimizer.is_verbose_startup():
+                    memory = f"{self.load_memory_mb:.1f}MB" if self.load_memory_mb is not None else "未知"
+                    logger.info(f"句向量模型加载完成: 维度 {self.dimension}，耗时 {self.load_seconds:.2f}s，内存增加 {memory}")
+                else:
+                    logger.info("成功加载句向量模型")
+        return self._model
+
+    def encode(self, texts: List[str], batch_size: int = None, normalize: bool = False) -> np.ndarray:
+        """
+        批量编码文本
+
+        Args:
+            texts: 文本列表
+            batch_size: 每次前向计算的文本数，默认使用 VECTOR_BATCH_SIZE
+            normalize: 是否对向量做L2归一化
+
+        Returns:
+            (len(texts), 维度) 的float32矩阵
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        model = self.load()
+        batch_size = batch_size or startup_optimizer.get_vector_batch_size()
+        embeddings = model.encode(
+            list(texts),
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=normalize,
+            # 详细模式下为大批量编码显示进度条
+            show_progress_bar=startup_optimizer.is_verbose_startup() and len(texts) > batch_size
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        """规范化查询文本：统一全角半角字符，合并连续空白"""
+        return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+    def encode_queries(self, texts: List[str]) -> np.ndarray:
+        """
+        编码在线查询
+        先查询向量缓存；未命中的查询在等待窗口（EMBEDDING_BATCH_WAIT_MS）内与并发请求合并为一次前向计算，
+        等待窗口为0时直接编码
+
+        Args:
+            texts: 查询文本列表（通常只有一条）
+
+        Returns:
+            (len(texts), 维度) 的float32矩阵
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        queries = [self.normalize_query(text) for text in texts]
+        vectors: Dict[int, np.ndarray] = {}
+        if self.query_cache is not None:
+            for i, query in enumerate(queries):
+                vector = self.query_cache.get((self.model_name, query))
+                if vector is not None:
+                    vectors[i] = vector
+
+        missing = [i for i in range(len(queries)) if i not in vectors]
+        if missing:
+            embeddings = self._encode_uncached([queries[i] for i in missing])
+            for row, i in enumerate(missing):
+                vector = embeddings[row].copy()
+                vector.flags.writeable = False  # 缓存的向量被多个调用方共享
+                vectors[i] = vector
+                if self.query_cache is not None:
+                    self.query_cache.set((self.model_name, queries[i]), vector)
+
+        return np.stack([vectors[i] for i in range(len(queries))])
+
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        """编码缓存中没有的查询，开启合并批处理时经由批处理器"""
+        wait_ms = startup_optimizer.get_embedding_batch_wait_ms()
+        if wait_ms <= 0:
+            return self.encode(texts)
+
+        if self._batcher is None:
+            # 先在调用方线程加载模型，加载失败时直接抛出
+            self.load()
+            with self._lock:
+                if self._batcher is None:
+                    max_batch = startup_optimizer.get_embedding_max_batch()
+                    self._batcher = BatchingEncoder(
+                        lambda batch: self.encode(batch, batch_size=max_batch), max_batch, wait_ms
+                    )
+        return self._batcher.encode(texts)
+
+    def cache_stats(self) -> Dict[str, object]:
+        """查询向量缓存与合并批处理的统计"""
+        return {
+            'model': self.model_name,
+            'query_cache': self.query_cache.stats() if self.query_cache is not None else None,
+            'batcher': {
+                'batches': self._batcher.batches,
+                'requests': self._batcher.requests
+            } if self._batcher is not None else None
+        }
+
+
+# 创建全局实例
+embedding_service = EmbeddingService()
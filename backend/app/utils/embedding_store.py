@@ -0,0 +1,264 @@
+"""
+向量嵌入存储
+按文档内容哈希寻址，向量以 .npy 分段文件保存并通过内存映射读取
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+import numpy as np
+from typing import Callable, Dict, List, Set, Tuple, Optional
+from .file_lock import FileLock
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 存储格式版本，格式不兼容时递增
+STORE_VERSION = 1
+
+class EmbeddingStore:
+    """
+    按内容哈希寻址的向量嵌入存储
+    每次写入生成一个新的 .npy 分段，清单文件记录 内容哈希 -> (分段, 行号)；
+    只有内容变化的文档需要重新编码，读取时分段以 mmap_mode='r' 打开，不占用进程私有内存。
+    分段过多时合并较小的分段，并清理已不再被使用的向量
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, dtype: str = 'float32', max_segments: int = 32,
+                 live_hashes: Optional[Callable[[], Optional[Set[str]]]] = None):
+        """
+        初始化向量嵌入存储
+
+        Args:
+            cache_dir: 缓存根目录
+            model_name: 向量模型名称，不同模型的向量分开存放
+            dtype: 存储精度，float32 或 float16
+            max_segments: 分段数超过该值时合并较小的分段
+            live_hashes: 返回仍在使用的内容哈希集合，合并分段时清理其余向量；为None或返回None时保留全部向量
+        """
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype('float32'), np.dtype('float16')):
+            raise ValueError(f"不支持的向量存储精度: {dtype}")
+
+        safe_model_name = re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)
+        self.store_dir = os.path.join(cache_dir, f"v{STORE_VERSION}_{safe_model_name}_{self.dtype.name}")
+        self.manifest_path = os.path.join(self.store_dir, 'manifest.json')
+        self.max_segments = max_segments
+        self.live_hashes = live_hashes
+
+        self.entries: Dict[str, Tuple[str, int]] = {}  # 内容哈希 -> (分段文件名, 行号)
+        self._segments: Dict[str, np.ndarray] = {}  # 已打开的分段
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._load_manifest()
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        """计算文本内容哈希"""
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _load_manifest(self) -> None:
+        """从磁盘加载清单（其他进程写入后会重新加载）"""
+        try:
+            if not os.path.exists(self.manifest_path):
+                return
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+            if mtime == self._manifest_mtime:
+                return
+
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.entries = {key: (segment, row) for key, (segment, row) in manifest.get('entries', {}).items()}
+            self._manifest_mtime = mtime
+        except Exception as e:
+            logger.warning(f"加载向量嵌入清单失败: {str(e)}")
+
+    def _write_manifest(self) -> None:
+        """原子写入清单"""
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': STORE_VERSION,
+                'dtype': self.dtype.name,
+                'entries': {key: [segment, row] for key, (segment, row) in self.entries.items()}
+            }, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+
+    def _open_segment(self, segment: str) -> np.ndarray:
+        """以内存映射方式打开分段"""
+        array = self._segments.get(segment)
+        if array is None:
+            array = np.load(os.path.join(self.store_dir, segment), mmap_mode='r')
+            self._segments[segment] = array
+        return array
+
+    def get_many(self, hashes: List[str]) -> Tuple[Optional[np.ndarray], List[int]]:
+        """
+        批量读取向量
+
+        Args:
+            hashes: 内容哈希列表
+
+        Returns:
+            (向量矩阵, 缺失的位置列表)；缺失位置在矩阵中为0。
+            全部命中且位于同一分段的连续行时，直接返回内存映射视图（float32下零拷贝）
+        """
+        with self._lock:
+            self._load_manifest()
+            locations = [self.entries.get(key) for key in hashes]
+            missing = [i for i, location in enumerate(locations) if location is None]
+            if not hashes or len(missing) == len(hashes):
+                return None, missing
+
+            try:
+                # 快速路径：同一分段中的连续行，直接切片
+                if not missing:
+                    segment, first_row = locations[0]
+                    if all(location == (segment, first_row + i) for i, location in enumerate(locations)):
+                        view = self._open_segment(segment)[first_row:first_row + len(hashes)]
+                        return (view if self.dtype == np.float32 else view.astype(np.float32)), []
+
+                result = None
+                by_segment: Dict[str, Tuple[List[int], List[int]]] = {}
+                for i, location in enumerate(locations):
+                    if location is not None:
+                        positions, rows = by_segment.setdefault(location[0], ([], []))
+                        positions.append(i)
+                        rows.append(location[1])
+
+                for segment, (positions, rows) in by_segment.items():
+                    array = self._open_segment(segment)
+                    if result is None:
+                        result = np.zeros((len(hashes), array.shape[1]), dtype=np.float32)
+                    result[positions] = array[rows]
+                return result, missing
+            except Exception as e:
+                logger.warning(f"读取向量嵌入分段失败: {str(e)}")
+                return None, list(range(len(hashes)))
+
+    def put_many(self, hashes: List[str], vectors: np.ndarray) -> None:
+        """
+        批量写入向量，作为一个新分段保存
+
+        Args:
+            hashes: 内容哈希列表
+            vectors: 对应的向量矩阵
+        """
+        if not hashes:
+            return
+
+        with self._lock, self._file_lock():
+            # 合并其他进程写入的条目，只保存新增的向量
+            self._load_manifest()
+            new_positions = {}
+            for i, key in enumerate(hashes):
+                if key not in self.entries and key not in new_positions:
+                    new_positions[key] = i
+            if not new_positions:
+                return
+
+            segment = f"seg_{time.time_ns()}_{os.getpid()}.npy"
+            data = np.ascontiguousarray(vectors[list(new_positions.values())], dtype=self.dtype)
+            tmp_path = os.path.join(self.store_dir, segment + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, data)
+            os.replace(tmp_path, os.path.join(self.store_dir, segment))
+
+            for row, key in enumerate(new_positions):
+                self.entries[key] = (segment, row)
+            self._write_manifest()
+
+            if len({segment for segment, _ in self.entries.values()}) > self.max_segments:
+                # 刚写入的向量对应的文档可能还没有登记为在用，本次不清理
+                self._compact(keep=set(new_positions))
+
+    def _compact(self, keep: Set[str] = frozenset()) -> None:
+        """
+        合并分段并清理不再使用的向量，调用方需持有锁
+        分段按有效向量数从大到小排列，从第一个不大于其后所有分段之和的分段开始，把它和更小的分段合并为一个；
+        合并后每个分段都大于所有更小分段之和，分段数保持在对数级，大分段不会因为少量写入被反复重写。
+        失效向量超过一半的分段也一并重写，不再有有效向量的分段直接删除
+
+        Args:
+            keep: 无论是否在用都保留的内容哈希
+        """
+        old_segments = {segment for segment, _ in self.entries.values()}
+        live = None
+        if self.live_hashes is not None:
+            try:
+                live = self.live_hashes()
+            except Exception as e:
+                logger.warning(f"获取在用的向量嵌入失败，本次不清理: {str(e)}")
+        dropped = 0
+        if live is not None:
+            dead_keys = [key for key in self.entries if key not in live and key not in keep]
+            for key in dead_keys:
+                del self.entries[key]
+            dropped = len(dead_keys)
+
+        keys_by_segment: Dict[str, List[str]] = {}
+        for key, (segment, _) in self.entries.items():
+            keys_by_segment.setdefault(segment, []).append(key)
+        removed = old_segments - set(keys_by_segment)
+
+        ordered = sorted(keys_by_segment, key=lambda segment: len(keys_by_segment[segment]), reverse=True)
+        counts = [len(keys_by_segment[segment]) for segment in ordered]
+        start = len(ordered)
+        remaining = sum(counts)
+        for i, count in enumerate(counts):
+            remaining -= count
+            if count <= remaining:
+                start = i
+                break
+        merge = ordered[start:]
+        merge += [segment for segment in ordered[:start]
+                  if len(keys_by_segment[segment]) * 2 < self._open_segment(segment).shape[0]]
+
+        if len(merge) > 1 or (merge and len(keys_by_segment[merge[0]]) < self._open_segment(merge[0]).shape[0]):
+            keys = [key for segment in merge for key in keys_by_segment[segment]]
+            merged = np.empty((len(keys), self._open_segment(merge[0]).shape[1]), dtype=self.dtype)
+            offset = 0
+            for old_segment in merge:
+                rows = [self.entries[key][1] for key in keys_by_segment[old_segment]]
+                merged[offset:offset + len(rows)] = self._open_segment(old_segment)[rows]
+                offset += len(rows)
+
+            segment = f"seg_{time.time_ns()}_{os.getpid()}.npy"
+            tmp_path = os.path.join(self.store_dir, segment + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, merged)
+            os.replace(tmp_path, os.path.join(self.store_dir, segment))
+
+            for row, key in enumerate(keys):
+                self.entries[key] = (segment, row)
+            removed.update(merge)
+            logger.info(f"已合并向量嵌入分段: {len(merge)} -> 1，共{len(keys)}个向量")
+        elif not removed and not dropped:
+            return
+
+        self._write_manifest()
+
+        # 已映射的旧分段在Linux下删除后仍可继续读取
+        for old_segment in removed:
+            self._segments.pop(old_segment, None)
+            try:
+                os.remove(os.path.join(self.store_dir, old_segment))
+            except OSError:
+                pass
+        if dropped:
+            logger.info(f"已清理{dropped}个不再使用的向量嵌入，删除{len(removed)}个分段")
+
+    def _file_lock(self):
+        """跨进程写锁"""
+        return FileLock(os.path.join(self.store_dir, '.lock'))
+
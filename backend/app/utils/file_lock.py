@@ -0,0 +1,30 @@
+"""
+跨进程文件锁
+基于fcntl.flock，没有fcntl的平台（Windows）上退化为不加锁，由调用方的线程锁保证进程内互斥
+"""
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl
+    fcntl = None
+
+
+class FileLock:
+    """基于fcntl的简单文件锁，没有fcntl时不做任何事"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = open(self.path, 'a')
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._fd.close()
+            self._fd = None
+        return False
@@ -4,10 +4,20 @@ import os
 import numpy as np
 import time
 import hashlib
+import threading
 import faiss
 from typing import Dict, List, Any, Optional
-from sentence_transformers import SentenceTransformer
-from .knowledge_base import knowledge_base
+from .knowledge_base import KnowledgeBase, knowledge_base as shared_knowledge_base
+from .chunk_store import ChunkStore
+from .startup_optimizer import startup_optimizer
+from .embedding_service import embedding_service as shared_embedding_service
+from .lru_cache import LRUCache
+from .answer_cache import answer_cache
+from .semantic_cache import SemanticCache
+from .llm_stream import stream_chat_completion, LLMStreamError
+from .llm_gateway import LLMGatewayError
+from .llm_retry import retry_policy
+from .llm_router import llm_router, configured_providers
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -18,82 +28,438 @@ class FlashRAGService:
     特点：高效轻量级、专注于检索和生成效率
     """
     
-    def __init__(self):
-        """初始化FlashRAG服务"""
+    def __init__(self, knowledge_base=None, embedding_service=None, persist_dir=None):
+        """
+        初始化FlashRAG服务
+        
+        Args:
+            knowledge_base: 知识库，默认使用全局知识库
+            embedding_service: 句向量服务，默认使用全局句向量服务
+            persist_dir: 索引持久化目录，默认为app/cache/flashrag
+        """
         # 初始化知识库
-        self.knowledge_base = knowledge_base
+        self.knowledge_base = knowledge_base if knowledge_base is not None else shared_knowledge_base
         
-        # 初始化向量模型
-        try:
-            # 我们使用多语言模型以支持中英文
-            self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-            self.dimension = self.model.get_sentence_embedding_dimension()
-            logger.info(f"成功加载FlashRAG向量模型，维度: {self.dimension}")
-        except Exception as e:
-            logger.error(f"加载FlashRAG向量模型失败: {str(e)}")
-            self.model = None
-            self.dimension = 384  # 默认维度
-            raise RuntimeError(f"加载FlashRAG向量模型失败，服务无法正常工作: {str(e)}")
+        # 向量模型由全局句向量服务共享，首次需要向量化时才加载
+        self.embedding_service = embedding_service if embedding_service is not None else shared_embedding_service
+        self.dimension = self.embedding_service.dimension  # 加载模型或磁盘索引后更新
         
         # 初始化FAISS索引
         self.index = None
-        self.document_map = {}  # 存储ID到文档的映射
-        self.cache = {}  # 查询缓存
-        self.cache_size = 100  # 最大缓存条目数
+        self._index_mmapped = False  # 索引是否以内存映射方式从磁盘加载
+        self.persist_dir = persist_dir or os.path.join(os.path.dirname(__file__), '..', 'cache', 'flashrag')
+        self.chunk_store = ChunkStore()  # 文档块按行号存放，行号即FAISS向量ID
+        self._lock = threading.RLock()  # 保护索引与映射的并发读写
+        # 索引中每篇文档对应的知识库内容摘要，与知识库比较即可找出其他进程修改过的文档
+        self._doc_digests: Dict[str, int] = {}
+        self._synced_generation = None  # 索引已同步到的知识库版本号
+        self._sync_lock = threading.Lock()  # 同一时间只有一个线程同步索引
+        self.persist_delay = startup_optimizer.get_flashrag_persist_delay()
+        self._persist_lock = threading.Lock()  # 同一时间只有一个线程写索引文件
+        self._persist_timer = None  # 尚未执行的延迟保存
+        # 检索结果缓存，知识库写入后整体失效；索引重建或更新时另行清空
+        self.cache = LRUCache(
+            max_entries=startup_optimizer.get_result_cache_size(),
+            ttl=startup_optimizer.get_result_cache_ttl(),
+            max_bytes=startup_optimizer.get_result_cache_max_bytes(),
+            generation=self.knowledge_base.get_generation
+        )
+        self.answer_cache = answer_cache  # 持久化问答缓存，多个worker进程共享，未启用时为None
+        # 语义问答缓存：相似问题且检索到相同文档块时复用回答
+        self.semantic_cache = SemanticCache(
+            threshold=startup_optimizer.get_semantic_cache_threshold(),
+            max_entries=startup_optimizer.get_semantic_cache_size(),
+            ttl=startup_optimizer.get_semantic_cache_ttl(),
+            generation=self.knowledge_base.get_generation
+        ) if startup_optimizer.get_semantic_cache_size() > 0 else None
         
-        # 初始化向量索引
-        self._init_index()
+        # 优先加载磁盘索引（与知识库的差异在首次检索时补齐），否则全量构建
+        if not self._load_persisted_index():
+            self.rebuild()
     
-    def _init_index(self):
-        """初始化FAISS索引"""
+    def _load_model(self):
+        """加载共享的句向量模型"""
         try:
-            # 创建FAISS索引（使用L2距离）
-            self.index = faiss.IndexFlatL2(self.dimension)
+            model = self.embedding_service.load()
+        except RuntimeError as e:
+            raise RuntimeError(f"加载FlashRAG向量模型失败，服务无法正常工作: {str(e)}")
+        self.dimension = self.embedding_service.dimension
+        return model
+    
+    def _new_index(self):
+        """创建支持按ID增删的FAISS索引（使用L2距离）"""
+        return faiss.IndexIDMap(faiss.IndexFlatL2(self.dimension))
+    
+    def rebuild(self):
+        """从知识库全量重建FAISS索引并立即保存"""
+        try:
+            # 从知识库加载文档并分块
+            generation, documents, digests = self.knowledge_base.snapshot()
+            chunk_store = ChunkStore()
             
-            # 从知识库加载文档并索引
-            documents = self.knowledge_base.get_all_documents()
+            # 处理每个文档
+            for doc_id, doc in documents.items():
+                # 分块处理文档内容
+                doc_chunks = self._chunk_document(doc_id, doc['title'], doc['content'])
+                chunk_store.append(doc_id, self._build_chunk_records(doc_id, doc['title'], doc_chunks, doc.get('metadata', {})))
             
-            if documents:
-                chunks = []
-                doc_ids = []
-                
-                # 处理每个文档
-                for doc_id, doc in documents.items():
-                    # 分块处理文档内容
-                    doc_chunks = self._chunk_document(doc_id, doc['title'], doc['content'])
-                    chunks.extend(doc_chunks)
-                    # 为每个分块存储原始ID
-                    for i in range(len(doc_chunks)):
-                        chunk_id = f"{doc_id}_chunk_{i}"
-                        doc_ids.append(chunk_id)
-                        self.document_map[chunk_id] = {
-                            'original_id': doc_id,
-                            'title': doc['title'],
-                            'content': doc_chunks[i],
-                            'metadata': doc.get('metadata', {})
-                        }
-                
-                # 如果有文档，创建向量嵌入
-                if chunks and self.model:
-                    embeddings = self._create_embeddings(chunks)
-                    if len(embeddings) > 0:
-                        self.index.add(embeddings)
-                        logger.info(f"已为{len(chunks)}个文档块创建索引")
+            # 如果有文档，创建向量嵌入（知识库为空时不需要加载模型）
+            chunks = [record['content'] for record in chunk_store.records]
+            embeddings = self._create_embeddings(chunks) if chunks else []
+            index = self._new_index()
+            if chunks:
+                if len(embeddings) > 0:
+                    index.add_with_ids(embeddings, np.arange(len(chunks), dtype=np.int64))
+                    logger.info(f"已为{len(chunks)}个文档块创建索引")
+            
+            with self._lock:
+                self.index = index
+                self._index_mmapped = False
+                self.chunk_store = chunk_store
+                self._doc_digests = digests
+                self._synced_generation = generation
+                self.cache.clear()
             
             logger.info("FlashRAG索引初始化完成")
+            self.save()
         except Exception as e:
             logger.exception(f"初始化FlashRAG索引时出错: {str(e)}")
             self.index = None
             raise RuntimeError(f"初始化FlashRAG索引失败，服务无法正常工作: {str(e)}")
     
+    def _build_chunk_records(self, doc_id, title, doc_chunks, metadata):
+        """为文档的每个分块构建映射记录"""
+        return [
+            {
+                'chunk_id': f"{doc_id}_chunk_{i}",
+                'original_id': doc_id,
+                'title': title,
+                'content': chunk,
+                'metadata': metadata or {}
+            }
+            for i, chunk in enumerate(doc_chunks)
+        ]
+    
+    def upsert_document(self, doc_id, title, content, metadata=None):
+        """
+        增量添加或更新单个文档的索引
+        只对该文档重新分块和向量化，不影响其他文档
+        
+        Args:
+            doc_id: 文档ID
+            title: 文档标题
+            content: 文档内容
+            metadata: 文档元数据
+        """
+        self.upsert_documents([{'id': doc_id, 'title': title, 'content': content, 'metadata': metadata}])
+    
+    def upsert_documents(self, documents, persist=True):
+        """
+        批量添加或更新文档的索引，所有分块一次性向量化
+        
+        Args:
+            documents: 文档列表，每个文档包含id、title、content，可选metadata
+            persist: 是否保存索引（延迟合并写盘）；批量任务可以在全部完成后再调用commit_bulk_upsert
+        """
+        if self.index is None:
+            raise RuntimeError("FlashRAG索引未初始化，无法增量更新")
+        if not documents:
+            return
+        
+        batches = []
+        for doc in documents:
+            doc_id = str(doc['id'])
+            doc_chunks = self._chunk_document(doc_id, doc['title'], doc['content'])
+            # 摘要与知识库中保存的文档一致（知识库把空元数据保存为{}）
+            digest = KnowledgeBase.document_digest(doc_id, {'title': doc['title'], 'content': doc['content'], 'metadata': doc.get('metadata') or {}})
+            batches.append((doc_id, digest, self._build_chunk_records(doc_id, doc['title'], doc_chunks, doc.get('metadata'))))
+        
+        # 向量化在锁外进行，避免阻塞并发搜索
+        embeddings = self._create_embeddings([record['content'] for _, _, records in batches for record in records])
+        
+        with self._lock:
+            self._ensure_writable_index()
+            offset = 0
+            for doc_id, digest, records in batches:
+                self._remove_chunks(doc_id)
+                rows = self.chunk_store.append(doc_id, records)
+                self.index.add_with_ids(embeddings[offset:offset + len(records)], np.arange(rows.start, rows.stop, dtype=np.int64))
+                self._doc_digests[doc_id] = digest
+                offset += len(records)
+            self._maybe_compact()
+            self.cache.clear()
+        
+        logger.info(f"已增量更新FlashRAG索引: {len(batches)}篇文档，{offset}个文档块")
+        if persist:
+            self._schedule_persist()
+    
+    def delete_document(self, doc_id, persist=True):
+        """
+        从索引中删除单个文档的所有分块
+        
+        Args:
+            doc_id: 文档ID
+            persist: 是否保存索引（延迟合并写盘）
+            
+        Returns:
+            是否删除了文档
+        """
+        if self.index is None:
+            return False
+        
+        with self._lock:
+            self._doc_digests.pop(str(doc_id), None)
+            if str(doc_id) not in self.chunk_store.doc_rows:
+                return False
+            self._ensure_writable_index()
+            removed = self._remove_chunks(str(doc_id))
+            if removed:
+                self._maybe_compact()
+                self.cache.clear()
+        
+        if removed:
+            logger.info(f"已从FlashRAG索引中删除文档 {doc_id}")
+            if persist:
+                self._schedule_persist()
+        return removed
+    
+    def sync(self, batch_size=64, persist=True):
+        """
+        将知识库的修改（包括其他worker进程写入的）应用到本进程的索引
+        知识库版本号未变化时只需一次refresh；否则按内容摘要比较知识库与索引，
+        只重新向量化新增或修改过的文档，并删除知识库中已不存在的文档
+        
+        Args:
+            batch_size: 每次批量向量化的文档数
+            persist: 是否保存索引（延迟合并写盘）
+            
+        Returns:
+            (更新的文档数, 删除的文档数)
+        """
+        if self.index is None or self.knowledge_base.get_generation() == self._synced_generation:
+            return 0, 0
+        
+        with self._sync_lock:
+            generation, documents, digests = self.knowledge_base.snapshot()
+            if generation == self._synced_generation:
+                return 0, 0
+            
+            with self._lock:
+                indexed = dict(self._doc_digests)
+            stale = [doc_id for doc_id, digest in digests.items() if indexed.get(doc_id) != digest]
+            removed = [doc_id for doc_id in indexed if doc_id not in digests]
+            
+            for start in range(0, len(stale), batch_size):
+                self.upsert_documents([dict(documents[doc_id], id=doc_id) for doc_id in stale[start:start + batch_size]], persist=False)
+            for doc_id in removed:
+                self.delete_document(doc_id, persist=False)
+            self._synced_generation = generation
+        
+        if stale or removed:
+            logger.info(f"已同步FlashRAG索引与知识库: 更新{len(stale)}篇文档，删除{len(removed)}篇文档")
+            if persist:
+                self._schedule_persist()
+        return len(stale), len(removed)
+    
+    def commit_bulk_upsert(self):
+        """
+        批量写入知识库之后调用：把尚未同步的修改应用到索引并立即保存，索引不可用时全量重建
+        其他worker进程的索引在各自下一次检索时通过sync同步
+        """
+        if self.index is None:
+            self.rebuild()
+            return
+        self.sync(persist=False)
+        self.save()
+    
+    def _remove_chunks(self, doc_id):
+        """移除文档现有的分块向量，调用方需持有锁"""
+        rows = self.chunk_store.remove(doc_id)
+        if rows is None:
+            return False
+        
+        self.index.remove_ids(np.arange(rows.start, rows.stop, dtype=np.int64))
+        return True
+    
+    def _ensure_writable_index(self):
+        """内存映射加载的索引在首次写入前复制为进程私有副本，调用方需持有锁"""
+        if self._index_mmapped:
+            self.index = faiss.clone_index(self.index)
+            self._index_mmapped = False
+    
+    @staticmethod
+    def _digests_hash(digests):
+        """文档摘要集合的哈希（各摘要的异或），与知识库content_hash的算法相同"""
+        value = 0
+        for digest in digests:
+            value ^= digest
+        return f"{value:032x}"
+    
+    def _persist_paths(self, index_hash):
+        """获取持久化索引和文档块元数据的文件路径"""
+        return (
+            os.path.join(self.persist_dir, f"index_{index_hash}.faiss"),
+            os.path.join(self.persist_dir, f"chunks_{index_hash}.json")
+        )
+    
+    def _persisted_hashes(self):
+        """
+        磁盘上已保存索引的哈希，与当前知识库内容完全一致的排在最前，其余按保存时间从新到旧
+        """
+        try:
+            names = os.listdir(self.persist_dir)
+        except FileNotFoundError:
+            return []
+        
+        saved = {}
+        for name in names:
+            if name.startswith('chunks_') and name.endswith('.json'):
+                try:
+                    saved[name[len('chunks_'):-len('.json')]] = os.path.getmtime(os.path.join(self.persist_dir, name))
+                except OSError:
+                    continue
+        
+        hashes = sorted(saved, key=saved.get, reverse=True)
+        kb_hash = self.knowledge_base.content_hash()
+        if kb_hash in saved:
+            hashes.remove(kb_hash)
+            hashes.insert(0, kb_hash)
+        return hashes
+    
+    def _load_persisted_index(self):
+        """
+        从磁盘加载已保存的索引
+        索引文件以其中实际包含的文档摘要为键，与知识库不一致的部分在首次检索时由sync补齐；
+        优先加载与知识库内容完全一致的索引，否则加载最新的索引。
+        使用内存映射读取，多个工作进程可以共享索引页
+        
+        Returns:
+            是否加载成功
+        """
+        if not startup_optimizer.should_enable_vector_cache():
+            return False
+        
+        for index_hash in self._persisted_hashes():
+            try:
+                index_path, chunks_path = self._persist_paths(index_hash)
+                if not os.path.exists(index_path):
+                    continue
+                
+                with open(chunks_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                # 旧格式的文件没有记录文档摘要，无法判断缺少哪些文档
+                digests = {doc_id: int(digest, 16) for doc_id, digest in (data.pop('digests', None) or {}).items()}
+                chunk_store = ChunkStore.from_dict(data)
+                if set(digests) != set(chunk_store.doc_rows) or self._digests_hash(digests.values()) != index_hash:
+                    logger.warning(f"FlashRAG索引文件与其文档摘要不一致，跳过: {chunks_path}")
+                    continue
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+            except Exception as e:
+                logger.warning(f"加载持久化FlashRAG索引{index_hash}失败: {str(e)}")
+                continue
+            
+            with self._lock:
+                self.index = index
+                self._index_mmapped = True
+                self.dimension = index.d
+                self.chunk_store = chunk_store
+                self._doc_digests = digests
+                self._synced_generation = None  # 首次检索时与知识库比较并补齐差异
+                self.cache.clear()
+            
+            logger.info(f"✅ 已从磁盘加载FlashRAG索引，共{len(self.chunk_store)}个文档块")
+            return True
+        return False
+    
+    def _schedule_persist(self):
+        """
+        延迟保存索引，延迟期间的多次增量更新合并为一次写盘
+        进程在保存前退出时，重启后加载上一次保存的索引并由sync补齐差异
+        """
+        if self.persist_delay <= 0:
+            self._persist_index()
+            return
+        
+        with self._persist_lock:
+            if self._persist_timer is not None:
+                return
+            self._persist_timer = threading.Timer(self.persist_delay, self._persist_index)
+            self._persist_timer.daemon = True
+            self._persist_timer.start()
+    
+    def save(self):
+        """立即保存索引，取消尚未执行的延迟保存"""
+        with self._persist_lock:
+            if self._persist_timer is not None:
+                self._persist_timer.cancel()
+        self._persist_index()
+    
+    def _persist_index(self):
+        """将索引、文档块元数据和各文档摘要保存到磁盘，以索引实际包含的文档摘要的哈希为键"""
+        with self._persist_lock:
+            self._persist_timer = None
+            if not startup_optimizer.should_enable_vector_cache() or self.index is None:
+                return
+            
+            try:
+                # 在锁内只做序列化，磁盘写入放在锁外
+                with self._lock:
+                    index_bytes = faiss.serialize_index(self.index)
+                    chunk_data = self.chunk_store.to_dict()
+                    chunk_data['records'] = list(chunk_data['records'])
+                    digests = dict(self._doc_digests)
+                chunk_data['digests'] = {doc_id: f"{digest:032x}" for doc_id, digest in digests.items()}
+                
+                os.makedirs(self.persist_dir, exist_ok=True)
+                index_path, chunks_path = self._persist_paths(self._digests_hash(digests.values()))
+                
+                # 先写临时文件再原子替换，避免其他进程读到不完整的文件；元数据最后写入，加载时以它为准
+                tmp_suffix = f".{os.getpid()}.tmp"
+                with open(index_path + tmp_suffix, 'wb') as f:
+                    f.write(index_bytes.tobytes())
+                os.replace(index_path + tmp_suffix, index_path)
+                with open(chunks_path + tmp_suffix, 'w', encoding='utf-8') as f:
+                    json.dump(chunk_data, f, ensure_ascii=False)
+                os.replace(chunks_path + tmp_suffix, chunks_path)
+                
+                # 清理更早保存的索引文件，其他进程之后保存的文件保留
+                keep = {os.path.basename(index_path), os.path.basename(chunks_path)}
+                saved_at = os.path.getmtime(chunks_path)
+                for name in os.listdir(self.persist_dir):
+                    path = os.path.join(self.persist_dir, name)
+                    if name not in keep and (name.startswith('index_') or name.startswith('chunks_')) and not name.endswith('.tmp'):
+                        try:
+                            if os.path.getmtime(path) < saved_at:
+                                os.remove(path)
+                        except FileNotFoundError:
+                            continue
+                
+                logger.info(f"已保存FlashRAG索引到磁盘: {index_path}")
+            except Exception as e:
+                logger.warning(f"保存FlashRAG索引失败: {str(e)}")
+    
+    def _maybe_compact(self):
+        """已删除的行过多时压缩文档块存储，并按新行号重排FAISS向量ID，调用方需持有锁"""
+        if not self.chunk_store.needs_compaction():
+            return
+        
+        ids = faiss.vector_to_array(self.index.id_map)
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+        mapping = np.array(self.chunk_store.compact(), dtype=np.int64)
+        
+        index = self._new_index()
+        if len(ids) > 0:
+            index.add_with_ids(vectors, mapping[ids])
+        self.index = index
+    
     def _create_embeddings(self, texts):
         """为文本列表创建向量嵌入"""
-        if not self.model or not texts:
-            raise ValueError("向量模型未初始化或文本列表为空")
+        if not texts:
+            raise ValueError("文本列表为空")
         
+        self._load_model()
         try:
-            embeddings = self.model.encode(texts, convert_to_tensor=False, show_progress_bar=False)
-            return np.array(embeddings).astype(np.float32)
+            return self.embedding_service.encode(texts)
         except Exception as e:
             logger.exception(f"创建向量嵌入时出错: {str(e)}")
             raise RuntimeError(f"创建向量嵌入失败: {str(e)}")
@@ -167,50 +533,55 @@ class FlashRAGService:
         if not query or not self.index:
             raise ValueError("查询为空或索引未初始化")
         
+        # 先应用其他worker进程对知识库的修改，避免检索本进程过期的索引
+        try:
+            self.sync()
+        except Exception as e:
+            logger.warning(f"同步FlashRAG索引失败，继续使用当前索引检索: {str(e)}")
+        
         # 检查缓存
         cache_key = self._generate_cache_key(query, top_k)
         cached_result = self.cache.get(cache_key)
-        if cached_result:
+        if cached_result is not None:
             logger.info(f"从缓存中检索结果: {query}")
             return cached_result
+        generation = self.cache.current_generation()
         
         try:
             # 生成查询的向量表示
-            if not self.model:
-                raise RuntimeError("向量模型未初始化，无法执行搜索")
-            
-            query_vector = self.model.encode([query], convert_to_tensor=False, show_progress_bar=False)
-            query_vector = np.array(query_vector).astype(np.float32)
+            # 并发查询合并为一次前向计算
+            query_vector = self.embedding_service.encode_queries([query])
             
             # 搜索最近的向量
-            distances, indices = self.index.search(query_vector, top_k)
+            with self._lock:
+                distances, indices = self.index.search(query_vector, top_k)
+                hits = [(i, self.chunk_store.get(int(idx))) for i, idx in enumerate(indices[0])]
             
             # 获取搜索结果
             results = []
-            for i, idx in enumerate(indices[0]):
-                if idx != -1 and idx < len(self.document_map):  # 确保索引有效
-                    chunk_id = list(self.document_map.keys())[idx]
-                    doc = self.document_map[chunk_id]
-                    
-                    # 计算相似度分数（从L2距离转换为相似度）
-                    max_distance = 100  # 假设的最大距离值
-                    similarity = max(0, 1 - (distances[0][i] / max_distance))
-                    
-                    result = {
-                        'id': doc['original_id'],
-                        'chunk_id': chunk_id,
-                        'title': doc['title'],
-                        'content': doc['content'],
-                        'similarity': float(similarity),
-                        'metadata': doc.get('metadata', {})
-                    }
-                    results.append(result)
+            for i, doc in hits:
+                if doc is None:  # 确保索引有效
+                    continue
+                
+                # 计算相似度分数（从L2距离转换为相似度）
+                max_distance = 100  # 假设的最大距离值
+                similarity = max(0, 1 - (distances[0][i] / max_distance))
+                
+                result = {
+                    'id': doc['original_id'],
+                    'chunk_id': doc['chunk_id'],
+                    'title': doc['title'],
+                    'content': doc['content'],
+                    'similarity': float(similarity),
+                    'metadata': doc.get('metadata', {})
+                }
+                results.append(result)
             
             # 使用相似度进行排序
             results = sorted(results, key=lambda x: x['similarity'], reverse=True)
             
             # 添加到缓存
-            self._add_to_cache(cache_key, results)
+            self.cache.set(cache_key, results, generation=generation)
             
             return results
         except Exception as e:
@@ -227,22 +598,10 @@ class FlashRAGService:
             key_str = f"{query.lower().strip()}:{top_k}"
         return hashlib.md5(key_str.encode()).hexdigest()
     
-    def _add_to_cache(self, key, value):
-        """添加到缓存"""
-        # 如果缓存已满，移除最早的项
-        if len(self.cache) >= self.cache_size:
-            # 简单实现：直接清除一半的缓存
-            keys = list(self.cache.keys())
-            for old_key in keys[:len(keys)//2]:
-                del self.cache[old_key]
-        
-        # 添加新项到缓存
-        self.cache[key] = value
-    
     def generate_answer(self, query, context, provider="deepseek"):
         """
         生成问题的答案
-        使用RAG系统让语言模型基于上下文生成答案
+        先查询语义缓存：之前有足够相似的问题、检索到的文档块相同、并且由同一个提供商回答时直接复用其回答
         
         Args:
             query: 用户问题
@@ -252,12 +611,31 @@ class FlashRAGService:
         Returns:
             包含答案和来源的结果
         """
-        import requests
-        import os
-        import json
-        import time
+        if self.semantic_cache is None or not isinstance(query, str):
+            return self._generate_answer_uncached(query, context, provider)
+        
+        chunk_ids = [doc['chunk_id'] for doc in context]
+        generation = self.semantic_cache.current_generation()
+        # 查询向量在检索时已编码，这里通常命中查询向量缓存
+        query_vector = self.embedding_service.encode_queries([query])[0]
+        cached_answer = self.semantic_cache.lookup(query_vector, chunk_ids, provider)
+        if cached_answer is not None:
+            return cached_answer
+        
+        result = self._generate_answer_uncached(query, context, provider)
+        if result.get('success'):
+            # 按实际回答的提供商保存，路由改用其他提供商时，不会被当作首选提供商的回答复用
+            answered_by = result['data']['provider']
+            self.semantic_cache.store(query_vector, chunk_ids, answered_by, result, generation=generation)
+        return result
+    
+    def _build_answer_prompt(self, context):
+        """
+        根据检索到的文档构建系统提示
         
-        # 整理上下文
+        Returns:
+            (系统提示, 来源列表)
+        """
         formatted_context = ""
         sources = []
         
@@ -268,120 +646,56 @@ class FlashRAGService:
                 "id": doc['id']
             })
         
-        # 构建系统提示
         system_prompt = f"""你是一个智能问答助手。请基于以下文档内容回答用户的问题。
 如果文档中没有相关信息，请诚实地说不知道，不要编造答案。
 回答时引用文档编号，如"根据文档1，..."。
 
 {formatted_context}"""
+        return system_prompt, sources
+    
+    def _generate_answer_uncached(self, query, context, provider="deepseek"):
+        """
+        调用语言模型生成问题的答案
+        使用RAG系统让语言模型基于上下文生成答案；由LLM路由决定实际使用的提供商，
+        首选提供商不可用时改用其他已配置的提供商，开启对冲时响应过慢会发出对冲请求
         
-        # 获取API设置
-        DEEPSEEK_API_URL = os.environ.get("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
-        DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "")
-        OPENAI_API_URL = os.environ.get("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
-        OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
-        OLLAMA_API_URL = os.environ.get("OLLAMA_API_URL", "http://localhost:11434/api/chat")
-        
-        try:
-            answer = ""
-            
-            if provider == "deepseek" and DEEPSEEK_API_KEY:
-                # 调用DeepSeek API
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-                }
-                payload = {
-                    "model": "deepseek-chat",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": query}
-                    ],
-                    "temperature": 0.7
-                }
-                response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=60)
-                if response.status_code == 200:
-                    data = response.json()
-                    answer = data["choices"][0]["message"]["content"]
-                else:
-                    error_msg = f"DeepSeek API调用失败: {response.status_code} - {response.text}"
-                    logger.error(error_msg)
-                    return {
-                        "success": False,
-                        "message": error_msg
-                    }
-            
-            elif provider == "openai" and OPENAI_API_KEY:
-                # 调用OpenAI API
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {OPENAI_API_KEY}"
-                }
-                payload = {
-                    "model": "gpt-3.5-turbo",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": query}
-                    ],
-                    "temperature": 0.7
-                }
-                response = requests.post(OPENAI_API_URL, headers=headers, json=payload, timeout=60)
-                if response.status_code == 200:
-                    data = response.json()
-                    answer = data["choices"][0]["message"]["content"]
-                else:
-                    error_msg = f"OpenAI API调用失败: {response.status_code} - {response.text}"
-                    logger.error(error_msg)
-                    return {
-                        "success": False,
-                        "message": error_msg
-                    }
-            
-            elif provider == "ollama":
-                # 调用Ollama API
-                payload = {
-                    "model": "llama2",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": query}
-                    ]
-                }
-                response = requests.post(OLLAMA_API_URL, json=payload, timeout=60)
-                if response.status_code == 200:
-                    data = response.json()
-                    answer = data["message"]["content"]
-                else:
-                    error_msg = f"Ollama API调用失败: {response.status_code} - {response.text}"
-                    logger.error(error_msg)
-                    return {
-                        "success": False,
-                        "message": error_msg
-                    }
+        Args:
+            query: 用户问题
+            context: 检索到的文档内容
+            provider: 首选的AI服务提供商
             
-            # 如果没有获取到答案，返回错误信息
-            if not answer:
-                provider_error = {
-                    "deepseek": "DeepSeek API密钥未设置或调用失败",
-                    "openai": "OpenAI API密钥未设置或调用失败",
-                    "ollama": "Ollama服务未启动或调用失败"
-                }.get(provider, f"未知的提供商: {provider}")
-                
-                error_msg = f"无法获取答案: {provider_error}"
-                logger.error(error_msg)
-                return {
-                    "success": False,
-                    "message": error_msg
-                }
+        Returns:
+            包含答案和来源的结果
+        """
+        # 整理上下文，构建系统提示
+        system_prompt, sources = self._build_answer_prompt(context)
+        
+        providers = configured_providers(provider, ('deepseek', 'openai', 'ollama'))
+        if not providers:
+            provider_error = {
+                "deepseek": "DeepSeek API密钥未设置或调用失败",
+                "openai": "OpenAI API密钥未设置或调用失败",
+                "ollama": "Ollama服务未启动或调用失败"
+            }.get(provider, f"未知的提供商: {provider}")
             
+            error_msg = f"无法获取答案: {provider_error}"
+            logger.error(error_msg)
             return {
-                "success": True,
-                "data": {
-                    "answer": answer,
-                    "sources": sources,
-                    "model": f"FlashRAG+{provider}"
-                }
+                "success": False,
+                "message": error_msg
             }
         
+        try:
+            answered_by, answer = llm_router.call(
+                provider, lambda p: self._request_answer(p, query, system_prompt), providers
+            )
+        except LLMGatewayError as e:
+            error_msg = f"{provider} API调用失败: {str(e)}"
+            logger.error(error_msg)
+            return {
+                "success": False,
+                "message": error_msg
+            }
         except Exception as e:
             error_msg = f"生成答案时出错: {str(e)}"
             logger.exception(error_msg)
@@ -389,6 +703,78 @@ class FlashRAGService:
                 "success": False,
                 "message": error_msg
             }
+        
+        return {
+            "success": True,
+            "data": {
+                "answer": answer,
+                "sources": sources,
+                "model": f"FlashRAG+{answered_by}",
+                "provider": answered_by
+            }
+        }
+    
+    def _request_answer(self, provider, query, system_prompt):
+        """
+        向指定的提供商请求回答
+        
+        Args:
+            provider: AI服务提供商
+            query: 用户问题
+            system_prompt: 系统提示
+            
+        Returns:
+            回答文本
+            
+        Raises:
+            LLMGatewayError: 请求失败、返回空回答或提供商处于熔断状态
+        """
+        import os
+        
+        # 获取API设置
+        DEEPSEEK_API_URL = os.environ.get("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
+        DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "")
+        OPENAI_API_URL = os.environ.get("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+        OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
+        OLLAMA_API_URL = os.environ.get("OLLAMA_API_URL", "http://localhost:11434/api/chat")
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": query}
+        ]
+        
+        if provider in ("deepseek", "openai"):
+            # 调用DeepSeek或OpenAI API
+            url, api_key, model = {
+                "deepseek": (DEEPSEEK_API_URL, DEEPSEEK_API_KEY, "deepseek-chat"),
+                "openai": (OPENAI_API_URL, OPENAI_API_KEY, "gpt-3.5-turbo")
+            }[provider]
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {api_key}"
+            }
+            payload = {
+                "model": model,
+                "messages": messages,
+                "temperature": 0.7
+            }
+            response = retry_policy.post(provider, url, json=payload, headers=headers, timeout=60)
+            answer = response.json()["choices"][0]["message"]["content"]
+        elif provider == "ollama":
+            # 调用Ollama API
+            payload = {
+                "model": "llama2",
+                "messages": messages,
+                "stream": False
+            }
+            response = retry_policy.post("ollama", OLLAMA_API_URL, json=payload, timeout=60)
+            answer = response.json()["message"]["content"]
+        else:
+            raise LLMGatewayError(f"未知的提供商: {provider}")
+        
+        if not answer:
+            raise LLMGatewayError(f"{provider} 返回了空回答")
+        return answer
     
     def rag_query(self, query, provider="deepseek", top_k=3):
         """
@@ -404,17 +790,29 @@ class FlashRAGService:
             包含答案和来源的结果
         """
         try:
+            # 检查持久化问答缓存（其他worker进程或重启前生成的回答）
+            kb_version = self.knowledge_base.content_hash() if self.answer_cache is not None else None
+            if kb_version is not None:
+                answer_key = f"flashrag:{self._generate_cache_key(query, f'{top_k}:{provider}')}"
+                cached_answer = self.answer_cache.get(answer_key, kb_version)
+                if cached_answer is not None:
+                    logger.info(f"从持久化缓存中获取回答: {query}")
+                    return cached_answer
+            
             # 1. 检索相关文档
             relevant_docs = self.search(query, top_k=top_k)
             
             # 2. 基于检索到的文档生成答案
             if relevant_docs:
-                return self.generate_answer(query, relevant_docs, provider)
+                result = self.generate_answer(query, relevant_docs, provider)
+                # 缓存键按请求的提供商区分，由其他提供商回答时不保存
+                if (kb_version is not None and result.get('success') and result['data'].get('provider', provider) == provider
+                        and self.knowledge_base.content_hash() == kb_version):
+                    self.answer_cache.set(answer_key, kb_version, result)
+                return result
             else:
                 # 如果没有检索到相关文档，直接使用DeepSeek进行回答
-                import requests
                 import os
-                import json
                 
                 # 获取DeepSeek API设置
                 DEEPSEEK_API_URL = os.environ.get("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
@@ -443,26 +841,25 @@ class FlashRAGService:
                         ],
                         "temperature": 0.7
                     }
-                    response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=60)
-                    if response.status_code == 200:
-                        data = response.json()
-                        answer = data["choices"][0]["message"]["content"]
-                        
-                        return {
-                            "success": True,
-                            "data": {
-                                "answer": answer,
-                                "sources": [],
-                                "model": "DeepSeek AI"
-                            }
-                        }
-                    else:
-                        error_msg = f"DeepSeek API调用失败: {response.status_code} - {response.text}"
-                        logger.error(error_msg)
-                        return {
-                            "success": False,
-                            "message": error_msg
+                    response = retry_policy.post("deepseek", DEEPSEEK_API_URL, json=payload, headers=headers, timeout=60)
+                    data = response.json()
+                    answer = data["choices"][0]["message"]["content"]
+                    
+                    return {
+                        "success": True,
+                        "data": {
+                            "answer": answer,
+                            "sources": [],
+                            "model": "DeepSeek AI"
                         }
+                    }
+                except LLMGatewayError as e:
+                    error_msg = f"DeepSeek API调用失败: {str(e)}"
+                    logger.error(error_msg)
+                    return {
+                        "success": False,
+                        "message": error_msg
+                    }
                 except Exception as e:
                     error_msg = f"调用DeepSeek时出错: {str(e)}"
                     logger.exception(error_msg)
@@ -477,6 +874,90 @@ class FlashRAGService:
                 "success": False,
                 "message": error_msg
             }
+    
+    def stream_rag_query(self, query, provider="deepseek", top_k=3):
+        """
+        执行完整的FlashRAG查询，流式返回答案
+        检索完成后先返回来源，之后逐段转发模型生成的文本；命中缓存时一次返回完整答案
+        
+        Args:
+            query: 用户问题
+            provider: AI服务提供商
+            top_k: 检索的文档数量
+            
+        Yields:
+            (事件名, 数据)：sources事件包含来源列表，delta事件包含content，done事件包含model，error事件包含message
+        """
+        # 检查持久化问答缓存
+        kb_version = self.knowledge_base.content_hash() if self.answer_cache is not None else None
+        answer_key = f"flashrag:{self._generate_cache_key(query, f'{top_k}:{provider}')}"
+        if kb_version is not None:
+            cached_answer = self.answer_cache.get(answer_key, kb_version)
+            if cached_answer is not None:
+                yield from self._replay_answer(cached_answer)
+                return
+        
+        # 1. 检索相关文档
+        relevant_docs = self.search(query, top_k=top_k)
+        
+        if relevant_docs:
+            system_prompt, sources = self._build_answer_prompt(relevant_docs)
+            model = f"FlashRAG+{provider}"
+            temperature = 0.7
+        else:
+            # 没有检索到相关文档时直接使用DeepSeek回答，与rag_query一致
+            system_prompt = "你是一个智能问答助手。请回答用户的问题。如果你不确定答案，请诚实地说不知道。"
+            sources = []
+            provider, model, temperature = "deepseek", "DeepSeek AI", 0.7
+        
+        # 检查语义问答缓存
+        use_semantic_cache = self.semantic_cache is not None and relevant_docs and isinstance(query, str)
+        if use_semantic_cache:
+            chunk_ids = [doc['chunk_id'] for doc in relevant_docs]
+            generation = self.semantic_cache.current_generation()
+            query_vector = self.embedding_service.encode_queries([query])[0]
+            cached_answer = self.semantic_cache.lookup(query_vector, chunk_ids, provider)
+            if cached_answer is not None:
+                yield from self._replay_answer(cached_answer)
+                return
+        
+        # 2. 流式生成答案
+        yield 'sources', {'sources': sources}
+        parts = []
+        try:
+            for content in stream_chat_completion(query, system_prompt, provider, temperature=temperature, max_tokens=None):
+                parts.append(content)
+                yield 'delta', {'content': content}
+        except LLMStreamError as e:
+            logger.error(f"流式生成答案时出错: {str(e)}")
+            yield 'error', {'message': f"生成答案时出错: {str(e)}"}
+            return
+        if not parts:
+            yield 'error', {'message': f"无法获取答案: {provider} 没有返回内容"}
+            return
+        
+        result = {
+            "success": True,
+            "data": {
+                "answer": ''.join(parts),
+                "sources": sources,
+                "model": model
+            }
+        }
+        if use_semantic_cache:
+            # 流式接口不经过路由，回答的就是请求的提供商
+            answered_by = provider
+            self.semantic_cache.store(query_vector, chunk_ids, answered_by, result, generation=generation)
+        if relevant_docs and kb_version is not None and self.knowledge_base.content_hash() == kb_version:
+            self.answer_cache.set(answer_key, kb_version, result)
+        yield 'done', {'model': model}
+    
+    def _replay_answer(self, result):
+        """以流式事件返回缓存的完整答案"""
+        data = result.get('data', {})
+        yield 'sources', {'sources': data.get('sources', [])}
+        yield 'delta', {'content': data.get('answer', '')}
+        yield 'done', {'model': data.get('model'), 'cached': True}
 
 # 创建FlashRAG服务实例
 flashrag_service = FlashRAGService() 
\ No newline at end of file
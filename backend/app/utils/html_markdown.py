@@ -0,0 +1,534 @@
+"""
+单遍HTML转Markdown
+原来的 extract_main_content 先用BeautifulSoup建树，再对标题、段落、列表、代码、表格、引用、链接、图片各遍历并替换一次，
+选择正文区域时还要把每个候选元素序列化成字符串比较长度，大页面上耗时和内存都很高。
+
+这里复用BeautifulSoup的html.parser事件转换（分词、实体、重复属性和空白处理与建树时完全相同），解析时只建立轻量的节点，
+同时记录正文候选元素和它们的序列化长度所需的信息；解析结束后只对选中的区域遍历一次，按原实现各轮替换的先后顺序
+直接算出每个元素被替换成的文本，输出与原实现逐字相同。
+遇到原实现依赖树修改细节、难以等价推算的少见结构（标题中嵌套标签、过深的嵌套等）时返回None，由调用方使用原实现
+
+安装了lxml时可以用parser='lxml'改由libxml2分词（与BeautifulSoup(html, 'lxml')接收相同的事件），解析速度快数倍，
+输出与使用lxml的原实现相同；格式错误的页面上libxml2补全标签的方式与html.parser不同，因此默认仍使用html.parser
+"""
+
+import re
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from bs4.builder import HTMLParserTreeBuilder
+from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+from bs4.element import CData, Comment, Declaration, Doctype, ProcessingInstruction
+
+try:
+    from lxml import etree
+except ImportError:  # lxml是可选依赖
+    etree = None
+
+# 支持的解析器
+PARSERS = ('html.parser', 'lxml')
+LXML_AVAILABLE = etree is not None
+
+# 正文容器的选择器，按优先级排列
+CONTENT_SELECTORS = [
+    'article', 'main', '.content', '#content', '.post', '.article',
+    '.post-content', '.entry-content', '.main-content', '#main-content',
+    '.blog-post', '.document', '.documentation', '.page-content', '.container'
+]
+
+# 提取前整体删除的元素
+REMOVED_TAGS = frozenset(['script', 'style', 'iframe', 'form'])
+
+# 原实现替换各类元素的先后顺序：先替换的元素的文本会出现在后替换的元素中，反之则不会
+REPLACE_ORDER = {
+    'h1': 1, 'h2': 1, 'h3': 1, 'h4': 1, 'h5': 1, 'h6': 1,
+    'p': 2, 'ul': 3, 'ol': 4, 'pre': 5, 'code': 6, 'table': 7, 'blockquote': 8, 'a': 9, 'img': 10
+}
+FINAL_ORDER = 11
+
+# 嵌套超过该深度时使用原实现（避免递归过深）
+MAX_DEPTH = 250
+
+_BUILDER = HTMLParserTreeBuilder(store_line_numbers=False)
+_VOID_TAGS = _BUILDER.empty_element_tags
+_PRESERVE_WHITESPACE_TAGS = _BUILDER.preserve_whitespace_tags
+_STRING_CONTAINERS = _BUILDER.string_containers
+_LIST_ATTRIBUTES = _BUILDER.cdata_list_attributes
+_UNIVERSAL_LIST_ATTRIBUTES = _LIST_ATTRIBUTES.get('*', ())
+_ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+_NON_WHITESPACE = re.compile(r'\S+')
+_META_CHARSET = re.compile(r'((^|;)\s*charset=)([^;]*)', re.M)
+_OUTPUT_ENCODING = 'utf-8'
+
+_TAG_SELECTORS = frozenset(s for s in CONTENT_SELECTORS if s[0] not in '.#')
+_CLASS_SELECTORS = frozenset(s[1:] for s in CONTENT_SELECTORS if s[0] == '.')
+_ID_SELECTORS = frozenset(s[1:] for s in CONTENT_SELECTORS if s[0] == '#')
+
+# 特殊字符串序列化时的前后缀长度
+_MARKUP_AFFIXES = {
+    Comment: len('<!---->'),
+    CData: len('<![CDATA[]]>'),
+    Declaration: len('<??>'),
+    Doctype: len('<!DOCTYPE >\n'),
+    ProcessingInstruction: len('<?>')
+}
+
+_UNSET = object()
+
+
+def _escaped_length(text: str) -> int:
+    """按minimal格式转义 & < > 之后的长度"""
+    return len(text) + 4 * text.count('&') + 3 * text.count('<') + 3 * text.count('>')
+
+
+class _Markup:
+    """注释、CDATA、ruby注音等特殊字符串；visible表示是否计入get_text"""
+
+    __slots__ = ('text', 'visible', 'size')
+
+    def __init__(self, text: str, visible: bool, size: int):
+        self.text = text
+        self.visible = visible
+        self.size = size
+
+
+class _Element:
+    """轻量的元素节点"""
+
+    __slots__ = ('name', 'attrs', 'children', 'replacement', 'size')
+
+    def __init__(self, name: str, attrs: Dict[str, str]):
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+        self.replacement = _UNSET
+        self.size = None
+
+    @property
+    def is_empty_element(self) -> bool:
+        return not self.children and self.name in _VOID_TAGS
+
+
+class _TreeSink:
+    """代替BeautifulSoup对象接收html.parser或lxml的事件，建立轻量节点树并记录正文候选元素"""
+
+    ROOT_TAG_NAME = '[document]'
+
+    def __init__(self):
+        self.builder = _BUILDER
+        self.contains_replacement_characters = False
+        self.root = _Element(self.ROOT_TAG_NAME, {})
+        self.stack = [self.root]
+        self.removed = [False]
+        self.open_counts: Dict[str, int] = {}
+        self.preserve_whitespace_stack = []
+        self.string_container_stack = []
+        self.current_data = []
+        self.by_tag: Dict[str, List[_Element]] = {name: [] for name in _TAG_SELECTORS}
+        self.by_class: Dict[str, List[_Element]] = {name: [] for name in _CLASS_SELECTORS}
+        self.by_id: Dict[str, _Element] = {}
+        self.body = None
+        self.titles = []
+        self.unsupported = False
+
+    def handle_starttag(self, name, namespace, nsprefix, attrs, sourceline=None, sourcepos=None, namespaces=None):
+        self.endData()
+        element = _Element(name, attrs)
+        removed = self.removed[-1]
+        if name in REMOVED_TAGS:
+            # 删除的元素不挂到父元素上，但仍然入栈，结束标签照常匹配
+            removed = True
+        else:
+            self.stack[-1].children.append(element)
+        self.stack.append(element)
+        self.removed.append(removed)
+        self.open_counts[name] = self.open_counts.get(name, 0) + 1
+        if name in _PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace_stack.append(element)
+        if name in _STRING_CONTAINERS:
+            self.string_container_stack.append(element)
+        if len(self.stack) > MAX_DEPTH:
+            self.unsupported = True
+        if not removed:
+            self._index(element)
+        return element
+
+    def _index(self, element: _Element) -> None:
+        name = element.name
+        attrs = element.attrs
+        if name in _TAG_SELECTORS:
+            self.by_tag[name].append(element)
+        classes = attrs.get('class')
+        if classes:
+            for cls in set(_NON_WHITESPACE.findall(classes)) & _CLASS_SELECTORS:
+                self.by_class[cls].append(element)
+        ident = attrs.get('id')
+        if ident in _ID_SELECTORS and ident not in self.by_id:
+            self.by_id[ident] = element
+        if name == 'body' and self.body is None:
+            self.body = element
+        elif name == 'title':
+            self.titles.append((element, tuple(self.stack[:-1])))
+
+    def _pop(self) -> None:
+        element = self.stack.pop()
+        self.removed.pop()
+        self.open_counts[element.name] -= 1
+        if self.preserve_whitespace_stack and self.preserve_whitespace_stack[-1] is element:
+            self.preserve_whitespace_stack.pop()
+        if self.string_container_stack and self.string_container_stack[-1] is element:
+            self.string_container_stack.pop()
+
+    def handle_endtag(self, name, nsprefix=None):
+        self.endData()
+        # 与BeautifulSoup相同：弹出到最近一个同名的元素，没有打开的同名元素时忽略
+        if not self.open_counts.get(name):
+            return
+        while len(self.stack) > 1:
+            element = self.stack[-1]
+            self._pop()
+            if element.name == name:
+                break
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def endData(self, containerClass=None):
+        if not self.current_data:
+            return
+        data = ''.join(self.current_data)
+        self.current_data = []
+        # 与BeautifulSoup相同：不在pre/textarea中时，只有空白的字符串合并为一个空格或换行
+        if not self.preserve_whitespace_stack and not data.strip(_ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+
+        parent = self.stack[-1]
+        if containerClass is not None:
+            affix = _MARKUP_AFFIXES.get(containerClass)
+            if affix is None:
+                self.unsupported = True
+                return
+            parent.children.append(_Markup(data, containerClass is CData, len(data) + affix))
+        elif self.string_container_stack:
+            # ruby注音、template中的字符串不计入get_text
+            parent.children.append(_Markup(data, False, _escaped_length(data)))
+        else:
+            parent.children.append(data)
+
+    def close(self) -> None:
+        self.endData()
+
+
+class _ClosedEmptyElements(dict):
+    """
+    代替BeautifulSoupHTMLParser.already_closed_empty_element列表：按标签名计数，
+    每个结束标签的检查从遍历整个列表（图片、input多的页面上越来越慢）变为O(1)
+    """
+
+    def __contains__(self, name):
+        return self.get(name, 0) > 0
+
+    def append(self, name):
+        self[name] = self.get(name, 0) + 1
+
+    def remove(self, name):
+        self[name] -= 1
+
+
+class _LxmlTarget:
+    """lxml解析器的事件目标，按BeautifulSoup的lxml构建器的方式转发给_TreeSink"""
+
+    def __init__(self, sink: _TreeSink):
+        self.sink = sink
+        self.data = sink.handle_data
+
+    def start(self, tag, attrib, nsmap=None):
+        self.sink.handle_starttag(tag, None, None, dict(attrib))
+
+    def end(self, tag):
+        self.sink.handle_endtag(tag)
+
+    def comment(self, text):
+        self._special(text, Comment)
+
+    def pi(self, target, data):
+        self._special(f'{target} {data}', ProcessingInstruction)
+
+    def doctype(self, name, pubid, system):
+        self._special(str(Doctype.for_name_and_ids(name, pubid, system)), Doctype)
+
+    def _special(self, text, container_class):
+        self.sink.endData()
+        self.sink.handle_data(text)
+        self.sink.endData(container_class)
+
+    def close(self):
+        return None
+
+
+class _Converter:
+    """按原实现的替换规则把选中区域转换为文本"""
+
+    def __init__(self, url: str):
+        parsed_source = urlparse(url)
+        self.origin = f"{parsed_source.scheme}://{parsed_source.netloc}"
+
+    def strings(self, node: _Element, order: int, out: List[str]) -> None:
+        """node在替换顺序order之前的各轮替换完成后，get_text会拼接的字符串"""
+        for child in node.children:
+            child_type = type(child)
+            if child_type is str:
+                out.append(child)
+            elif child_type is _Markup:
+                if child.visible:
+                    out.append(child.text)
+            else:
+                child_order = REPLACE_ORDER.get(child.name)
+                if child_order is not None and child_order < order:
+                    replacement = self.replace(child)
+                    if replacement is not None:
+                        out.append(replacement)
+                        continue
+                self.strings(child, order, out)
+
+    def text(self, node: _Element, order: int) -> str:
+        out = []
+        self.strings(node, order, out)
+        return ''.join(out)
+
+    def find_all(self, node: _Element, order: int, names, out: List[_Element]) -> List[_Element]:
+        """替换顺序order之前的各轮替换完成后，node中仍然存在的指定元素（文档顺序）"""
+        for child in node.children:
+            if type(child) is not _Element:
+                continue
+            child_order = REPLACE_ORDER.get(child.name)
+            if child_order is not None and child_order < order and self.replace(child) is not None:
+                continue
+            if child.name in names:
+                out.append(child)
+            self.find_all(child, order, names, out)
+        return out
+
+    def absolute(self, link: str) -> str:
+        return self.origin + link if link.startswith('/') else link
+
+    def replace(self, node: _Element) -> Optional[str]:
+        """node在它那一轮被替换成的字符串；不满足替换条件（没有href的链接、没有src的图片）时返回None"""
+        if node.replacement is not _UNSET:
+            return node.replacement
+
+        name = node.name
+        order = REPLACE_ORDER[name]
+        replacement = None
+        if order == 1:
+            replacement = f'\n{"#" * int(name[1])} {self.text(node, order).strip()}\n\n'
+        elif name == 'p':
+            replacement = f'{self.text(node, order).strip()}\n\n'
+        elif name == 'ul':
+            items = ''.join(f'- {self.text(li, order).strip()}\n' for li in self.find_all(node, order, ('li',), []))
+            replacement = f'\n{items}\n'
+        elif name == 'ol':
+            items = ''.join(f'{i}. {self.text(li, order).strip()}\n'
+                            for i, li in enumerate(self.find_all(node, order, ('li',), []), 1))
+            replacement = f'\n{items}\n'
+        elif name == 'pre':
+            replacement = f'\n```\n{self.text(node, order).strip()}\n```\n\n'
+        elif name == 'code':
+            replacement = f'`{self.text(node, order).strip()}`'
+        elif name == 'table':
+            rows = ''
+            for row in self.find_all(node, order, ('tr',), []):
+                cells = self.find_all(row, order, ('td', 'th'), [])
+                rows += ' | '.join(self.text(cell, order).strip() for cell in cells) + '\n'
+            replacement = f'\n表格内容：\n{rows}\n'
+        elif name == 'blockquote':
+            quote_text = self.text(node, order).strip().replace('\n', '\n> ')
+            replacement = f'\n> {quote_text}\n\n'
+        elif name == 'a':
+            link_text = self.text(node, order).strip()
+            link_url = node.attrs.get('href', '')
+            if link_url and link_text:
+                replacement = f'[{link_text}]({self.absolute(link_url)})'
+        elif name == 'img':
+            img_url = node.attrs.get('src', '')
+            if img_url:
+                replacement = f'\n![{node.attrs.get("alt", "图片")}]({self.absolute(img_url)})\n'
+
+        node.replacement = replacement
+        return replacement
+
+
+def _attribute_value(name: str, key: str, value: str, attrs: Dict[str, str]) -> str:
+    """属性序列化时的值：多值属性规范化空白，meta中声明的编码替换为输出编码"""
+    if key in _UNIVERSAL_LIST_ATTRIBUTES or key in _LIST_ATTRIBUTES.get(name, ()):
+        return ' '.join(_NON_WHITESPACE.findall(value))
+    if name == 'meta':
+        if key == 'charset':
+            return _OUTPUT_ENCODING
+        if (key == 'content' and 'charset' not in attrs
+                and attrs.get('http-equiv', '').lower() == 'content-type'):
+            return _META_CHARSET.sub(lambda match: match.group(1) + _OUTPUT_ENCODING, value)
+    return value
+
+
+def serialized_length(node: _Element) -> int:
+    """len(str(tag))：元素按BeautifulSoup的minimal格式序列化后的长度"""
+    if node.size is not None:
+        return node.size
+    name = node.name
+    size = len(name) + 2
+    attrs = node.attrs
+    for key, value in attrs.items():
+        value = _attribute_value(name, key, value, attrs)
+        size += len(key) + 4 + _escaped_length(value)
+        if '"' in value and "'" in value:
+            size += 5 * value.count('"')
+    if node.is_empty_element:
+        size += 1
+    else:
+        size += len(name) + 3
+        for child in node.children:
+            child_type = type(child)
+            if child_type is str:
+                size += _escaped_length(child)
+            elif child_type is _Markup:
+                size += child.size
+            else:
+                size += serialized_length(child)
+    node.size = size
+    return size
+
+
+def _title_string(node: _Element):
+    """soup.title.string；标题中嵌套元素时返回_UNSET"""
+    if len(node.children) != 1:
+        return None
+    child = node.children[0]
+    if type(child) is str:
+        return child
+    if type(child) is _Markup:
+        return child.text
+    return _UNSET
+
+
+def _find_title(titles, main_content: _Element):
+    """
+    原实现在替换完成后才读取soup.title：正文区域中被替换掉的元素里的标题已经不在树中，
+    返回第一个仍在树中的标题的文本；标题中嵌套元素时返回_UNSET
+    """
+    for element, ancestors in titles:
+        if main_content in ancestors:
+            inner = ancestors[ancestors.index(main_content) + 1:]
+            if any(ancestor.replacement is not _UNSET and ancestor.replacement is not None for ancestor in inner):
+                continue
+        title = _title_string(element)
+        if title is _UNSET:
+            return _UNSET
+        return title.strip() if title else ''
+    return ''
+
+
+class MarkdownExtractor:
+    """
+    增量提取：网页边下载边交给解析器，只保留轻量的节点树，下载完成后close得到结果
+    结果与 html_to_markdown 相同
+    """
+
+    def __init__(self, url: str, parser: str = 'html.parser'):
+        """
+        Args:
+            url: 网页地址，用于把以/开头的链接和图片地址转换为绝对地址
+            parser: 'html.parser' 或 'lxml'（需要安装lxml）
+        """
+        if parser not in PARSERS:
+            raise ValueError(f"不支持的解析器: {parser}")
+        if parser == 'lxml' and not LXML_AVAILABLE:
+            raise ValueError("使用lxml解析器需要先安装lxml")
+        self.url = url
+        self.parser = parser
+        self.sink = _TreeSink()
+        self._fed = False
+        if parser == 'lxml':
+            self._parser = etree.HTMLParser(target=_LxmlTarget(self.sink), recover=True, huge_tree=False)
+        else:
+            self._parser = BeautifulSoupHTMLParser(self.sink, convert_charrefs=False)
+            self._parser.already_closed_empty_element = _ClosedEmptyElements()
+
+    def feed(self, text: str) -> None:
+        """读入一段HTML，可以在任意位置分段"""
+        if not self._fed:
+            # 与BeautifulSoup的lxml构建器相同：去掉开头的BOM
+            if self.parser == 'lxml' and text and text[0] == '\ufeff':
+                text = text[1:]
+            self._fed = True
+        self._parser.feed(text)
+
+    def close(self) -> Optional[Dict[str, str]]:
+        """
+        结束解析并转换
+
+        Returns:
+            {'title', 'content', 'url'}；遇到不支持的结构时返回None
+        """
+        if not self._fed:
+            self.feed('')
+        self._parser.close()
+        sink = self.sink
+        sink.close()
+        if sink.unsupported:
+            return None
+
+        # 选择正文区域：第一个有匹配元素的选择器中序列化后最长的元素
+        main_content = None
+        for selector in CONTENT_SELECTORS:
+            if selector[0] == '.':
+                elements = sink.by_class[selector[1:]]
+            elif selector[0] == '#':
+                element = sink.by_id.get(selector[1:])
+                elements = [element] if element is not None else []
+            else:
+                elements = sink.by_tag[selector]
+            if elements:
+                main_content = elements[0] if len(elements) == 1 else max(elements, key=serialized_length)
+                break
+        if main_content is None:
+            main_content = sink.body or sink.root
+        if main_content.name in _STRING_CONTAINERS:
+            return None
+
+        strings = []
+        try:
+            _Converter(self.url).strings(main_content, FINAL_ORDER, strings)
+        except RecursionError:
+            return None
+        text = '\n'.join(strings)
+        title = _find_title(sink.titles, main_content)
+        if title is _UNSET:
+            return None
+        text = re.sub(r'\n{3,}', '\n\n', text)  # 将多个换行减少为最多两个
+        text = text.strip()
+
+        return {
+            'title': title,
+            'content': text,
+            'url': self.url
+        }
+
+
+def html_to_markdown(html: str, url: str, parser: str = 'html.parser') -> Optional[Dict[str, str]]:
+    """
+    提取网页正文并转换为Markdown，结果与使用同一解析器的 crawler.extract_main_content_bs4 相同
+
+    Args:
+        html: 网页HTML
+        url: 网页地址，用于把以/开头的链接和图片地址转换为绝对地址
+        parser: 'html.parser' 或 'lxml'（需要安装lxml）
+
+    Returns:
+        {'title', 'content', 'url'}；遇到不支持的结构时返回None
+    """
+    extractor = MarkdownExtractor(url, parser)
+    if not isinstance(html, str):
+        return None
+    extractor.feed(html)
+    return extractor.close()
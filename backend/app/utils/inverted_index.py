@@ -0,0 +1,240 @@
+"""
+知识库倒排索引与BM25排序
+支持中英文混合文本：连续的中日韩字符切分为二元组（bigram），英文和数字按词切分
+"""
+
+import re
+import math
+import heapq
+import logging
+from collections import Counter
+from typing import Dict, List, Set, Tuple, Iterable, Optional
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 中日韩统一表意文字、扩展A区、兼容表意文字，以及日文假名和韩文音节
+_CJK_RANGES = '぀-ヿ㐀-䶿一-鿿가-힯豈-﫿'
+_TOKEN_PATTERN = re.compile(f'[{_CJK_RANGES}]+|[a-z0-9]+')
+_CJK_PATTERN = re.compile(f'[{_CJK_RANGES}]')
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 2  # 标题中的词按该倍数计入词频
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将文本切分为索引词
+    连续的中日韩字符输出相邻二元组（单个字符时输出该字符），英文和数字转小写后按词输出
+
+    Args:
+        text: 待切分的文本
+
+    Returns:
+        索引词列表（保留重复，按出现顺序）
+    """
+    tokens = []
+    if not text:
+        return tokens
+
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        run = match.group()
+        if _CJK_PATTERN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class InvertedIndex:
+    """
+    内存倒排索引
+    倒排表记录 词 -> {文档ID: 词频}，同时维护文档长度和总长度，供BM25打分使用；
+    所有统计量随文档增删增量更新
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        初始化倒排索引
+
+        Args:
+            k1: BM25词频饱和参数
+            b: BM25文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}  # 词 -> {文档ID: 词频}
+        self.doc_terms: Dict[str, Set[str]] = {}  # 文档ID -> 文档包含的词集合
+        self.doc_lengths: Dict[str, int] = {}  # 文档ID -> 文档长度（加权词数）
+        self.total_length = 0
+        self._idf: Dict[str, float] = {}  # IDF缓存，文档集合变化时清空
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def add_document(self, doc_id: str, title: str, content: str) -> None:
+        """
+        索引文档，已存在的文档会先移除旧的索引词
+
+        Args:
+            doc_id: 文档ID
+            title: 文档标题
+            content: 文档内容
+        """
+        self.remove_document(doc_id)
+
+        frequencies = Counter(tokenize(content))
+        for term in tokenize(title):
+            frequencies[term] += TITLE_WEIGHT
+
+        self.doc_terms[doc_id] = set(frequencies)
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+
+        length = sum(frequencies.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+        self._idf.clear()
+
+    def remove_document(self, doc_id: str) -> None:
+        """从索引中移除文档"""
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+
+        for term in terms:
+            doc_ids = self.postings.get(term)
+            if doc_ids is not None:
+                doc_ids.pop(doc_id, None)
+                if not doc_ids:
+                    del self.postings[term]
+
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+        self._idf.clear()
+
+    def build(self, documents: Dict[str, Dict]) -> None:
+        """根据全部文档重建索引"""
+        self.postings = {}
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self._idf = {}
+        for doc_id, doc in documents.items():
+            self.add_document(doc_id, doc.get('title', ''), doc.get('content', ''))
+        logger.info(f"已构建倒排索引：{len(self.doc_terms)}篇文档，{len(self.postings)}个索引词")
+
+    def idf(self, term: str) -> float:
+        """
+        词的逆文档频率（BM25的平滑形式，恒为非负）
+        结果按词缓存，文档增删后失效
+        """
+        value = self._idf.get(term)
+        if value is None:
+            document_frequency = len(self.postings.get(term, ()))
+            total = len(self.doc_terms)
+            value = math.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+            self._idf[term] = value
+        return value
+
+    def score(self, query: str, doc_ids: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """
+        计算查询与文档的BM25得分
+        按词遍历倒排表累加得分，只有包含查询词的文档会出现在结果中
+
+        Args:
+            query: 查询文本
+            doc_ids: 只为这些文档打分，None表示全部文档
+
+        Returns:
+            文档ID到得分的字典
+        """
+        if not self.doc_terms:
+            return {}
+
+        allowed = set(doc_ids) if doc_ids is not None else None
+        average_length = self.total_length / len(self.doc_terms) or 1.0
+        k1, b = self.k1, self.b
+        lengths = self.doc_lengths
+        scores: Dict[str, float] = {}
+
+        for term, query_frequency in Counter(tokenize(query)).items():
+            doc_frequencies = self.postings.get(term)
+            if not doc_frequencies:
+                continue
+
+            weight = self.idf(term) * query_frequency
+            for doc_id, frequency in doc_frequencies.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = k1 * (1 - b + b * lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * frequency * (k1 + 1) / (frequency + norm)
+        return scores
+
+    def top_k(self, query: str, k: int = 3, doc_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """
+        返回BM25得分最高的k个文档，使用堆选取，不对全部结果排序
+
+        Args:
+            query: 查询文本
+            k: 返回数量
+            doc_ids: 只在这些文档中排序，None表示全部文档
+
+        Returns:
+            (文档ID, 得分) 列表，按得分从高到低排列
+        """
+        scores = self.score(query, doc_ids)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def match_all(self, terms: Iterable[str]) -> Set[str]:
+        """
+        返回包含全部索引词的文档ID
+        从最短的倒排表开始求交集，开销只取决于最稀有的词
+        """
+        posting_lists = []
+        for term in set(terms):
+            doc_ids = self.postings.get(term)
+            if not doc_ids:
+                return set()
+            posting_lists.append(doc_ids)
+
+        if not posting_lists:
+            return set()
+
+        posting_lists.sort(key=len)
+        result = set(posting_lists[0])
+        for doc_ids in posting_lists[1:]:
+            result.intersection_update(doc_ids)
+            if not result:
+                break
+        return result
+
+    def candidates(self, query: str) -> Optional[Set[str]]:
+        """
+        子串查询的候选文档：包含查询中全部中文二元组和内部英文词的文档
+        文档包含查询子串时，查询中连续的中文字符在文档中也连续，必然产生相同的二元组；
+        两侧都有非字母数字字符的英文和数字词（如"使用docker部署"中的"docker"）在文档中边界相同，必然是完整的索引词。
+        位于查询开头或结尾的英文片段可能只是文档中某个词的一部分（如"rag"之于"FlashRAG"），不参与过滤，
+        因此只由这样的片段组成的查询（如"rag"、"flash rag"）仍需全量扫描。候选集是子串匹配结果的超集，调用方需再做精确校验
+
+        Args:
+            query: 查询文本
+
+        Returns:
+            候选文档ID集合；查询中没有可用于过滤的索引词时返回None，表示需要全量扫描
+        """
+        query = query.lower()
+        terms = []
+        for match in _TOKEN_PATTERN.finditer(query):
+            run = match.group()
+            if _CJK_PATTERN.match(run):
+                terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+            elif match.start() > 0 and match.end() < len(query):
+                terms.append(run)
+        if not terms:
+            return None
+        return self.match_all(terms)
@@ -0,0 +1,294 @@
+"""
+持久化任务队列
+任务保存在本地SQLite文件（WAL模式）中，由后台worker线程池领取执行，重启后未完成的任务继续执行。
+worker领取任务时获得一段租期，执行过程中汇报阶段会续期；进程崩溃后租期到期的任务会被重新领取，
+同一台机器上的多个进程可以共享一个队列。相同去重键的任务在执行中或刚完成时共用同一个任务
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 未完成的任务状态
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+class JobHandle:
+    """worker执行任务时使用的句柄，用于汇报当前阶段"""
+
+    def __init__(self, queue: 'JobQueue', job_id: str, params: Dict[str, Any]):
+        self.queue = queue
+        self.id = job_id
+        self.params = params
+
+    def update(self, stage: str) -> None:
+        """记录当前阶段并续期"""
+        self.queue._update_stage(self.id, stage)
+
+
+class JobQueue:
+    """
+    基于SQLite的持久化任务队列
+    任务处理函数通过register按任务类型注册，参数和结果都需要可以JSON序列化
+    """
+
+    def __init__(self, path: str, workers: int = 2, lease: float = 600, max_attempts: int = 3,
+                 dedup_ttl: float = 3600, retention: float = 7 * 86400, poll_interval: float = 1.0):
+        """
+        初始化任务队列
+
+        Args:
+            path: SQLite数据库文件路径
+            workers: worker线程数
+            lease: 领取任务的租期（秒），超过租期未续期的任务视为执行它的进程已退出
+            max_attempts: 一个任务最多被领取的次数
+            dedup_ttl: 已完成的任务在多长时间内（秒）可以被相同的提交复用
+            retention: 已结束的任务保留多久（秒）
+            poll_interval: 没有任务时检查队列的间隔（秒），用于发现其他进程提交的任务
+        """
+        self.path = path
+        self.workers = workers
+        self.lease = lease
+        self.max_attempts = max(1, max_attempts)
+        self.dedup_ttl = dedup_ttl
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, Callable[[JobHandle, Dict[str, Any]], Any]] = {}
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """当前线程的数据库连接，首次使用时创建数据库和表"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, dedup_key TEXT, params TEXT NOT NULL, "
+                "status TEXT NOT NULL, stage TEXT, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL, lease_until REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedup_key ON jobs (dedup_key)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def register(self, kind: str, handler: Callable[[JobHandle, Dict[str, Any]], Any]) -> None:
+        """
+        注册任务处理函数
+
+        Args:
+            kind: 任务类型
+            handler: 处理函数，参数为 (JobHandle, 任务参数)，返回值作为任务结果，抛出异常时任务失败
+        """
+        self._handlers[kind] = handler
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'stage': row['stage'],
+            'attempts': row['attempts'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at']
+        }
+
+    def submit(self, kind: str, params: Dict[str, Any], dedup_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        提交任务
+
+        Args:
+            kind: 任务类型
+            params: 任务参数
+            dedup_key: 去重键，已有相同去重键的任务在执行中或在dedup_ttl内完成时直接返回该任务
+
+        Returns:
+            (任务, 是否新建)
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        self.start()
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if dedup_key is not None:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE dedup_key = ? AND (status IN (?, ?) OR (status = 'completed' AND finished_at > ?)) "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (dedup_key, *ACTIVE_STATUSES, now - self.dedup_ttl)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    self.deduplicated += 1
+                    return self._to_dict(row), False
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, dedup_key, params, status, created_at) VALUES (?, ?, ?, ?, 'pending', ?)",
+                (job_id, kind, dedup_key, json.dumps(params, ensure_ascii=False), now)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        self.submitted += 1
+        self._wakeup.set()
+        return self.get(job_id), True
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """按ID查询任务，不存在时返回None"""
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """领取最早提交的待执行任务（包括租期已过的执行中任务）"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'pending' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1", (now,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row['attempts'] >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                        (f"任务执行{row['attempts']}次都未完成", now, row['id'])
+                    )
+                    self.failed += 1
+                    continue
+                if row['status'] == 'running':
+                    logger.warning(f"任务 {row['id']} 的租期已过，重新执行")
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_until = ? "
+                    "WHERE id = ?", (now, now + self.lease, row['id'])
+                )
+                conn.execute("COMMIT")
+                return row
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _update_stage(self, job_id: str, stage: str) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET stage = ?, lease_until = ? WHERE id = ? AND status = 'running'",
+            (stage, time.time() + self.lease, job_id)
+        )
+
+    def _finish(self, job_id: str, result: Any = None, error: Optional[str] = None) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+            ('failed' if error is not None else 'completed',
+             json.dumps(result, ensure_ascii=False) if error is None else None, error, time.time(), job_id)
+        )
+
+    def run_next(self) -> bool:
+        """领取并执行一个任务，没有待执行的任务时返回False"""
+        row = self._claim()
+        if row is None:
+            return False
+
+        job = JobHandle(self, row['id'], json.loads(row['params']))
+        handler = self._handlers.get(row['kind'])
+        try:
+            if handler is None:
+                raise ValueError(f"未注册的任务类型: {row['kind']}")
+            result = handler(job, job.params)
+        except Exception as e:
+            logger.exception(f"任务失败: {row['kind']} ({row['id']}): {str(e)}")
+            self._finish(row['id'], error=str(e))
+            self.failed += 1
+        else:
+            self._finish(row['id'], result=result)
+            self.completed += 1
+            logger.info(f"任务完成: {row['kind']} ({row['id']})")
+        return True
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.run_next():
+                    continue
+            except sqlite3.Error as e:
+                logger.warning(f"读取任务队列失败: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        """启动worker线程（进程fork之后在子进程中重新启动），并清理过期的已结束任务"""
+        if self._pid == os.getpid() or self.workers <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self.prune()
+            self._threads = [
+                threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止worker线程，正在执行的任务会继续执行完"""
+        with self._lock:
+            self._stop.set()
+            self._wakeup.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+            self._pid = None
+
+    def prune(self) -> int:
+        """删除结束超过retention的任务，返回删除的条数"""
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND finished_at < ?",
+            (time.time() - self.retention,)
+        )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """队列统计"""
+        counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            'workers': self.workers,
+            'jobs': counts,
+            'submitted': self.submitted,
+            'deduplicated': self.deduplicated,
+            'completed': self.completed,
+            'failed': self.failed
+        }
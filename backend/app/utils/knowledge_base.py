@@ -1,15 +1,30 @@
 import logging
 import json
 import os
-from typing import Dict, List, Any, Optional
+import heapq
+import hashlib
+import threading
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
+from .inverted_index import InvertedIndex
+from .file_lock import FileLock
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 日志中的操作数达到该值（且不少于快照中的文档数）时合并到快照文件
+JOURNAL_COMPACT_MIN_OPS = 1000
+
 class KnowledgeBase:
-    """知识库管理类，用于存储和检索技术总结内容"""
+    """
+    知识库管理类，用于存储和检索技术总结内容
+    
+    存储由快照文件（knowledge_base.json）和追加写的操作日志（knowledge_base.json.journal）组成：
+    每次增删只向日志追加一行JSON，日志足够长时合并写入新快照并原子替换；
+    多个进程共享同一知识库时，通过refresh()只读取日志新增的部分即可看到其他进程的更新；
+    refresh()可能在任意请求线程中修改文档和倒排索引，读取它们的方法都需要持有self._lock
+    """
     
     def __init__(self, storage_path: str = None):
         """
@@ -19,32 +34,248 @@ class KnowledgeBase:
             storage_path: 知识库存储路径，默认为app目录下的knowledge_base.json
         """
         self.storage_path = storage_path or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'knowledge_base.json')
+        self.journal_path = f"{self.storage_path}.journal"
         self.documents = {}
+        self.index = InvertedIndex()  # 关键词倒排索引与BM25统计，随文档增删增量维护
+        self.generation = 0  # 文档集合每次变化时递增，供缓存判断是否失效
+        self._doc_hashes: Dict[str, int] = {}  # 文档ID -> 文档内容摘要
+        self._content_hash = 0  # 所有文档摘要的异或，与文档顺序无关，可增量维护
+        self._lock = threading.RLock()
+        self._snapshot_state = None  # 已加载快照的 (inode, mtime, size)
+        self._journal_inode = None  # 已读取日志的inode，压缩后日志被替换为新文件
+        self._journal_offset = 0  # 已读取到的日志字节偏移
+        self._journal_ops = 0  # 日志中的操作数
+        self._snapshot_docs = 0  # 快照中的文档数，压缩间隔随之按倍数增长，批量写入的总开销保持线性
         self._load_knowledge_base()
     
+    def _file_lock(self):
+        """跨进程写锁"""
+        return FileLock(f"{self.storage_path}.lock")
+    
+    @staticmethod
+    def _stat_state(path: str):
+        """返回文件的 (inode, mtime, size)，文件不存在时返回None"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    
     def _load_knowledge_base(self):
-        """从文件加载知识库"""
+        """从快照和日志加载知识库"""
+        with self._lock, self._file_lock():
+            self._reload()
+    
+    def _reload(self):
+        """重新加载快照并重放日志，调用方需持有锁"""
+        self.documents = {}
+        self._doc_hashes = {}
+        self._content_hash = 0
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._journal_ops = 0
+        self._snapshot_docs = 0
         try:
             if os.path.exists(self.storage_path):
+                # 先记录快照状态，快照损坏时也不会反复重新加载
+                self._snapshot_state = self._stat_state(self.storage_path)
                 with open(self.storage_path, 'r', encoding='utf-8') as f:
-                    self.documents = json.load(f)
+                    documents = json.load(f)
+                for doc_id, doc in documents.items():
+                    self._apply({'op': 'put', 'id': doc_id, 'doc': doc}, update_index=False)
+                self._snapshot_docs = len(self.documents)
                 logger.info(f"已从{self.storage_path}加载知识库，共{len(self.documents)}篇文档")
             else:
                 logger.info(f"知识库文件{self.storage_path}不存在，将创建新的知识库")
-                self.documents = {}
                 self._save_knowledge_base()
         except Exception as e:
             logger.error(f"加载知识库时出错: {str(e)}")
             self.documents = {}
-    
-    def _save_knowledge_base(self):
-        """保存知识库到文件"""
+            self._doc_hashes = {}
+            self._content_hash = 0
+        
         try:
-            with open(self.storage_path, 'w', encoding='utf-8') as f:
-                json.dump(self.documents, f, ensure_ascii=False, indent=2)
-            logger.info(f"已保存知识库到{self.storage_path}，共{len(self.documents)}篇文档")
+            entries = self._read_journal() or []
+            for entry in entries:
+                self._apply(entry, update_index=False)
+            self._journal_ops = len(entries)
+            if entries:
+                logger.info(f"已从日志重放{len(entries)}条操作，当前共{len(self.documents)}篇文档")
         except Exception as e:
-            logger.error(f"保存知识库时出错: {str(e)}")
+            logger.error(f"重放知识库日志时出错: {str(e)}")
+        
+        self.index.build(self.documents)
+        self.generation += 1
+    
+    def _read_journal(self) -> Optional[List[Dict]]:
+        """
+        读取日志中上次读取位置之后新增的完整记录，调用方需持有锁
+        
+        Returns:
+            新增的操作列表；日志已被压缩替换或截断、需要整体重新加载时返回None
+        """
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            return [] if self._journal_inode is None else None
+        
+        with f:
+            st = os.fstat(f.fileno())
+            if self._journal_inode is None:
+                self._journal_inode = st.st_ino
+                self._journal_offset = 0
+            elif st.st_ino != self._journal_inode or st.st_size < self._journal_offset:
+                return None
+            
+            f.seek(self._journal_offset)
+            data = f.read()
+        
+        # 只处理以换行结尾的完整记录，写到一半的行留到下次读取
+        end = data.rfind(b'\n') + 1
+        self._journal_offset += end
+        entries = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"跳过无法解析的知识库日志记录: {line[:100]!r}")
+        return entries
+    
+    def _catch_up(self) -> bool:
+        """读取其他进程的更新，调用方需持有线程锁和文件锁；返回是否有变化"""
+        if self._stat_state(self.storage_path) != self._snapshot_state:
+            self._reload()
+            return True
+        
+        entries = self._read_journal()
+        if entries is None:
+            self._reload()
+            return True
+        if not entries:
+            return False
+        
+        for entry in entries:
+            self._apply(entry)
+        self._journal_ops += len(entries)
+        self.generation += 1
+        return True
+    
+    def get_generation(self) -> int:
+        """同步其他进程的修改后返回文档集合的版本号，供缓存判断是否失效"""
+        self.refresh()
+        return self.generation
+    
+    def refresh(self) -> bool:
+        """
+        同步其他进程对知识库的修改
+        快照和日志都没有变化时只需两次stat；否则只读取日志新增的部分，快照被替换时才整体重新加载
+        
+        Returns:
+            知识库是否发生了变化
+        """
+        with self._lock:
+            try:
+                if self._stat_state(self.storage_path) == self._snapshot_state:
+                    journal_state = self._stat_state(self.journal_path)
+                    if journal_state is None and self._journal_inode is None:
+                        return False
+                    if journal_state is not None and (journal_state[0], journal_state[2]) == (self._journal_inode, self._journal_offset):
+                        return False
+                
+                with self._file_lock():
+                    return self._catch_up()
+            except Exception as e:
+                logger.warning(f"同步知识库更新时出错: {str(e)}")
+                return False
+    
+    @staticmethod
+    def document_digest(doc_id: str, doc: Dict) -> int:
+        """计算文档内容摘要（不包括更新时间），其他索引据此判断文档是否需要重新处理"""
+        payload = json.dumps([doc_id, doc.get('title'), doc.get('content'), doc.get('metadata')],
+                             ensure_ascii=False, sort_keys=True, default=str)
+        return int.from_bytes(hashlib.sha256(payload.encode('utf-8')).digest()[:16], 'big')
+    
+    def _apply(self, entry: Dict, update_index: bool = True):
+        """在内存中应用一条日志操作"""
+        doc_id = str(entry['id'])
+        old_hash = self._doc_hashes.pop(doc_id, None)
+        if old_hash is not None:
+            self._content_hash ^= old_hash
+        
+        if entry['op'] == 'put':
+            doc = entry['doc']
+            self.documents[doc_id] = doc
+            digest = self.document_digest(doc_id, doc)
+            self._doc_hashes[doc_id] = digest
+            self._content_hash ^= digest
+            if update_index:
+                self.index.add_document(doc_id, doc.get('title', ''), doc.get('content', ''))
+        elif entry['op'] == 'del':
+            self.documents.pop(doc_id, None)
+            if update_index:
+                self.index.remove_document(doc_id)
+    
+    def _append(self, entries: List[Dict]):
+        """
+        将操作写入日志并应用到内存，所有操作只写入一次、只同步一次磁盘
+        
+        Args:
+            entries: 操作列表
+        """
+        with self._lock, self._file_lock():
+            # 先同步其他进程的写入，保证日志偏移正确
+            self._catch_up()
+            
+            data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries).encode('utf-8')
+            with open(self.journal_path, 'ab') as f:
+                # 丢弃进程崩溃时残留的半行，避免与新记录拼接成无法解析的一行
+                if f.tell() > self._journal_offset:
+                    f.truncate(self._journal_offset)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                self._journal_inode = os.fstat(f.fileno()).st_ino
+                self._journal_offset = f.tell()
+            
+            for entry in entries:
+                self._apply(entry)
+            self._journal_ops += len(entries)
+            self.generation += 1
+            
+            if self._journal_ops >= max(JOURNAL_COMPACT_MIN_OPS, self._snapshot_docs):
+                self._compact()
+    
+    def _compact(self):
+        """将日志合并到快照，调用方需持有锁"""
+        self._save_knowledge_base()
+        
+        # 用空文件原子替换日志，其他进程通过inode变化得知日志已被压缩
+        tmp_path = f"{self.journal_path}.{os.getpid()}.tmp"
+        open(tmp_path, 'wb').close()
+        os.replace(tmp_path, self.journal_path)
+        self._journal_inode = os.stat(self.journal_path).st_ino
+        self._journal_offset = 0
+        logger.info(f"已将{self._journal_ops}条日志操作合并到知识库快照")
+        self._journal_ops = 0
+    
+    def compact(self):
+        """立即将日志合并到快照"""
+        with self._lock, self._file_lock():
+            self._catch_up()
+            if self._journal_ops:
+                self._compact()
+    
+    def _save_knowledge_base(self):
+        """将当前文档原子写入快照文件，调用方需持有锁"""
+        tmp_path = f"{self.storage_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.documents, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.storage_path)
+        self._snapshot_state = self._stat_state(self.storage_path)
+        self._snapshot_docs = len(self.documents)
+        logger.info(f"已保存知识库到{self.storage_path}，共{len(self.documents)}篇文档")
     
     def add_document(self, doc_id: str, title: str, content: str, metadata: Dict = None):
         """
@@ -57,19 +288,39 @@ class KnowledgeBase:
             metadata: 文档元数据
         """
         try:
-            self.documents[doc_id] = {
-                'title': title,
-                'content': content,
-                'metadata': metadata or {},
-                'updated_at': datetime.now().isoformat()
-            }
-            self._save_knowledge_base()
+            self.add_documents([{'id': doc_id, 'title': title, 'content': content, 'metadata': metadata}])
             logger.info(f"已添加文档到知识库: {title} (ID: {doc_id})")
             return True
         except Exception as e:
             logger.error(f"添加文档到知识库时出错: {str(e)}")
             return False
     
+    def add_documents(self, documents: List[Dict]) -> int:
+        """
+        批量添加文档到知识库，只写入一次日志
+        
+        Args:
+            documents: 文档列表，每个文档包含id、title、content，可选metadata
+            
+        Returns:
+            添加的文档数
+        """
+        now = datetime.now().isoformat()
+        entries = [{
+            'op': 'put',
+            'id': str(doc['id']),
+            'doc': {
+                'title': doc['title'],
+                'content': doc['content'],
+                'metadata': doc.get('metadata') or {},
+                'updated_at': now
+            }
+        } for doc in documents]
+        if entries:
+            self._append(entries)
+            logger.info(f"已批量添加{len(entries)}篇文档到知识库")
+        return len(entries)
+    
     def remove_document(self, doc_id: str):
         """
         从知识库中移除文档
@@ -78,19 +329,27 @@ class KnowledgeBase:
             doc_id: 文档ID
         """
         try:
-            if doc_id in self.documents:
-                title = self.documents[doc_id]['title']
-                del self.documents[doc_id]
-                self._save_knowledge_base()
-                logger.info(f"已从知识库中移除文档: {title} (ID: {doc_id})")
-                return True
-            else:
-                logger.warning(f"文档ID {doc_id} 不存在于知识库中")
-                return False
+            with self._lock:
+                self.refresh()
+                if doc_id in self.documents:
+                    title = self.documents[doc_id]['title']
+                    self._append([{'op': 'del', 'id': doc_id}])
+                    logger.info(f"已从知识库中移除文档: {title} (ID: {doc_id})")
+                    return True
+                else:
+                    logger.warning(f"文档ID {doc_id} 不存在于知识库中")
+                    return False
         except Exception as e:
             logger.error(f"从知识库中移除文档时出错: {str(e)}")
             return False
     
+    def content_hash(self) -> str:
+        """
+        知识库内容哈希，只取决于文档ID、标题、内容和元数据，与写入顺序和存储方式无关
+        """
+        self.refresh()
+        return f"{self._content_hash:032x}"
+    
     def get_document(self, doc_id: str) -> Optional[Dict]:
         """
         获取知识库中的文档
@@ -101,29 +360,79 @@ class KnowledgeBase:
         Returns:
             文档内容，如果不存在则返回None
         """
+        self.refresh()
         return self.documents.get(doc_id)
     
-    def search_documents(self, query: str) -> List[Dict]:
+    def search_documents(self, query: str, top_k: Optional[int] = None) -> List[Dict]:
         """
         搜索知识库中的文档
         
         Args:
             query: 搜索关键词
+            top_k: 最多返回的文档数，默认返回全部匹配文档
             
         Returns:
-            匹配的文档列表
+            匹配的文档列表，按BM25得分从高到低排列
         """
+        with self._lock:
+            self.refresh()
+            query_lower = query.lower()
+            
+            # 先用倒排索引缩小候选范围，再在候选文档中精确匹配
+            candidate_ids = self.index.candidates(query)
+            if candidate_ids is None:
+                candidates = self.documents.items()
+            else:
+                candidates = ((doc_id, self.documents[doc_id]) for doc_id in sorted(candidate_ids) if doc_id in self.documents)
+            
+            matched_ids = [
+                doc_id for doc_id, doc in candidates
+                # 在标题和内容中搜索关键词
+                if query_lower in doc['title'].lower() or query_lower in doc['content'].lower()
+            ]
+            
+            # 按BM25得分排序（稳定排序，得分相同的文档保持原有顺序）
+            scores = self.index.score(query, matched_ids)
+            scored = [(doc_id, scores.get(doc_id, 0.0)) for doc_id in matched_ids]
+            if top_k:
+                ranked = heapq.nlargest(top_k, scored, key=lambda item: item[1])
+            else:
+                ranked = sorted(scored, key=lambda item: item[1], reverse=True)
+            documents = [(doc_id, score, self.documents[doc_id]) for doc_id, score in ranked]
+        
         results = []
-        query_lower = query.lower()
+        for doc_id, score, doc in documents:
+            # 添加文档ID和得分
+            doc_copy = doc.copy()
+            doc_copy['id'] = doc_id
+            doc_copy['bm25_score'] = score
+            results.append(doc_copy)
         
-        for doc_id, doc in self.documents.items():
-            # 在标题和内容中搜索关键词
-            if query_lower in doc['title'].lower() or query_lower in doc['content'].lower():
-                # 添加文档ID
-                doc_copy = doc.copy()
-                doc_copy['id'] = doc_id
-                results.append(doc_copy)
+        return results
+    
+    def rank_documents(self, query: str, top_k: int = 3) -> List[Dict]:
+        """
+        按BM25得分返回与查询最相关的文档，不要求包含完整查询
         
+        Args:
+            query: 查询文本
+            top_k: 返回数量
+            
+        Returns:
+            文档列表，包含id和bm25_score字段，按得分从高到低排列
+        """
+        with self._lock:
+            self.refresh()
+            ranked = [(doc_id, score, self.documents.get(doc_id)) for doc_id, score in self.index.top_k(query, top_k)]
+        
+        results = []
+        for doc_id, score, doc in ranked:
+            if doc is None:
+                continue
+            doc_copy = doc.copy()
+            doc_copy['id'] = doc_id
+            doc_copy['bm25_score'] = score
+            results.append(doc_copy)
         return results
     
     def get_all_documents(self) -> Dict[str, Dict]:
@@ -131,9 +440,22 @@ class KnowledgeBase:
         获取知识库中的所有文档
         
         Returns:
-            所有文档的字典
+            所有文档的字典（在锁内复制，其他进程的更新不会在遍历过程中修改它）
+        """
+        with self._lock:
+            self.refresh()
+            return dict(self.documents)
+    
+    def snapshot(self) -> Tuple[int, Dict[str, Dict], Dict[str, int]]:
+        """
+        同步其他进程的修改后，在锁内复制文档集合
+        
+        Returns:
+            (版本号, 文档ID -> 文档, 文档ID -> 内容摘要)，三者对应同一时刻的知识库
         """
-        return self.documents
+        with self._lock:
+            self.refresh()
+            return self.generation, dict(self.documents), dict(self._doc_hashes)
 
 # 创建知识库实例
 knowledge_base = KnowledgeBase() 
\ No newline at end of file
@@ -2,12 +2,13 @@ import os
 import logging
 import json
 from openai import OpenAI
-import requests
 from typing import Dict, Any, Optional, List
 import time
 import random
 import re
 from collections import Counter
+from .llm_gateway import LLMGatewayError
+from .llm_retry import retry_policy
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -274,84 +275,75 @@ class LLMService:
             
             # 调用API
             logger.info("发送DeepSeek API请求")
-            response = requests.post(api_url, headers=headers, json=payload, timeout=120)
+            response = retry_policy.post("deepseek", api_url, json=payload, headers=headers, timeout=120)
             
-            # 检查响应状态
-            if response.status_code == 200:
-                result = response.json()
-                summary = result["choices"][0]["message"]["content"]
-                
-                # 提取标题 - 改进标题提取逻辑
-                generated_title = ""
-                
-                # 首先尝试从第一个标题中提取
-                for line in summary.split('\n'):
-                    if line.startswith('# '):
-                        # 移除"技术总结："或"技术总结"前缀
-                        title = line[2:].strip()
-                        if title.startswith("技术总结："):
-                            title = title[5:].strip()
-                        elif title.startswith("技术总结"):
-                            title = title[4:].strip()
-                        
-                        # 如果标题只是"技术总结"，则跳过
-                        if title and title != "技术总结" and title != "：" and title != ":":
-                            generated_title = title
-                            break
-                
-                # 如果没有找到合适的标题，尝试从内容中提取关键词生成标题
-                if not generated_title:
-                    # 尝试从URL或内容中提取关键词
-                    if "opencv" in content.lower() or "camera" in content.lower() or "vid" in content.lower() or "pid" in content.lower():
-                        generated_title = "通过VID和PID获取OpenCV摄像头索引"
-                    elif "deepseek" in content.lower() or "llama" in content.lower() or "微调" in content or "fine-tuning" in content.lower():
-                        generated_title = "大模型微调与部署实战"
-                    elif "docker" in content.lower() or "容器" in content:
-                        generated_title = "Docker容器技术与应用实践"
-                    else:
-                        # 默认标题
-                        generated_title = "技术详解与实践指南"
-                
-                # 提取关键技术标签
-                extracted_tags = ""
-                tag_section_found = False
-                for line in summary.split('\n'):
-                    if tag_section_found and line.strip() and not line.startswith('#'):
-                        extracted_tags = line.strip()
+            result = response.json()
+            summary = result["choices"][0]["message"]["content"]
+            
+            # 提取标题 - 改进标题提取逻辑
+            generated_title = ""
+            
+            # 首先尝试从第一个标题中提取
+            for line in summary.split('\n'):
+                if line.startswith('# '):
+                    # 移除"技术总结："或"技术总结"前缀
+                    title = line[2:].strip()
+                    if title.startswith("技术总结："):
+                        title = title[5:].strip()
+                    elif title.startswith("技术总结"):
+                        title = title[4:].strip()
+                    
+                    # 如果标题只是"技术总结"，则跳过
+                    if title and title != "技术总结" and title != "：" and title != ":":
+                        generated_title = title
                         break
-                    if "关键技术标签" in line or "技术关键词" in line or "技术标签" in line:
-                        tag_section_found = True
-                
-                logger.info("DeepSeek API调用成功")
-                logger.info(f"提取的标题: {generated_title}")
-                logger.info(f"提取的标签: {extracted_tags}")
-                
-                return {
-                    'success': True,
-                    'message': '总结成功',
-                    'data': {
-                        'summary': summary,
-                        'title': generated_title,
-                        'tags': extracted_tags,
-                        'model': 'deepseek-chat',
-                        'provider': 'deepseek'
-                    }
+            
+            # 如果没有找到合适的标题，尝试从内容中提取关键词生成标题
+            if not generated_title:
+                # 尝试从URL或内容中提取关键词
+                if "opencv" in content.lower() or "camera" in content.lower() or "vid" in content.lower() or "pid" in content.lower():
+                    generated_title = "通过VID和PID获取OpenCV摄像头索引"
+                elif "deepseek" in content.lower() or "llama" in content.lower() or "微调" in content or "fine-tuning" in content.lower():
+                    generated_title = "大模型微调与部署实战"
+                elif "docker" in content.lower() or "容器" in content:
+                    generated_title = "Docker容器技术与应用实践"
+                else:
+                    # 默认标题
+                    generated_title = "技术详解与实践指南"
+            
+            # 提取关键技术标签
+            extracted_tags = ""
+            tag_section_found = False
+            for line in summary.split('\n'):
+                if tag_section_found and line.strip() and not line.startswith('#'):
+                    extracted_tags = line.strip()
+                    break
+                if "关键技术标签" in line or "技术关键词" in line or "技术标签" in line:
+                    tag_section_found = True
+            
+            logger.info("DeepSeek API调用成功")
+            logger.info(f"提取的标题: {generated_title}")
+            logger.info(f"提取的标签: {extracted_tags}")
+            
+            return {
+                'success': True,
+                'message': '总结成功',
+                'data': {
+                    'summary': summary,
+                    'title': generated_title,
+                    'tags': extracted_tags,
+                    'model': 'deepseek-chat',
+                    'provider': 'deepseek'
                 }
-            else:
-                logger.error(f"DeepSeek API请求失败: {response.status_code} - {response.text}")
+            }
+        except LLMGatewayError as e:
+            if e.timeout:
+                logger.error(f"DeepSeek API调用超时: {e}")
                 return {
                     'success': False,
-                    'message': f'DeepSeek API请求失败: {response.status_code} - {response.text}',
+                    'message': f'DeepSeek API调用超时，请稍后再试',
                     'data': None
                 }
-        except requests.exceptions.Timeout as e:
-            logger.error(f"DeepSeek API调用超时: {e}")
-            return {
-                'success': False,
-                'message': f'DeepSeek API调用超时，请稍后再试',
-                'data': None
-            }
-        except requests.exceptions.RequestException as e:
             logger.error(f"DeepSeek API请求异常: {e}")
             return {
                 'success': False,
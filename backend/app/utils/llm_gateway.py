@@ -0,0 +1,267 @@
+"""
+LLM网关
+所有对LLM服务（DeepSeek、OpenAI、Ollama）的HTTP请求都经由这里发出。
+网关在后台线程中运行一个事件循环，持有一个长期存在的httpx.AsyncClient：连接池在请求之间复用TCP和TLS连接，
+服务端支持时通过HTTP/2在一个连接上并发多个请求。异步代码直接使用 apost / astream_lines，
+同步代码（Flask视图、后台任务）使用 post / stream_lines，请求会提交到网关的事件循环执行
+"""
+
+import os
+import queue
+import asyncio
+import logging
+import threading
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 连接池配置
+LLM_HTTP2 = os.environ.get("LLM_HTTP2", "true").lower() == "true"
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "60"))
+API_CONNECT_TIMEOUT = int(os.environ.get("API_CONNECT_TIMEOUT", "10"))
+
+_END = object()
+
+
+class LLMGatewayError(Exception):
+    """LLM请求失败：连接失败、超时，或流式请求返回了非200状态码"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, timeout: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.timeout = timeout
+
+
+class LLMGateway:
+    """
+    LLM网关
+    事件循环和连接池在首次请求时创建；进程fork之后（如gunicorn预加载应用）会在子进程中重新创建
+    """
+
+    def __init__(self, http2: bool = LLM_HTTP2, max_connections: int = LLM_MAX_CONNECTIONS,
+                 max_keepalive: int = LLM_MAX_KEEPALIVE, keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY,
+                 connect_timeout: float = API_CONNECT_TIMEOUT, verify: Any = True):
+        """
+        初始化LLM网关
+
+        Args:
+            http2: 是否启用HTTP/2（通过TLS的ALPN协商，服务端不支持时使用HTTP/1.1）
+            max_connections: 最大连接数
+            max_keepalive: 最多保留的空闲连接数
+            keepalive_expiry: 空闲连接的保留时间（秒）
+            connect_timeout: 连接超时（秒）
+            verify: TLS证书校验，True、CA证书路径或ssl.SSLContext
+        """
+        self.http2 = http2
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.connect_timeout = connect_timeout
+        self.verify = verify
+        self._loop = None
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.connections = 0  # 新建的TCP连接数
+        self.tls_handshakes = 0  # TLS握手次数
+        self.http_versions = Counter()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """启动网关的事件循环和HTTP客户端"""
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='llm-gateway', daemon=True)
+                thread.start()
+                self._client = httpx.AsyncClient(http2=self.http2, limits=self.limits, verify=self.verify)
+                self._pid = os.getpid()
+                self._loop = loop
+        return self._loop
+
+    async def _trace(self, event: str, info: Dict[str, Any]) -> None:
+        """统计新建连接和TLS握手"""
+        if event == 'connection.connect_tcp.complete':
+            self.connections += 1
+        elif event == 'connection.start_tls.complete':
+            self.tls_handshakes += 1
+
+    def _timeout(self, timeout: float) -> httpx.Timeout:
+        return httpx.Timeout(timeout, connect=self.connect_timeout)
+
+    def _wrap_error(self, url: str, e: httpx.HTTPError) -> LLMGatewayError:
+        self.errors += 1
+        if isinstance(e, httpx.TimeoutException):
+            return LLMGatewayError(f"请求{url}超时: {str(e) or type(e).__name__}", timeout=True)
+        return LLMGatewayError(f"请求{url}失败: {str(e) or type(e).__name__}")
+
+    def _in_gateway_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    async def _apost(self, url, json, headers, timeout) -> httpx.Response:
+        self.requests += 1
+        try:
+            response = await self._client.post(url, json=json, headers=headers, timeout=self._timeout(timeout),
+                                               extensions={'trace': self._trace})
+        except httpx.HTTPError as e:
+            raise self._wrap_error(url, e) from e
+        self.http_versions[response.http_version] += 1
+        return response
+
+    async def _astream_lines(self, url, json, headers, timeout) -> AsyncIterator[str]:
+        self.requests += 1
+        try:
+            async with self._client.stream('POST', url, json=json, headers=headers, timeout=self._timeout(timeout),
+                                           extensions={'trace': self._trace}) as response:
+                self.http_versions[response.http_version] += 1
+                if response.status_code != 200:
+                    await response.aread()
+                    self.errors += 1
+                    raise LLMGatewayError(f"请求失败: {response.status_code} - {response.text[:200]}",
+                                          status_code=response.status_code)
+                async for line in response.aiter_lines():
+                    yield line
+        except httpx.HTTPError as e:
+            raise self._wrap_error(url, e) from e
+
+    def _start_pump(self, put, url, json, headers, timeout):
+        """在网关的事件循环中读取流式响应，每一行（以及结束标记或异常）交给put"""
+        async def pump():
+            try:
+                async for line in self._astream_lines(url, json, headers, timeout):
+                    put(line)
+            except BaseException as e:
+                put(e)
+                raise
+            put(_END)
+        return asyncio.run_coroutine_threadsafe(pump(), self._ensure_loop())
+
+    @staticmethod
+    def _unwrap(item):
+        """处理队列中取出的条目：返回文本行，结束时返回_END，出错时抛出异常"""
+        if isinstance(item, asyncio.CancelledError):
+            return _END
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    async def apost(self, url: str, json: Any = None, headers: Optional[Dict[str, str]] = None,
+                    timeout: float = 60) -> httpx.Response:
+        """
+        发送POST请求并读取完整响应
+        可以在任意事件循环中调用，请求总是在网关的事件循环中执行
+
+        Args:
+            url: 请求地址
+            json: JSON请求体
+            headers: 请求头
+            timeout: 读取超时（秒）
+
+        Returns:
+            httpx.Response，调用方自行检查status_code
+
+        Raises:
+            LLMGatewayError: 连接失败或超时
+        """
+        loop = self._ensure_loop()
+        if self._in_gateway_loop():
+            return await self._apost(url, json, headers, timeout)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._apost(url, json, headers, timeout), loop))
+
+    async def astream_lines(self, url: str, json: Any = None, headers: Optional[Dict[str, str]] = None,
+                            timeout: float = 60) -> AsyncIterator[str]:
+        """
+        发送POST请求，逐行返回流式响应
+
+        Args:
+            url: 请求地址
+            json: JSON请求体
+            headers: 请求头
+            timeout: 两段数据之间的最长间隔（秒）
+
+        Yields:
+            响应的文本行（UTF-8解码）
+
+        Raises:
+            LLMGatewayError: 连接失败、超时或状态码不是200
+        """
+        self._ensure_loop()
+        if self._in_gateway_loop():
+            async for line in self._astream_lines(url, json, headers, timeout):
+                yield line
+            return
+
+        caller = asyncio.get_running_loop()
+        lines: 'asyncio.Queue' = asyncio.Queue()
+        future = self._start_pump(lambda item: caller.call_soon_threadsafe(lines.put_nowait, item),
+                                  url, json, headers, timeout)
+        try:
+            while True:
+                line = self._unwrap(await lines.get())
+                if line is _END:
+                    return
+                yield line
+        finally:
+            future.cancel()
+
+    def post(self, url: str, json: Any = None, headers: Optional[Dict[str, str]] = None,
+             timeout: float = 60) -> httpx.Response:
+        """apost的同步版本"""
+        loop = self._ensure_loop()
+        if self._in_gateway_loop():
+            raise RuntimeError("不能在网关的事件循环中调用同步接口，请使用异步接口")
+        return asyncio.run_coroutine_threadsafe(self._apost(url, json, headers, timeout), loop).result()
+
+    def stream_lines(self, url: str, json: Any = None, headers: Optional[Dict[str, str]] = None,
+                     timeout: float = 60) -> Iterator[str]:
+        """
+        astream_lines的同步版本
+        事件循环收到的每一行通过队列交给调用方线程；调用方提前关闭生成器时取消请求并释放连接
+        """
+        lines: 'queue.Queue' = queue.Queue()
+        future = self._start_pump(lines.put, url, json, headers, timeout)
+        try:
+            while True:
+                line = self._unwrap(lines.get())
+                if line is _END:
+                    return
+                yield line
+        finally:
+            future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """请求和连接统计"""
+        return {
+            'http2': self.http2,
+            'requests': self.requests,
+            'errors': self.errors,
+            'connections': self.connections,
+            'tls_handshakes': self.tls_handshakes,
+            'http_versions': dict(self.http_versions)
+        }
+
+    def close(self) -> None:
+        """关闭连接池和事件循环"""
+        with self._lock:
+            if self._loop is None:
+                return
+            if self._pid == os.getpid():
+                asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+                self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self._client = None
+
+
+# 创建全局实例
+llm_gateway = LLMGateway()
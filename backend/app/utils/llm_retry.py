@@ -0,0 +1,270 @@
+"""
+LLM调用的重试策略和熔断器
+所有LLM请求共用一个重试策略：一次调用的全部尝试（包括等待）不超过总时限，两次尝试之间按带随机抖动的指数退避等待；
+每个提供商有独立的熔断器，连续失败达到阈值后熔断，熔断期间的调用立即失败，由调用方直接使用后备方案，
+避免提供商故障时每个请求都在重试上占住worker线程
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from .llm_gateway import llm_gateway, LLMGatewayError
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 重试配置
+LLM_RETRY_ATTEMPTS = int(os.environ.get("API_MAX_RETRIES", "3"))
+LLM_RETRY_DEADLINE = float(os.environ.get("LLM_RETRY_DEADLINE", "120"))
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", "8"))
+LLM_RETRY_MAX_TOTAL_DELAY = float(os.environ.get("LLM_RETRY_MAX_TOTAL_DELAY", "10"))
+
+# 熔断配置
+LLM_BREAKER_THRESHOLD = int(os.environ.get("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RECOVERY = float(os.environ.get("LLM_BREAKER_RECOVERY", "30"))
+
+# 可以重试的状态码（其余非200状态码说明请求本身有问题，重试无意义）
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+T = TypeVar('T')
+
+
+class CircuitOpenError(LLMGatewayError):
+    """提供商处于熔断状态，调用未发出"""
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    closed：正常放行；连续失败达到阈值后进入open，拒绝所有调用；
+    经过恢复时间后进入half_open，只放行一个探测调用，成功则恢复closed，失败则重新open
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = LLM_BREAKER_THRESHOLD,
+                 recovery_timeout: float = LLM_BREAKER_RECOVERY, clock: Callable[[], float] = time.monotonic):
+        """
+        初始化熔断器
+
+        Args:
+            name: 名称（提供商）
+            failure_threshold: 触发熔断的连续失败次数
+            recovery_timeout: 熔断后多久允许探测调用（秒）
+            clock: 时钟函数，便于测试
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def _refresh(self) -> None:
+        """熔断时间已过时进入half_open，调用方需持有锁"""
+        if self._state == self.OPEN and self.clock() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+
+    def allow(self) -> bool:
+        """是否放行本次调用；放行后调用方必须调用record_success、record_failure或release"""
+        with self._lock:
+            self._refresh()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> float:
+        """距离允许探测调用还有多少秒"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (self.clock() - self._opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release(self) -> None:
+        """调用结果不说明提供商是否健康（如请求本身有误）：不计成功也不计失败，只允许下一个探测调用"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.trips += 1
+                    logger.warning(f"{self.name} 连续失败{self._failures}次，熔断{self.recovery_timeout:g}秒")
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+                self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        return {
+            'state': state,
+            'consecutive_failures': self._failures,
+            'retry_after': round(self.retry_after(), 1),
+            'trips': self.trips,
+            'rejected': self.rejected
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """取得提供商的熔断器"""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(provider, CircuitBreaker(provider))
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """所有提供商的熔断器状态"""
+    return {provider: breaker.stats() for provider, breaker in list(_breakers.items())}
+
+
+class RetryPolicy:
+    """LLM调用的重试策略"""
+
+    def __init__(self, max_attempts: int = LLM_RETRY_ATTEMPTS, deadline: float = LLM_RETRY_DEADLINE,
+                 base_delay: float = LLM_RETRY_BASE_DELAY, max_delay: float = LLM_RETRY_MAX_DELAY,
+                 max_total_delay: float = LLM_RETRY_MAX_TOTAL_DELAY,
+                 breakers: Callable[[str], CircuitBreaker] = get_breaker, sleep: Callable[[float], None] = time.sleep):
+        """
+        初始化重试策略
+
+        Args:
+            max_attempts: 最多尝试次数
+            deadline: 一次调用的总时限（秒），包括所有尝试和等待
+            base_delay: 退避的基础等待时间（秒）
+            max_delay: 单次等待时间上限（秒）
+            max_total_delay: 一次调用中所有等待时间之和的上限（秒），等待会占住请求线程，不宜过长
+            breakers: 按提供商取得熔断器的函数
+            sleep: 等待函数，便于测试
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_total_delay = max_total_delay
+        self.breakers = breakers
+        self.sleep = sleep
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次失败后的等待时间：指数退避，在[0, 上限]内均匀随机，避免多个请求同时重试"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def retryable(error: LLMGatewayError) -> bool:
+        """连接失败、超时和可重试的状态码可以重试"""
+        return error.status_code is None or error.status_code in RETRY_STATUS_CODES
+
+    def call(self, provider: str, attempt: Callable[[float], T], timeout: float,
+             deadline: Optional[float] = None) -> T:
+        """
+        按策略执行一次LLM调用
+
+        Args:
+            provider: 提供商，决定使用哪个熔断器
+            attempt: 执行一次尝试的函数，参数为本次尝试的超时时间，失败时抛出LLMGatewayError
+            timeout: 单次尝试的超时时间（秒），不超过剩余时限
+            deadline: 总时限（秒），默认使用策略的配置
+
+        Returns:
+            attempt的返回值
+
+        Raises:
+            CircuitOpenError: 提供商处于熔断状态
+            LLMGatewayError: 所有尝试都失败、错误不可重试或超出总时限
+        """
+        breaker = self.breakers(provider)
+        budget = self.deadline if deadline is None else deadline
+        start = time.monotonic()
+        attempt_number = 0
+        slept = 0.0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"{provider} 处于熔断状态，{breaker.retry_after():.0f}秒后重试")
+            remaining = budget - (time.monotonic() - start)
+            try:
+                result = attempt(max(0.001, min(timeout, remaining)))
+            except LLMGatewayError as e:
+                if not self.retryable(e):
+                    # 请求本身被拒绝，不能说明服务是否健康，不计入熔断，也不能让half_open的熔断器恢复
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+                # 所有等待之和不超过max_total_delay，用完后不再重试；等待后还要留出剩余时限用于下一次尝试
+                allowance = self.max_total_delay - slept
+                delay = min(self.backoff(attempt_number), allowance)
+                elapsed = time.monotonic() - start
+                if attempt_number == self.max_attempts - 1 or allowance <= 0 or elapsed + delay >= budget:
+                    raise
+                logger.warning(f"调用{provider}失败 (尝试 {attempt_number + 1}/{self.max_attempts})，"
+                               f"{delay:.1f}秒后重试: {str(e)}")
+                self.sleep(delay)
+                slept += delay
+                attempt_number += 1
+                continue
+            except BaseException:
+                breaker.record_failure()
+                raise
+            breaker.record_success()
+            return result
+
+    def post(self, provider: str, url: str, json: Any = None, headers: Optional[Dict[str, str]] = None,
+             timeout: float = 60, deadline: Optional[float] = None) -> httpx.Response:
+        """
+        经由LLM网关发送POST请求，按策略重试
+
+        Returns:
+            状态码为200的响应
+
+        Raises:
+            CircuitOpenError: 提供商处于熔断状态
+            LLMGatewayError: 请求失败，非200状态码也作为失败抛出（status_code为响应的状态码）
+        """
+        def attempt(attempt_timeout: float) -> httpx.Response:
+            response = llm_gateway.post(url, json=json, headers=headers, timeout=attempt_timeout)
+            if response.status_code != 200:
+                raise LLMGatewayError(f"状态码 {response.status_code}: {response.text[:200]}",
+                                      status_code=response.status_code)
+            return response
+        return self.call(provider, attempt, timeout, deadline)
+
+
+# 创建全局实例
+retry_policy = RetryPolicy()
@@ -0,0 +1,299 @@
+"""
+LLM提供商路由
+记录每个提供商最近的响应延迟和错误率，决定一次调用依次尝试哪些提供商：
+首选提供商健康时优先使用，熔断或错误率过高时改用延迟最低的其他提供商；
+开启对冲（LLM_HEDGING）时，首选提供商的响应时间超过其p95延迟后向下一个提供商发出对冲请求，采用先返回的回答。
+对冲的代价是两次生成：输掉的请求已经发出、无法中止，只能放弃它的结果，执行它的线程要等它返回才会释放，
+因此对冲默认关闭，并且在首选提供商积累足够的延迟样本、算出p95之前不会对冲
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from .llm_gateway import LLMGatewayError
+from .llm_retry import CircuitBreaker, CircuitOpenError, get_breaker
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 路由配置
+LLM_HEDGING = os.environ.get("LLM_HEDGING", "false").lower() == "true"
+LLM_ROUTE_WINDOW = int(os.environ.get("LLM_ROUTE_WINDOW", "200"))  # 统计延迟和错误率的最近调用数
+LLM_ROUTE_MIN_SAMPLES = int(os.environ.get("LLM_ROUTE_MIN_SAMPLES", "20"))  # 样本数达到后才按p95对冲
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "2"))  # 对冲等待时间下限（秒）
+LLM_ROUTE_MAX_ERROR_RATE = float(os.environ.get("LLM_ROUTE_MAX_ERROR_RATE", "0.5"))  # 超过该错误率视为不健康
+LLM_ROUTE_OLLAMA = os.environ.get("LLM_ROUTE_OLLAMA", "false").lower() == "true"  # 是否把本地Ollama作为备选
+LLM_ROUTER_WORKERS = int(os.environ.get("LLM_ROUTER_WORKERS", "16"))
+
+T = TypeVar('T')
+
+
+def configured_providers(preferred: str, supported: Iterable[str]) -> List[str]:
+    """
+    调用方支持、并且已经配置的提供商
+    DeepSeek和OpenAI需要设置API密钥；Ollama没有密钥，只有作为首选或开启LLM_ROUTE_OLLAMA时才参与路由
+    """
+    providers = []
+    for provider in supported:
+        if provider == 'deepseek' and os.environ.get("DEEPSEEK_API_KEY"):
+            providers.append(provider)
+        elif provider == 'openai' and os.environ.get("OPENAI_API_KEY"):
+            providers.append(provider)
+        elif provider == 'ollama' and (preferred == 'ollama' or LLM_ROUTE_OLLAMA):
+            providers.append(provider)
+    return providers
+
+
+class ProviderStats:
+    """一个提供商最近若干次调用的延迟和成败"""
+
+    def __init__(self, window: int = LLM_ROUTE_WINDOW):
+        self.latencies: deque = deque(maxlen=window)  # 成功调用的耗时（秒）
+        self.outcomes: deque = deque(maxlen=window)  # 每次调用是否成功
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.latencies.append(latency)
+            self.outcomes.append(ok)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """成功调用耗时的q分位数（0-100），没有样本时返回None"""
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    def samples(self) -> int:
+        return len(self.latencies)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            'calls': len(self.outcomes),
+            'p50': round(p50, 3) if p50 is not None else None,
+            'p95': round(p95, 3) if p95 is not None else None,
+            'error_rate': round(self.error_rate(), 4)
+        }
+
+
+class LLMRouter:
+    """LLM提供商路由和对冲请求"""
+
+    def __init__(self, hedging: bool = LLM_HEDGING, window: int = LLM_ROUTE_WINDOW,
+                 min_samples: int = LLM_ROUTE_MIN_SAMPLES, min_hedge_delay: float = LLM_HEDGE_MIN_DELAY,
+                 max_error_rate: float = LLM_ROUTE_MAX_ERROR_RATE,
+                 breakers: Callable[[str], CircuitBreaker] = get_breaker, max_workers: int = LLM_ROUTER_WORKERS):
+        """
+        初始化路由
+
+        Args:
+            hedging: 是否发出对冲请求
+            window: 统计延迟和错误率的最近调用数
+            min_samples: 按p95计算对冲等待时间所需的最少样本数，样本不足时不对冲
+            min_hedge_delay: 对冲等待时间下限（秒）
+            max_error_rate: 超过该错误率的提供商排在健康的提供商之后
+            breakers: 按提供商取得熔断器的函数
+            max_workers: 执行LLM请求的线程数
+        """
+        self.hedging = hedging
+        self.window = window
+        self.min_samples = min_samples
+        self.min_hedge_delay = min_hedge_delay
+        self.max_error_rate = max_error_rate
+        self.breakers = breakers
+        self.max_workers = max_workers
+        self._executor = None
+        self._stats: Dict[str, ProviderStats] = {}
+        self._lock = threading.Lock()
+        self.hedges = 0  # 发出的对冲请求数
+        self.hedge_wins = 0  # 对冲请求先返回的次数
+        self.hedges_abandoned = 0  # 已经发出、结果被丢弃的请求数（每次都多付了一次生成）
+        self.failovers = 0  # 首选提供商失败后改用其他提供商的次数
+
+    def _executor_for_call(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='llm-router')
+        return self._executor
+
+    def stats_for(self, provider: str) -> ProviderStats:
+        stats = self._stats.get(provider)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(provider, ProviderStats(self.window))
+        return stats
+
+    def _healthy(self, provider: str) -> bool:
+        return (self.breakers(provider).state != CircuitBreaker.OPEN
+                and self.stats_for(provider).error_rate() <= self.max_error_rate)
+
+    def route(self, preferred: str, providers: Iterable[str]) -> List[str]:
+        """
+        决定依次尝试的提供商
+
+        Args:
+            preferred: 首选提供商
+            providers: 可用的提供商
+
+        Returns:
+            健康的提供商在前（首选提供商最先，其余按p50延迟从低到高，没有样本的排在最后），不健康的在后
+        """
+        def latency(provider):
+            p50 = self.stats_for(provider).percentile(50)
+            return (p50 is None, p50 or 0.0)
+
+        providers = list(dict.fromkeys(providers))
+        healthy = [p for p in providers if self._healthy(p)]
+        unhealthy = [p for p in providers if p not in healthy]
+        ordered = sorted((p for p in healthy if p != preferred), key=latency)
+        if preferred in healthy:
+            ordered.insert(0, preferred)
+        return ordered + sorted(unhealthy, key=latency)
+
+    def hedge_delay(self, provider: str) -> Optional[float]:
+        """等待provider多久后发出对冲请求：其p95延迟（不低于下限）；样本不足、还没有可靠的p95时返回None，不对冲"""
+        stats = self.stats_for(provider)
+        if stats.samples() < self.min_samples:
+            return None
+        return max(self.min_hedge_delay, stats.percentile(95))
+
+    def _timed(self, provider: str, request: Callable[[str], T]) -> T:
+        start = time.monotonic()
+        try:
+            result = request(provider)
+        except CircuitOpenError:
+            # 熔断时请求没有发出，不计入延迟和错误率
+            raise
+        except Exception:
+            self.stats_for(provider).record(time.monotonic() - start, False)
+            raise
+        self.stats_for(provider).record(time.monotonic() - start, True)
+        return result
+
+    def call(self, preferred: str, request: Callable[[str], T], providers: Iterable[str]) -> Tuple[str, T]:
+        """
+        按路由调用LLM
+
+        Args:
+            preferred: 首选提供商
+            request: 向指定提供商发出请求的函数，失败时抛出异常
+            providers: 可用的提供商
+
+        Returns:
+            (实际回答的提供商, request的返回值)
+
+        Raises:
+            LLMGatewayError: 没有可用的提供商
+            所有提供商都失败时，抛出最后一个提供商的异常
+        """
+        order = self.route(preferred, providers)
+        if not order:
+            raise LLMGatewayError(f"{preferred} API未配置，且没有其他可用的提供商")
+        if not self.hedging:
+            return self._call_in_order(order, request)
+
+        executor = self._executor_for_call()
+        pending: Dict[Any, str] = {}
+        next_index = 0
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            nonlocal next_index
+            provider = order[next_index]
+            next_index += 1
+            pending[executor.submit(self._timed, provider, request)] = provider
+
+        launch()
+        while pending:
+            timeout = None
+            if self.hedging and not hedged and len(pending) == 1 and next_index < len(order):
+                timeout = self.hedge_delay(next(iter(pending.values())))  # None表示不对冲，一直等待
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 超过p95仍未返回，向下一个提供商发出对冲请求，两个请求都继续等待
+                hedged = True
+                self.hedges += 1
+                logger.info(f"{next(iter(pending.values()))} 超过{timeout:.1f}秒未返回，对冲请求 {order[next_index]}")
+                launch()
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f"{provider} 调用失败: {str(e)}")
+                    last_error = e
+                    continue
+                if provider != order[0]:
+                    if hedged:
+                        self.hedge_wins += 1
+                    else:
+                        self.failovers += 1
+                self._abandon(pending)
+                return provider, result
+
+            if not pending and next_index < len(order):
+                logger.info(f"改用 {order[next_index]}")
+                launch()
+
+        raise last_error
+
+    def _call_in_order(self, order: List[str], request: Callable[[str], T]) -> Tuple[str, T]:
+        """不对冲：在调用方线程中依次尝试，失败后改用下一个提供商"""
+        last_error: Optional[BaseException] = None
+        for index, provider in enumerate(order):
+            if index:
+                logger.info(f"改用 {provider}")
+            try:
+                result = self._timed(provider, request)
+            except Exception as e:
+                logger.warning(f"{provider} 调用失败: {str(e)}")
+                last_error = e
+                continue
+            if index:
+                self.failovers += 1
+            return provider, result
+        raise last_error
+
+    def _abandon(self, pending: Dict[Any, str]) -> None:
+        """
+        放弃已经有回答的调用中其余的请求
+        还在排队的请求直接取消，不再发出；已经发出的请求无法中止，结果被丢弃
+        """
+        for future, provider in pending.items():
+            if future.cancel():
+                logger.info(f"已取消未发出的对冲请求 {provider}")
+            else:
+                self.hedges_abandoned += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """路由统计"""
+        return {
+            'hedging': self.hedging,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'hedges_abandoned': self.hedges_abandoned,
+            'failovers': self.failovers,
+            'providers': {provider: stats.snapshot() for provider, stats in list(self._stats.items())}
+        }
+
+
+# 创建全局实例
+llm_router = LLMRouter()
@@ -0,0 +1,149 @@
+"""
+LLM流式调用
+以流式方式调用DeepSeek、OpenAI（SSE格式）和Ollama（逐行JSON格式）的聊天接口，逐段返回生成的文本，
+使接口在模型开始输出后即可把内容转发给前端，而不必等待完整回答。请求经由LLM网关发出，复用其连接池
+"""
+
+import os
+import json
+import logging
+import itertools
+from typing import Iterable, Iterator, Optional, Tuple
+from .llm_gateway import llm_gateway, LLMGatewayError
+from .llm_retry import retry_policy
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# LLM API配置
+DEEPSEEK_API_URL = os.environ.get("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
+DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "")
+OPENAI_API_URL = os.environ.get("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
+OLLAMA_API_URL = os.environ.get("OLLAMA_API_URL", "http://localhost:11434/api/chat")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama2")
+
+# 超时配置：读取超时是两段数据之间的最长间隔，而不是整个回答的生成时间（连接超时由网关统一配置）
+API_READ_TIMEOUT = int(os.environ.get("API_READ_TIMEOUT", "90"))
+
+
+class LLMStreamError(Exception):
+    """流式调用LLM失败"""
+
+
+def iter_openai_deltas(lines: Iterable[str]) -> Iterator[str]:
+    """
+    解析OpenAI兼容接口（DeepSeek、OpenAI）的SSE响应
+
+    Args:
+        lines: 响应的文本行
+
+    Yields:
+        每个数据块中新增的回答文本
+    """
+    for line in lines:
+        if not line or line.startswith(':') or not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            logger.warning(f"无法解析的流式数据: {data[:100]}")
+            continue
+        if chunk.get('error'):
+            raise LLMStreamError(f"流式响应返回错误: {chunk['error']}")
+        for choice in chunk.get('choices') or []:
+            content = (choice.get('delta') or {}).get('content')
+            if content:
+                yield content
+
+
+def iter_ollama_deltas(lines: Iterable[str]) -> Iterator[str]:
+    """
+    解析Ollama的逐行JSON响应
+
+    Args:
+        lines: 响应的文本行
+
+    Yields:
+        每行中新增的回答文本
+    """
+    for line in lines:
+        if not line:
+            continue
+        try:
+            chunk = json.loads(line)
+        except ValueError:
+            logger.warning(f"无法解析的流式数据: {line[:100]}")
+            continue
+        if chunk.get('error'):
+            raise LLMStreamError(f"流式响应返回错误: {chunk['error']}")
+        content = (chunk.get('message') or {}).get('content')
+        if content:
+            yield content
+        if chunk.get('done'):
+            return
+
+
+def stream_chat_completion(query: str, system_prompt: str, provider: str = 'deepseek',
+                           temperature: float = 0.3, max_tokens: Optional[int] = 1500) -> Iterator[str]:
+    """
+    流式调用聊天接口
+
+    Args:
+        query: 用户问题
+        system_prompt: 系统提示
+        provider: AI提供商（deepseek、openai或ollama）
+        temperature: 采样温度
+        max_tokens: 最多生成的token数，None表示使用服务端默认值
+
+    Yields:
+        模型逐段生成的回答文本
+
+    Raises:
+        LLMStreamError: 提供商未配置、请求失败或响应出错
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query}
+    ]
+    headers = {"Content-Type": "application/json"}
+    if provider == "deepseek" and DEEPSEEK_API_KEY:
+        url, parse = DEEPSEEK_API_URL, iter_openai_deltas
+        headers["Authorization"] = f"Bearer {DEEPSEEK_API_KEY}"
+        payload = {"model": "deepseek-chat", "messages": messages, "temperature": temperature, "stream": True}
+    elif provider == "openai" and OPENAI_API_KEY:
+        url, parse = OPENAI_API_URL, iter_openai_deltas
+        headers["Authorization"] = f"Bearer {OPENAI_API_KEY}"
+        payload = {"model": "gpt-3.5-turbo", "messages": messages, "temperature": temperature, "stream": True}
+    elif provider == "ollama":
+        url, parse = OLLAMA_API_URL, iter_ollama_deltas
+        payload = {"model": OLLAMA_MODEL, "messages": messages, "stream": True, "options": {"temperature": temperature}}
+    else:
+        raise LLMStreamError(f"{provider} API未配置")
+    if max_tokens is not None and provider != "ollama":
+        payload["max_tokens"] = max_tokens
+
+    # 只在收到响应之前按LLM重试策略重试，开始输出后出错直接抛出，避免重复输出
+    def open_stream(timeout: float) -> Tuple[Optional[str], Iterator[str]]:
+        lines = llm_gateway.stream_lines(url, json=payload, headers=headers, timeout=timeout)
+        return next(lines, None), lines
+
+    try:
+        first_line, lines = retry_policy.call(provider, open_stream, API_READ_TIMEOUT)
+    except LLMGatewayError as e:
+        raise LLMStreamError(f"调用{provider} API失败: {str(e)}")
+
+    if first_line is None:
+        return
+    try:
+        yield from parse(itertools.chain([first_line], lines))
+        # 读完结束标记之后剩余的数据（通常只有分块编码的结尾），让连接回到连接池而不是被关闭
+        for _ in lines:
+            pass
+    except LLMGatewayError as e:
+        raise LLMStreamError(f"读取{provider}流式响应失败: {str(e)}")
+    finally:
+        lines.close()
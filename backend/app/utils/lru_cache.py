@@ -0,0 +1,162 @@
+"""
+LRU缓存
+线程安全，支持条目数上限、内存上限、过期时间和按版本号整体失效，并统计命中、未命中和淘汰次数
+"""
+
+import sys
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+def estimate_size(value: Any) -> int:
+    """估算对象占用的内存字节数（递归统计容器中的元素）"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + sys.getsizeof(value) if value.base is None else value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    有界LRU缓存
+    访问过的条目移到末尾，条目数或占用内存超过上限时从最久未使用的一端淘汰；过期条目在访问时删除。
+    提供generation函数时，每次访问都会比较数据源的版本号，版本变化后已缓存的条目全部失效
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None, max_bytes: Optional[int] = None,
+                 generation: Optional[Callable[[], Hashable]] = None, size_of: Callable[[Any], int] = estimate_size):
+        """
+        初始化LRU缓存
+
+        Args:
+            max_entries: 最大条目数
+            ttl: 默认过期时间（秒），None表示不过期
+            max_bytes: 缓存值占用内存的上限（字节），None表示不限制
+            generation: 返回数据源当前版本号的函数，版本号变化时缓存整体失效
+            size_of: 估算缓存值大小的函数
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.generation_func = generation
+        self.size_of = size_of
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()  # 键 -> (值, 过期时间, 字节数)
+        self._bytes = 0
+        self._generation = generation() if generation else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # 因容量或内存不足被淘汰的条目数
+        self.expirations = 0  # 因过期被删除的条目数
+        self.invalidations = 0  # 因数据源版本变化失效的条目数
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def current_generation(self) -> Optional[Hashable]:
+        """
+        数据源当前的版本号
+        调用方在计算缓存值之前取得版本号并传给set，计算期间数据源发生变化时结果不会被缓存
+        """
+        return self.generation_func() if self.generation_func else None
+
+    def _sync_generation(self, generation: Optional[Hashable]) -> None:
+        """版本号变化时清空缓存，调用方需持有锁"""
+        if generation != self._generation:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """获取缓存值，不存在、已过期或已失效时返回default"""
+        generation = self.current_generation()
+        with self._lock:
+            self._sync_generation(generation)
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, generation: Any = _MISSING) -> None:
+        """
+        写入缓存
+
+        Args:
+            key: 键
+            value: 值
+            ttl: 本条目的过期时间（秒），默认使用缓存的ttl
+            generation: 计算该值时数据源的版本号（current_generation的返回值），与当前版本不同时不写入
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        size = self.size_of(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        current = self.current_generation()
+        if generation is not _MISSING and generation != current:
+            return
+
+        with self._lock:
+            self._sync_generation(current)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """删除缓存条目"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def clear(self) -> None:
+        """清空缓存（统计数据保留）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -1,7 +1,8 @@
 import logging
 import time
-import requests
 from typing import Dict, Any
+from .llm_gateway import LLMGatewayError
+from .llm_retry import retry_policy
 
 logger = logging.getLogger(__name__)
 
@@ -38,29 +39,29 @@ class OllamaChat:
             }
             
             # 发送请求到Ollama API
-            response = requests.post(
+            response = retry_policy.post(
+                "ollama",
                 f"{self.base_url}/api/chat",
                 json=data,
                 timeout=30
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    "success": True,
-                    "data": {
-                        "answer": result.get("message", {}).get("content", ""),
-                        "model": self.model
-                    }
-                }
-            else:
-                error_msg = f"Ollama API请求失败: {response.status_code} - {response.text}"
-                logger.error(error_msg)
-                return {
-                    "success": False,
-                    "message": error_msg
+            result = response.json()
+            return {
+                "success": True,
+                "data": {
+                    "answer": result.get("message", {}).get("content", ""),
+                    "model": self.model
                 }
+            }
                 
+        except LLMGatewayError as e:
+            error_msg = f"Ollama API请求失败: {str(e)}"
+            logger.error(error_msg)
+            return {
+                "success": False,
+                "message": error_msg
+            }
         except Exception as e:
             error_msg = f"与Ollama对话时出错: {str(e)}"
             logger.exception(error_msg)
@@ -1,13 +1,15 @@
 import logging
-import time
-import random
 import hashlib
-import json
-import requests
 import os
-from typing import Dict, List, Any, Optional
+import threading
+from typing import Callable, Dict, List, Any, Optional
 from .knowledge_base import knowledge_base
 from .vector_knowledge_base import vector_knowledge_base
+from .lru_cache import LRUCache
+from .startup_optimizer import startup_optimizer
+from .answer_cache import answer_cache
+from .llm_gateway import LLMGatewayError
+from .llm_retry import retry_policy, CircuitOpenError
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -32,12 +34,22 @@ class RAGService:
         self.knowledge_base = knowledge_base
         self.vector_knowledge_base = vector_knowledge_base
         
-        # 缓存机制
-        self.query_cache = {}
-        self.cache_size = 100  # 最大缓存条目数
-        
-        # 延迟初始化标志
-        self._vector_kb_initialized = False
+        # 问答结果缓存，知识库写入后整体失效
+        self.query_cache = LRUCache(
+            max_entries=startup_optimizer.get_result_cache_size(),
+            ttl=startup_optimizer.get_result_cache_ttl(),
+            max_bytes=startup_optimizer.get_result_cache_max_bytes(),
+            generation=self.knowledge_base.get_generation
+        )
+        # 持久化问答缓存，多个worker进程共享，未启用时为None
+        self.answer_cache = answer_cache
+        self._local = threading.local()  # 记录当前线程的回答是否为模拟回答
+        
+        # 向量知识库已导入的知识库版本号，延迟到首次检索时导入，知识库变化（包括其他进程写入）后重新导入
+        self._vector_kb_generation = None
+        self._vector_kb_lock = threading.Lock()
+        # 向量缓存合并分段时保留知识库当前文档的向量，清理其余向量
+        self.vector_knowledge_base.live_documents = self._live_vector_documents
         
         # 记录是否有可用的LLM API
         self.has_openai = bool(OPENAI_API_KEY)
@@ -52,13 +64,25 @@ class RAGService:
             logger.warning("未配置任何LLM API，将使用模拟回答")
     
     def _ensure_vector_kb_initialized(self):
-        """确保向量知识库已初始化（延迟加载）"""
-        if self._vector_kb_initialized:
+        """
+        确保向量知识库已导入当前版本的知识库（延迟加载）
+        知识库版本号变化时清空后重新导入，向量从共享的向量缓存读取，只有新内容需要编码
+        """
+        generation = self.knowledge_base.get_generation()
+        if self._vector_kb_generation == generation:
             return
-            
-        logger.info("正在初始化向量知识库...")
-        self._init_vector_knowledge_base()
-        self._vector_kb_initialized = True
+        
+        with self._vector_kb_lock:
+            if self._vector_kb_generation == generation:
+                return
+            if self._vector_kb_generation is None:
+                logger.info("正在初始化向量知识库...")
+            else:
+                logger.info("知识库已变化，重新导入向量知识库...")
+                self.vector_knowledge_base.clear()
+            # 导入期间知识库再次变化时记录的是旧版本号，下次检索会再次导入
+            self._init_vector_knowledge_base()
+            self._vector_kb_generation = generation
     
     def _init_vector_knowledge_base(self):
         """初始化向量知识库，导入现有知识库中的所有文档"""
@@ -66,25 +90,58 @@ class RAGService:
             # 获取所有文档
             documents = self.knowledge_base.get_all_documents()
             
-            # 导入到向量知识库，使用语义分块处理长文档
-            for doc_id, doc in documents.items():
-                # 对长文档进行分块
-                chunks = self._create_semantic_chunks(doc['content'])
-                
-                # 为每个分块创建一个文档
-                for i, chunk in enumerate(chunks):
-                    vector_doc = {
-                        'id': f"{doc_id}_chunk_{i}",
-                        'parent_id': doc_id,
-                        'title': doc['title'],
-                        'content': chunk
-                    }
-                    self.vector_knowledge_base.add_document(vector_doc)
+            # 批量导入，按批次编码
+            self.vector_knowledge_base.add_documents(self._build_vector_documents(documents.items()))
                 
             logger.info(f"已将{len(documents)}篇文档导入向量知识库")
         except Exception as e:
             logger.exception(f"初始化向量知识库时出错: {str(e)}")
     
+    def _build_vector_documents(self, documents) -> List[Dict]:
+        """
+        将知识库文档转换为向量知识库文档，使用语义分块处理长文档
+        
+        Args:
+            documents: (文档ID, 文档) 的可迭代对象
+        """
+        vector_docs = []
+        for doc_id, doc in documents:
+            # 对长文档进行分块
+            chunks = self._create_semantic_chunks(doc['content'])
+            
+            # 为每个分块创建一个文档
+            for i, chunk in enumerate(chunks):
+                vector_docs.append({
+                    'id': f"{doc_id}_chunk_{i}",
+                    'parent_id': doc_id,
+                    'title': doc['title'],
+                    'content': chunk
+                })
+        return vector_docs
+    
+    def _live_vector_documents(self) -> List[Dict]:
+        """知识库当前全部文档对应的向量知识库文档"""
+        return self._build_vector_documents(self.knowledge_base.get_all_documents().items())
+    
+    def precompute_embeddings(self, documents: List[Dict]) -> int:
+        """
+        为一批知识库文档预先编码向量并写入向量缓存
+        
+        Args:
+            documents: 文档列表，每个文档包含id、title、content
+            
+        Returns:
+            写入缓存的分块数量
+        """
+        vector_docs = self._build_vector_documents((str(doc['id']), doc) for doc in documents)
+        return self.vector_knowledge_base.precompute_embeddings(vector_docs)
+    
+    def reset_vector_knowledge_base(self):
+        """清空向量知识库，下次检索时从知识库重新导入（已缓存的向量不会重新编码）"""
+        with self._vector_kb_lock:
+            self.vector_knowledge_base.clear()
+            self._vector_kb_generation = None
+    
     def _create_semantic_chunks(self, content: str, max_chunk_size: int = 1000) -> List[str]:
         """
         将长文档内容分割成语义连贯的块
@@ -158,11 +215,23 @@ class RAGService:
             
             # 检查缓存
             cache_key = self._generate_cache_key(query, provider)
-            cached_response = self._get_from_cache(cache_key)
-            if cached_response:
+            cached_response = self.query_cache.get(cache_key)
+            if cached_response is not None:
                 logger.info(f"从缓存中获取回答: {query[:30]}...")
                 return cached_response
             
+            # 检索前记录知识库版本，生成期间知识库被修改时不缓存结果
+            generation = self.query_cache.current_generation()
+            
+            # 检查持久化缓存（其他worker进程或重启前生成的回答）
+            kb_version = self.knowledge_base.content_hash() if self.answer_cache is not None else None
+            if kb_version is not None:
+                cached_response = self.answer_cache.get(f"rag:{cache_key}", kb_version)
+                if cached_response is not None:
+                    logger.info(f"从持久化缓存中获取回答: {query[:30]}...")
+                    self.query_cache.set(cache_key, cached_response, generation=generation)
+                    return cached_response
+            
             # 1. 从知识库中检索相关文档
             relevant_docs = self._retrieve_relevant_documents(query)
             logger.info(f"检索到{len(relevant_docs)}篇相关文档")
@@ -171,6 +240,7 @@ class RAGService:
             system_prompt = self._generate_system_prompt(relevant_docs)
             
             # 3. 生成答案
+            self._local.mocked = False
             answer, sources = self._generate_answer(query, system_prompt, provider)
             
             # 构造响应
@@ -185,7 +255,10 @@ class RAGService:
             }
             
             # 添加到缓存
-            self._add_to_cache(cache_key, response)
+            self.query_cache.set(cache_key, response, generation=generation)
+            # 模拟回答不写入持久化缓存，配置好API后可以立即得到真实回答
+            if kb_version is not None and not self._local.mocked and self.knowledge_base.content_hash() == kb_version:
+                self.answer_cache.set(f"rag:{cache_key}", kb_version, response)
             
             logger.info(f"RAG问答完成: 使用{len(relevant_docs)}篇文档，模型={provider}")
             return response
@@ -201,21 +274,6 @@ class RAGService:
         key_str = f"{query.lower().strip()}:{provider}"
         return hashlib.md5(key_str.encode()).hexdigest()
     
-    def _get_from_cache(self, cache_key: str) -> Optional[Dict]:
-        """从缓存获取响应"""
-        return self.query_cache.get(cache_key)
-    
-    def _add_to_cache(self, cache_key: str, response: Dict):
-        """添加响应到缓存"""
-        # 如果缓存已满，移除最旧的项
-        if len(self.query_cache) >= self.cache_size:
-            # 简单实现：直接清除一半的缓存
-            keys = list(self.query_cache.keys())
-            for key in keys[:len(keys)//2]:
-                del self.query_cache[key]
-        
-        self.query_cache[cache_key] = response
-    
     def _retrieve_relevant_documents(self, query: str) -> List[Dict]:
         """
         从知识库中检索相关文档 - 使用混合检索策略
@@ -350,153 +408,96 @@ class RAGService:
     
     def _call_deepseek_api(self, query: str, system_prompt: str) -> tuple:
         """调用DeepSeek API生成回答"""
-        max_retries = 3
-        retry_delay = 2  # 秒
-        
-        for attempt in range(max_retries):
-            try:
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-                }
-                
-                payload = {
-                    "model": "deepseek-chat",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": query}
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 2500  # 临时减少以提高响应速度
-                }
-                
-                response = requests.post(
-                    DEEPSEEK_API_URL,
-                    headers=headers,
-                    json=payload,
-                    timeout=60,  # 增加超时时间到60秒
-                    stream=True  # 启用流式传输
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"DeepSeek API请求失败: {response.status_code} {response.text}")
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        continue
-                    return self._mock_generate_answer(query, system_prompt)
-                
-                # 读取完整的响应内容
-                full_response = ""
-                for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
-                    if chunk:
-                        full_response += chunk
-                
-                try:
-                    result = json.loads(full_response)
-                    answer = result['choices'][0]['message']['content']
-                    
-                    # 从答案中提取引用的文档
-                    sources = self._extract_sources_from_answer(answer, system_prompt)
-                    
-                    return answer, sources
-                except json.JSONDecodeError as e:
-                    logger.error(f"解析DeepSeek API响应失败: {str(e)}")
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        continue
-                    return self._mock_generate_answer(query, system_prompt)
-                
-            except requests.exceptions.RequestException as e:
-                logger.error(f"DeepSeek API请求异常: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-                return self._mock_generate_answer(query, system_prompt)
-            except Exception as e:
-                logger.exception(f"调用DeepSeek API时出错: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-                return self._mock_generate_answer(query, system_prompt)
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
+        }
         
-        return self._mock_generate_answer(query, system_prompt)
+        payload = {
+            "model": "deepseek-chat",
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": query}
+            ],
+            "temperature": 0.3,
+            "max_tokens": 2500  # 临时减少以提高响应速度
+        }
+        
+        return self._call_llm("deepseek", DEEPSEEK_API_URL, payload, headers, query, system_prompt,
+                              lambda result: result['choices'][0]['message']['content'])
     
     def _call_openai_api(self, query: str, system_prompt: str) -> tuple:
         """调用OpenAI API生成回答"""
-        try:
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {OPENAI_API_KEY}"
-            }
-            
-            payload = {
-                "model": "gpt-3.5-turbo",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ],
-                "temperature": 0.3,
-                "max_tokens": 2500  # 临时减少以提高响应速度
-            }
-            
-            response = requests.post(
-                OPENAI_API_URL,
-                headers=headers,
-                json=payload,
-                timeout=60  # 增加超时时间到60秒
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"OpenAI API请求失败: {response.status_code} {response.text}")
-                return self._mock_generate_answer(query, system_prompt)
-            
-            result = response.json()
-            answer = result['choices'][0]['message']['content']
-            
-            # 从答案中提取引用的文档
-            sources = self._extract_sources_from_answer(answer, system_prompt)
-            
-            return answer, sources
-        except Exception as e:
-            logger.exception(f"调用OpenAI API时出错: {str(e)}")
-            return self._mock_generate_answer(query, system_prompt)
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {OPENAI_API_KEY}"
+        }
+        
+        payload = {
+            "model": "gpt-3.5-turbo",
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": query}
+            ],
+            "temperature": 0.3,
+            "max_tokens": 2500  # 临时减少以提高响应速度
+        }
+        
+        return self._call_llm("openai", OPENAI_API_URL, payload, headers, query, system_prompt,
+                              lambda result: result['choices'][0]['message']['content'])
     
     def _call_ollama_api(self, query: str, system_prompt: str) -> tuple:
         """调用本地Ollama API生成回答"""
-        try:
-            payload = {
-                "model": "llama3",  # 可根据实际配置调整
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ],
-                "stream": False,
-                "options": {
-                    "temperature": 0.3,
-                    "num_predict": 2500  # 临时减少以提高响应速度
-                }
+        payload = {
+            "model": "llama3",  # 可根据实际配置调整
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": query}
+            ],
+            "stream": False,
+            "options": {
+                "temperature": 0.3,
+                "num_predict": 2500  # 临时减少以提高响应速度
             }
+        }
+        
+        return self._call_llm("ollama", OLLAMA_API_URL, payload, None, query, system_prompt,
+                              lambda result: result['message']['content'])
+    
+    def _call_llm(self, provider: str, url: str, payload: Dict, headers: Optional[Dict],
+                  query: str, system_prompt: str, extract: Callable[[Dict], str]) -> tuple:
+        """
+        按LLM重试策略调用提供商，失败、超出总时限或提供商熔断时立即使用模拟回答
+        
+        Args:
+            provider: AI提供商
+            url: API地址
+            payload: 请求体
+            headers: 请求头
+            query: 用户查询
+            system_prompt: 系统提示
+            extract: 从响应JSON中取出回答的函数
             
-            response = requests.post(
-                OLLAMA_API_URL,
-                json=payload,
-                timeout=60  # Ollama可能需要更长的超时时间
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Ollama API请求失败: {response.status_code} {response.text}")
-                return self._mock_generate_answer(query, system_prompt)
-            
-            result = response.json()
-            answer = result['message']['content']
-            
-            # 从答案中提取引用的文档
-            sources = self._extract_sources_from_answer(answer, system_prompt)
-            
-            return answer, sources
+        Returns:
+            (答案, 来源列表)
+        """
+        try:
+            response = retry_policy.post(provider, url, json=payload, headers=headers, timeout=60)
+            answer = extract(response.json())
+        except CircuitOpenError as e:
+            logger.warning(f"{str(e)}，使用模拟回答")
+            return self._mock_generate_answer(query, system_prompt)
+        except LLMGatewayError as e:
+            logger.error(f"{provider} API请求失败: {str(e)}")
+            return self._mock_generate_answer(query, system_prompt)
         except Exception as e:
-            logger.exception(f"调用Ollama API时出错: {str(e)}")
+            logger.exception(f"调用{provider} API时出错: {str(e)}")
             return self._mock_generate_answer(query, system_prompt)
+        
+        # 从答案中提取引用的文档
+        sources = self._extract_sources_from_answer(answer, system_prompt)
+        
+        return answer, sources
     
     def _extract_sources_from_answer(self, answer: str, system_prompt: str) -> List[Dict]:
         """从答案中提取引用的文档"""
@@ -538,8 +539,7 @@ class RAGService:
         Returns:
             (答案, 来源列表)
         """
-        # 模拟处理延迟
-        time.sleep(random.uniform(1.0, 2.0))
+        self._local.mocked = True
         
         # 如果没有相关文档（检测系统提示）
         if "相关文档" not in system_prompt:
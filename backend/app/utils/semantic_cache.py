@@ -0,0 +1,185 @@
+"""
+语义问答缓存
+保存每个问题的向量和回答，新问题与已缓存问题的余弦相似度超过阈值、且检索到的文档块相同时直接复用回答，
+避免同一个问题换一种说法就重新调用一次LLM
+"""
+
+import time
+import logging
+import threading
+import numpy as np
+import faiss
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每次查找时检查的最相似问题数
+SEARCH_CANDIDATES = 8
+
+
+class SemanticCache:
+    """
+    语义问答缓存
+    问题向量归一化后存放在独立的FAISS内积索引中（内积即余弦相似度），条目超过上限时按LRU淘汰；
+    提供generation函数时，知识库版本变化后缓存整体失效
+    """
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 1000, ttl: Optional[float] = None,
+                 generation: Optional[Callable[[], Hashable]] = None):
+        """
+        初始化语义缓存
+
+        Args:
+            threshold: 复用回答所需的最低余弦相似度
+            max_entries: 最大条目数
+            ttl: 过期时间（秒），None表示不过期
+            generation: 返回知识库当前版本号的函数
+        """
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.generation_func = generation
+        self._generation = generation() if generation else None
+        self._index = None  # 首次写入时按向量维度创建
+        self._entries: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()  # 向量ID -> 条目
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.near_misses = 0  # 有足够相似的问题，但检索到的文档块或提供商不同
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(vector)
+        return vector
+
+    def current_generation(self) -> Optional[Hashable]:
+        """知识库当前的版本号，调用方在生成回答前取得并传给store"""
+        return self.generation_func() if self.generation_func else None
+
+    def _sync_generation(self, generation: Optional[Hashable]) -> None:
+        """知识库版本变化时清空缓存，调用方需持有锁"""
+        if generation != self._generation:
+            self.invalidations += len(self._entries)
+            self._reset()
+            self._generation = generation
+
+    def _reset(self) -> None:
+        self._entries.clear()
+        if self._index is not None:
+            self._index.reset()
+
+    def _remove(self, entry_id: int) -> None:
+        del self._entries[entry_id]
+        self._index.remove_ids(np.array([entry_id], dtype=np.int64))
+
+    def lookup(self, vector: np.ndarray, chunk_ids: Iterable[str], provider: str) -> Optional[Dict[str, Any]]:
+        """
+        查找可以复用的回答
+
+        Args:
+            vector: 问题向量
+            chunk_ids: 本次检索到的文档块ID
+            provider: AI服务提供商
+
+        Returns:
+            缓存的回答，没有相似度超过阈值且文档块相同的问题时返回None
+        """
+        chunk_key = frozenset(chunk_ids)
+        query = self._normalize(vector)
+        generation = self.current_generation()
+        with self._lock:
+            self._sync_generation(generation)
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            scores, ids = self._index.search(query, min(SEARCH_CANDIDATES, len(self._entries)))
+            similar = False
+            now = time.monotonic()
+            for score, entry_id in zip(scores[0], ids[0]):
+                if entry_id < 0 or score < self.threshold:
+                    break
+                entry = self._entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                if entry['expires_at'] is not None and entry['expires_at'] <= now:
+                    self._remove(int(entry_id))
+                    continue
+                similar = True
+                if entry['chunks'] == chunk_key and entry['provider'] == provider:
+                    self._entries.move_to_end(int(entry_id))
+                    self.hits += 1
+                    logger.info(f"语义缓存命中: 相似度 {score:.3f}")
+                    return entry['answer']
+
+            if similar:
+                self.near_misses += 1
+            self.misses += 1
+            return None
+
+    def store(self, vector: np.ndarray, chunk_ids: Iterable[str], provider: str, answer: Dict[str, Any],
+              generation: Any = None) -> None:
+        """
+        保存回答
+
+        Args:
+            vector: 问题向量
+            chunk_ids: 生成回答时使用的文档块ID
+            provider: AI服务提供商
+            answer: 回答
+            generation: 生成回答前的知识库版本号，与当前版本不同时不保存
+        """
+        query = self._normalize(vector)
+        current = self.current_generation()
+        if generation is not None and generation != current:
+            return
+
+        with self._lock:
+            self._sync_generation(current)
+            if self._index is None or self._index.d != query.shape[1]:
+                self._entries.clear()
+                self._index = faiss.IndexIDMap(faiss.IndexFlatIP(query.shape[1]))
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(query, np.array([entry_id], dtype=np.int64))
+            self._entries[entry_id] = {
+                'chunks': frozenset(chunk_ids),
+                'provider': provider,
+                'answer': answer,
+                'expires_at': time.monotonic() + self.ttl if self.ttl is not None else None
+            }
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """清空缓存（统计数据保留）"""
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'near_misses': self.near_misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
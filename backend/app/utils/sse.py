@@ -0,0 +1,47 @@
+"""
+服务器推送事件（SSE）
+把事件生成器包装为text/event-stream响应，每个事件为 (事件名, 数据) 元组，数据以JSON编码
+"""
+
+import json
+import logging
+from typing import Any, Iterable, Tuple
+from flask import Response, stream_with_context
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def format_event(event: str, data: Any) -> str:
+    """编码一个SSE事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events: Iterable[Tuple[str, Any]]) -> Response:
+    """
+    以SSE流返回事件
+
+    Args:
+        events: (事件名, 数据) 的可迭代对象，在请求上下文中惰性执行
+
+    Returns:
+        Flask流式响应；生成事件时出错会以error事件结束，而不是中断连接
+    """
+    def generate():
+        # 先发送注释行，让代理和浏览器立即收到响应头
+        yield ": stream\n\n"
+        try:
+            for event, data in events:
+                yield format_event(event, data)
+        except Exception as e:
+            logger.exception(f"生成流式响应时出错: {str(e)}")
+            yield format_event('error', {'message': f"处理请求时出错: {str(e)}"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 关闭nginx的响应缓冲
+        }
+    )
@@ -17,6 +17,30 @@ class StartupOptimizer:
         self.disable_vector_model = os.environ.get('DISABLE_VECTOR_MODEL', 'false').lower() == 'true'
         self.enable_vector_cache = os.environ.get('ENABLE_VECTOR_CACHE', 'true').lower() == 'true'
         self.vector_batch_size = int(os.environ.get('VECTOR_BATCH_SIZE', '32'))
+        self.vector_cache_dtype = os.environ.get('VECTOR_CACHE_DTYPE', 'float32').lower()
+        # 查询编码的合并批处理：等待窗口内到达的请求合并为一次前向计算，等待时间为0时关闭
+        self.embedding_max_batch = int(os.environ.get('EMBEDDING_MAX_BATCH', '64'))
+        self.embedding_batch_wait_ms = float(os.environ.get('EMBEDDING_BATCH_WAIT_MS', '5'))
+        # 查询向量缓存：条目数为0时关闭
+        self.query_embedding_cache_size = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', '1024'))
+        self.query_embedding_cache_ttl = float(os.environ.get('QUERY_EMBEDDING_CACHE_TTL', '3600'))
+        # 检索结果与问答结果缓存：知识库写入后整体失效
+        self.result_cache_size = int(os.environ.get('RESULT_CACHE_SIZE', '256'))
+        self.result_cache_ttl = float(os.environ.get('RESULT_CACHE_TTL', '600'))
+        self.result_cache_max_mb = float(os.environ.get('RESULT_CACHE_MAX_MB', '32'))
+        # 持久化问答缓存：保存在本地SQLite文件中，多个worker进程共享
+        self.enable_answer_cache = os.environ.get('ENABLE_ANSWER_CACHE', 'true').lower() == 'true'
+        self.answer_cache_path = os.environ.get(
+            'ANSWER_CACHE_PATH', os.path.join(os.path.dirname(__file__), '..', 'cache', 'answer_cache.db')
+        )
+        self.answer_cache_size = int(os.environ.get('ANSWER_CACHE_SIZE', '10000'))
+        self.answer_cache_ttl = float(os.environ.get('ANSWER_CACHE_TTL', '86400'))
+        # 语义问答缓存：相似问题且检索到相同文档块时复用回答，条目数为0时关闭
+        self.semantic_cache_threshold = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+        self.semantic_cache_size = int(os.environ.get('SEMANTIC_CACHE_SIZE', '1000'))
+        self.semantic_cache_ttl = float(os.environ.get('SEMANTIC_CACHE_TTL', '3600'))
+        # FlashRAG索引增量更新后延迟保存的时间，期间的多次更新合并为一次写盘，0表示每次更新后立即保存
+        self.flashrag_persist_delay = float(os.environ.get('FLASHRAG_PERSIST_DELAY', '30'))
         self.verbose_startup = os.environ.get('VERBOSE_STARTUP', 'false').lower() == 'true'
         
         # 设置tokenizers并行处理
@@ -52,6 +76,70 @@ class StartupOptimizer:
         """获取向量批次大小"""
         return self.vector_batch_size
     
+    def get_vector_cache_dtype(self) -> str:
+        """获取向量缓存的存储精度（float32 或 float16）"""
+        return self.vector_cache_dtype
+    
+    def get_embedding_max_batch(self) -> int:
+        """获取合并批处理时每次前向计算的最大文本数"""
+        return self.embedding_max_batch
+    
+    def get_embedding_batch_wait_ms(self) -> float:
+        """获取合并批处理的等待窗口（毫秒）"""
+        return self.embedding_batch_wait_ms
+    
+    def get_query_embedding_cache_size(self) -> int:
+        """获取查询向量缓存的最大条目数"""
+        return self.query_embedding_cache_size
+    
+    def get_query_embedding_cache_ttl(self) -> float:
+        """获取查询向量缓存的过期时间（秒）"""
+        return self.query_embedding_cache_ttl
+    
+    def get_result_cache_size(self) -> int:
+        """获取结果缓存的最大条目数"""
+        return self.result_cache_size
+    
+    def get_result_cache_ttl(self) -> float:
+        """获取结果缓存的过期时间（秒）"""
+        return self.result_cache_ttl
+    
+    def get_result_cache_max_bytes(self) -> int:
+        """获取每个结果缓存占用内存的上限（字节）"""
+        return int(self.result_cache_max_mb * (1 << 20))
+    
+    def should_enable_answer_cache(self) -> bool:
+        """是否启用持久化问答缓存"""
+        return self.enable_answer_cache
+    
+    def get_answer_cache_path(self) -> str:
+        """获取持久化问答缓存的数据库路径"""
+        return self.answer_cache_path
+    
+    def get_answer_cache_size(self) -> int:
+        """获取持久化问答缓存的最大条目数"""
+        return self.answer_cache_size
+    
+    def get_answer_cache_ttl(self) -> float:
+        """获取持久化问答缓存的过期时间（秒）"""
+        return self.answer_cache_ttl
+    
+    def get_semantic_cache_threshold(self) -> float:
+        """获取语义缓存复用回答所需的最低余弦相似度"""
+        return self.semantic_cache_threshold
+    
+    def get_semantic_cache_size(self) -> int:
+        """获取语义缓存的最大条目数"""
+        return self.semantic_cache_size
+    
+    def get_semantic_cache_ttl(self) -> float:
+        """获取语义缓存的过期时间（秒）"""
+        return self.semantic_cache_ttl
+    
+    def get_flashrag_persist_delay(self) -> float:
+        """获取FlashRAG索引增量更新后延迟保存的时间（秒）"""
+        return self.flashrag_persist_delay
+    
     def is_verbose_startup(self) -> bool:
         """是否启用详细启动日志"""
         return self.verbose_startup
@@ -63,6 +151,12 @@ class StartupOptimizer:
             logger.info(f"禁用向量模型: {self.disable_vector_model}")
             logger.info(f"启用向量缓存: {self.enable_vector_cache}")
             logger.info(f"向量批次大小: {self.vector_batch_size}")
+            logger.info(f"向量缓存精度: {self.vector_cache_dtype}")
+            logger.info(f"查询合并批次: 最多{self.embedding_max_batch}条，等待{self.embedding_batch_wait_ms}ms")
+            logger.info(f"查询向量缓存: {self.query_embedding_cache_size}条，过期时间{self.query_embedding_cache_ttl}s")
+            logger.info(f"结果缓存: {self.result_cache_size}条，{self.result_cache_max_mb}MB，过期时间{self.result_cache_ttl}s")
+            logger.info(f"持久化问答缓存: {self.enable_answer_cache}，{self.answer_cache_size}条，过期时间{self.answer_cache_ttl}s")
+            logger.info(f"语义问答缓存: {self.semantic_cache_size}条，相似度阈值{self.semantic_cache_threshold}，过期时间{self.semantic_cache_ttl}s")
             logger.info(f"详细启动日志: {self.verbose_startup}")
             logger.info("==================")
         else:
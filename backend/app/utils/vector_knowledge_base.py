@@ -1,11 +1,11 @@
 import logging
 import json
 import os
-import pickle
 import numpy as np
-from typing import List, Dict, Any, Optional
-from sentence_transformers import SentenceTransformer
+from typing import Callable, List, Dict, Any, Optional, Set
 from .startup_optimizer import startup_optimizer
+from .embedding_store import EmbeddingStore
+from .embedding_service import embedding_service, MODEL_NAME
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -28,15 +28,19 @@ class VectorKnowledgeBase:
         self.cache_dir = cache_dir or os.path.join(os.path.dirname(__file__), '..', 'cache')
         os.makedirs(self.cache_dir, exist_ok=True)
         
-        # 延迟初始化模型
-        self.model = None
+        # 句向量模型由全局句向量服务共享，延迟加载
+        self.embedding_service = embedding_service
         self.use_mock = False
         self._model_loaded = False
         
         # 文档和向量存储
         self.documents = []  # 存储文档
-        self.embeddings = []  # 存储文档向量
+        self._embedding_buffer = None  # 预分配的向量缓冲区，容量按倍数增长
+        self._embedding_count = 0  # 缓冲区中已使用的行数（L2归一化后的float32文档向量）
         self._embeddings_loaded = False
+        self.embedding_store = None  # 按内容哈希寻址的向量缓存，延迟创建
+        # 返回仍在使用的全部文档（包括尚未导入的），向量缓存合并分段时清理其余向量；为None时不清理
+        self.live_documents: Optional[Callable[[], List[Dict[str, Any]]]] = None
         
         # 如果提供了知识库文件，则加载文档（但不立即生成向量）
         if knowledge_file and os.path.exists(knowledge_file):
@@ -50,24 +54,16 @@ class VectorKnowledgeBase:
         # 检查是否禁用向量模型
         if startup_optimizer.should_disable_vector_model():
             logger.info("向量模型已被禁用，使用模拟模式")
-            self.model = None
             self.use_mock = True
             self._model_loaded = True
             return
             
         try:
-            if not startup_optimizer.is_verbose_startup():
-                logger.info("正在加载句向量模型...")
-            else:
-                logger.info("正在加载句向量模型: paraphrase-multilingual-MiniLM-L12-v2")
-                
-            self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+            self.embedding_service.load()
             self.use_mock = False
             self._model_loaded = True
-            logger.info("成功加载句向量模型")
         except Exception as e:
             logger.warning(f"加载句向量模型失败，将使用模拟模式: {str(e)}")
-            self.model = None
             self.use_mock = True
             self._model_loaded = True
     
@@ -91,66 +87,58 @@ class VectorKnowledgeBase:
         """
         self._load_documents_only(knowledge_file)
         
-        # 尝试从缓存加载向量
+        # 尝试从缓存加载向量（不加载模型，缓存不完整时延迟到搜索时再补齐）
         if self.documents:
-            self._load_embeddings_from_cache(knowledge_file)
+            self._load_embeddings_from_cache()
     
-    def _get_cache_path(self, knowledge_file: str) -> str:
-        """获取缓存文件路径"""
-        # 基于知识库文件的修改时间和内容生成缓存文件名
-        import hashlib
-        
-        file_stat = os.stat(knowledge_file)
-        cache_key = f"{knowledge_file}_{file_stat.st_mtime}_{len(self.documents)}"
-        cache_hash = hashlib.md5(cache_key.encode()).hexdigest()
+    def _get_embedding_store(self) -> Optional[EmbeddingStore]:
+        """获取按内容哈希寻址的向量缓存"""
+        if not startup_optimizer.should_enable_vector_cache():
+            return None
         
-        return os.path.join(self.cache_dir, f"embeddings_{cache_hash}.pkl")
+        if self.embedding_store is None:
+            try:
+                # 缓存中保存的是归一化后的向量
+                self.embedding_store = EmbeddingStore(
+                    os.path.join(self.cache_dir, 'embeddings'),
+                    f"{MODEL_NAME}-normalized",
+                    dtype=startup_optimizer.get_vector_cache_dtype(),
+                    live_hashes=self._live_hashes
+                )
+            except Exception as e:
+                logger.warning(f"初始化向量缓存失败: {str(e)}")
+                return None
+        return self.embedding_store
     
-    def _load_embeddings_from_cache(self, knowledge_file: str) -> bool:
-        """从缓存加载向量嵌入"""
-        if not startup_optimizer.should_enable_vector_cache():
+    def _live_hashes(self) -> Optional[Set[str]]:
+        """仍在使用的向量缓存键：live_documents返回的文档加上已导入的文档；未设置live_documents时返回None"""
+        if self.live_documents is None:
+            return None
+        documents = list(self.live_documents()) + list(self.documents)
+        return {EmbeddingStore.content_hash(self._document_text(doc)) for doc in documents}
+    
+    @staticmethod
+    def _document_text(doc: Dict[str, Any]) -> str:
+        """用于向量化的文档文本"""
+        return f"{doc['title']}. {doc['content']}"
+    
+    def _load_embeddings_from_cache(self) -> bool:
+        """从缓存加载全部文档的向量嵌入，只要有文档未命中就返回False"""
+        store = self._get_embedding_store()
+        if store is None:
             return False
-            
-        cache_path = self._get_cache_path(knowledge_file)
-        
-        try:
-            if os.path.exists(cache_path):
-                if startup_optimizer.is_verbose_startup():
-                    logger.info(f"正在从缓存加载向量嵌入: {cache_path}")
-                else:
-                    logger.info("正在从缓存加载向量嵌入...")
-                    
-                with open(cache_path, 'rb') as f:
-                    self.embeddings = pickle.load(f)
-                self._embeddings_loaded = True
-                logger.info(f"✅ 成功从缓存加载 {len(self.embeddings)} 个向量嵌入")
-                return True
-        except Exception as e:
-            logger.warning(f"从缓存加载向量嵌入失败: {str(e)}")
         
-        return False
-    
-    def _save_embeddings_to_cache(self, knowledge_file: str) -> None:
-        """保存向量嵌入到缓存"""
-        if not startup_optimizer.should_enable_vector_cache():
-            return
-            
-        if not self.embeddings or len(self.embeddings) == 0:
-            return
-            
-        cache_path = self._get_cache_path(knowledge_file)
+        hashes = [EmbeddingStore.content_hash(self._document_text(doc)) for doc in self.documents]
+        embeddings, missing = store.get_many(hashes)
+        if embeddings is None or missing:
+            return False
         
-        try:
-            with open(cache_path, 'wb') as f:
-                pickle.dump(self.embeddings, f)
-            if startup_optimizer.is_verbose_startup():
-                logger.info(f"已保存向量嵌入到缓存: {cache_path}")
-            else:
-                logger.info(f"✅ 已保存 {len(self.embeddings)} 个向量嵌入到缓存")
-        except Exception as e:
-            logger.warning(f"保存向量嵌入到缓存失败: {str(e)}")
+        self.embeddings = embeddings
+        self._embeddings_loaded = True
+        logger.info(f"✅ 成功从缓存加载 {len(self.embeddings)} 个向量嵌入")
+        return True
     
-    def _ensure_embeddings_loaded(self, knowledge_file: str = None) -> None:
+    def _ensure_embeddings_loaded(self) -> None:
         """确保向量嵌入已加载"""
         if self._embeddings_loaded or self.use_mock or not self.documents:
             return
@@ -161,54 +149,105 @@ class VectorKnowledgeBase:
         if self.use_mock:
             return
         
-        # 如果有缓存，尝试加载
-        if knowledge_file and self._load_embeddings_from_cache(knowledge_file):
-            return
-        
-        # 否则生成新的向量嵌入
+        # 生成向量嵌入，缓存中已有的文档不会重新编码
         if startup_optimizer.is_verbose_startup():
             logger.info("正在生成向量嵌入...")
         else:
             logger.info("🔄 正在生成向量嵌入，请稍候...")
         self._generate_embeddings()
+    
+    @property
+    def embeddings(self):
+        """当前所有文档的向量（预分配缓冲区中已使用部分的视图）"""
+        if self._embedding_buffer is None:
+            return []
+        return self._embedding_buffer[:self._embedding_count]
+    
+    @embeddings.setter
+    def embeddings(self, value) -> None:
+        """整体替换文档向量，直接引用传入的数组（可以是只读的内存映射）"""
+        if value is None or len(value) == 0:
+            self._embedding_buffer = None
+            self._embedding_count = 0
+        else:
+            self._embedding_buffer = value
+            self._embedding_count = len(value)
+    
+    def _append_embeddings(self, vectors: np.ndarray) -> None:
+        """
+        追加向量到缓冲区
+        容量不足（或缓冲区是只读的内存映射）时按倍数扩容，均摊下来每次追加为O(1)
+        """
+        if len(vectors) == 0:
+            return
+        
+        buffer = self._embedding_buffer
+        required = self._embedding_count + len(vectors)
         
-        # 保存到缓存
-        if knowledge_file:
-            self._save_embeddings_to_cache(knowledge_file)
+        if buffer is None or not buffer.flags.writeable or required > len(buffer):
+            capacity = max(required, 64, 2 * len(buffer) if buffer is not None else 0)
+            new_buffer = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            if buffer is not None:
+                new_buffer[:self._embedding_count] = buffer[:self._embedding_count]
+            self._embedding_buffer = buffer = new_buffer
+        
+        buffer[self._embedding_count:required] = vectors
+        self._embedding_count = required
+    
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        将文本编码为归一化的向量矩阵
+        缓存中已有的直接读取，只对缺失的按批次编码并写回缓存
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            (len(texts), 维度) 的float32矩阵
+        """
+        hashes = [EmbeddingStore.content_hash(text) for text in texts]
+        
+        # 先从缓存读取，只对缺失的文档编码
+        store = self._get_embedding_store()
+        embeddings, missing = store.get_many(hashes) if store is not None else (None, list(range(len(texts))))
+        
+        if not missing:
+            return embeddings
+        
+        if len(missing) < len(texts):
+            logger.info(f"向量缓存命中 {len(texts) - len(missing)} 篇，需要编码 {len(missing)} 篇")
+        
+        # 批量生成向量嵌入，按 VECTOR_BATCH_SIZE 分批前向计算
+        if startup_optimizer.is_verbose_startup():
+            logger.info(f"使用批次大小: {startup_optimizer.get_vector_batch_size()}")
+        
+        new_embeddings = self._normalize(self.embedding_service.encode([texts[i] for i in missing]))
+        if embeddings is None:
+            embeddings = new_embeddings
+        else:
+            embeddings[missing] = new_embeddings
+        
+        # 保存新编码的向量到缓存
+        if store is not None:
+            store.put_many([hashes[i] for i in missing], new_embeddings)
+        
+        return embeddings
     
     def _generate_embeddings(self) -> None:
-        """为所有文档生成向量嵌入"""
+        """为所有文档生成向量嵌入，只编码缓存中没有的文档"""
         if self.use_mock or not self.documents:
             return
         
         try:
             # 提取文档内容
-            texts = [f"{doc['title']}. {doc['content']}" for doc in self.documents]
-            
-            # 批量生成向量嵌入，显示进度
-            batch_size = startup_optimizer.get_vector_batch_size()
-            all_embeddings = []
+            texts = [self._document_text(doc) for doc in self.documents]
             
+            self.embeddings = self._encode_texts(texts)
+            self._embeddings_loaded = True
             if startup_optimizer.is_verbose_startup():
-                logger.info(f"使用批次大小: {batch_size}")
-            
-            for i in range(0, len(texts), batch_size):
-                batch_texts = texts[i:i + batch_size]
-                batch_embeddings = self.model.encode(
-                    batch_texts, 
-                    convert_to_numpy=True,
-                    show_progress_bar=startup_optimizer.is_verbose_startup()  # 根据配置显示进度条
-                )
-                all_embeddings.append(batch_embeddings)
-            
-            # 合并所有批次的嵌入
-            if all_embeddings:
-                self.embeddings = np.vstack(all_embeddings)
-                self._embeddings_loaded = True
-                if startup_optimizer.is_verbose_startup():
-                    logger.info(f"已为{len(self.documents)}篇文档生成向量嵌入")
-                else:
-                    logger.info(f"✅ 已为 {len(self.documents)} 篇文档生成向量嵌入")
+                logger.info(f"已为{len(self.documents)}篇文档生成向量嵌入")
+            else:
+                logger.info(f"✅ 已为 {len(self.documents)} 篇文档生成向量嵌入")
             
         except Exception as e:
             logger.exception(f"生成向量嵌入失败: {str(e)}")
@@ -224,36 +263,112 @@ class VectorKnowledgeBase:
         Returns:
             是否添加成功
         """
-        try:
+        return self.add_documents([document]) == 1
+    
+    def add_documents(self, documents: List[Dict[str, Any]]) -> int:
+        """
+        批量添加文档到知识库
+        如果向量已加载，新文档按批次编码后追加到向量缓冲区
+        
+        Args:
+            documents: 包含title和content的文档字典列表
+            
+        Returns:
+            成功添加的文档数量
+        """
+        added = []
+        for document in documents:
             # 确保文档格式正确
             if 'title' not in document or 'content' not in document:
                 logger.error("文档格式错误，必须包含title和content字段")
-                return False
+                continue
             
             # 为文档添加ID
             if 'id' not in document:
-                document['id'] = f"doc{len(self.documents) + 1}"
-            
-            # 添加文档
-            self.documents.append(document)
-            
-            # 如果已经加载了向量，为新文档生成向量
+                document['id'] = f"doc{len(self.documents) + len(added) + 1}"
+            added.append(document)
+        
+        if not added:
+            return 0
+        
+        try:
+            # 如果已经加载了向量，先为新文档生成向量，编码成功后再把文档和向量一起加入，保持两者一一对应
             if self._embeddings_loaded and not self.use_mock:
                 self._load_model()  # 确保模型已加载
                 
                 if not self.use_mock:
-                    text = f"{document['title']}. {document['content']}"
-                    embedding = self.model.encode(text, convert_to_numpy=True, show_progress_bar=False)
-                    
-                    if len(self.embeddings) == 0:
-                        self.embeddings = np.array([embedding])
-                    else:
-                        self.embeddings = np.vstack([self.embeddings, embedding])
-            
-            return True
+                    embeddings = self._encode_texts([self._document_text(doc) for doc in added])
+                    self._append_embeddings(embeddings)
         except Exception as e:
             logger.exception(f"添加文档失败: {str(e)}")
-            return False
+            return 0
+        
+        self.documents.extend(added)
+        return len(added)
+    
+    def precompute_embeddings(self, documents: List[Dict[str, Any]]) -> int:
+        """
+        预先为文档编码向量并写入向量缓存，文档本身不加入知识库
+        之后加载这些文档时直接命中缓存，不需要再编码
+        
+        Args:
+            documents: 包含title和content的文档字典列表
+            
+        Returns:
+            写入缓存的文档数量，未启用向量缓存或处于模拟模式时为0
+        """
+        if not documents or self._get_embedding_store() is None:
+            return 0
+        
+        self._load_model()
+        if self.use_mock:
+            return 0
+        
+        self._encode_texts([self._document_text(doc) for doc in documents])
+        return len(documents)
+    
+    def clear(self) -> None:
+        """清空文档和向量，模型和向量缓存保留"""
+        self.documents = []
+        self.embeddings = None
+        self._embeddings_loaded = False
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """将向量转换为float32并做L2归一化，归一化后余弦相似度等于点积"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+    
+    @staticmethod
+    def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """
+        按分数从高到低取前top_k个位置
+        使用argpartition只做部分排序，再对选中的k个排序
+        
+        Args:
+            scores: 一维分数数组，或每行一个查询的二维分数矩阵
+            top_k: 返回数量
+        """
+        n = scores.shape[-1]
+        if top_k >= n:
+            return np.argsort(-scores, axis=-1)
+        
+        candidates = np.argpartition(-scores, top_k - 1, axis=-1)[..., :top_k]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=-1)
+        order = np.argsort(-candidate_scores, axis=-1)
+        return np.take_along_axis(candidates, order, axis=-1)
+    
+    def _collect_results(self, similarities: np.ndarray, top_indices: np.ndarray) -> List[Dict[str, Any]]:
+        """根据相似度和排序后的位置构造返回结果"""
+        results = []
+        for i in top_indices:
+            if similarities[i] > 0.3:  # 设置相似度阈值
+                doc = self.documents[i].copy()
+                doc['similarity'] = float(similarities[i])
+                results.append(doc)
+        return results
     
     def search_documents(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """
@@ -277,30 +392,62 @@ class VectorKnowledgeBase:
             return []
         
         try:
-            # 生成查询向量
-            query_embedding = self.model.encode(query, convert_to_numpy=True, show_progress_bar=False)
+            # 生成归一化的查询向量
+            query_embedding = self._normalize(self.embedding_service.encode_queries([query])[0])
             
-            # 计算相似度
-            similarities = np.dot(self.embeddings, query_embedding) / (
-                np.linalg.norm(self.embeddings, axis=1) * np.linalg.norm(query_embedding)
-            )
+            # 文档向量已预先归一化，余弦相似度即点积
+            similarities = self.embeddings @ query_embedding
             
             # 获取最相关的文档索引
-            top_indices = np.argsort(-similarities)[:top_k]
+            top_indices = self._top_k_indices(similarities, top_k)
             
             # 返回最相关的文档
-            results = []
-            for i in top_indices:
-                if similarities[i] > 0.3:  # 设置相似度阈值
-                    doc = self.documents[i].copy()
-                    doc['similarity'] = float(similarities[i])
-                    results.append(doc)
-            
-            return results
+            return self._collect_results(similarities, top_indices)
         except Exception as e:
             logger.exception(f"搜索文档失败: {str(e)}")
             return self._mock_search(query, top_k)  # 失败时回退到模拟搜索
     
+    def search_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        批量搜索，一次矩阵乘法为所有查询打分
+        适用于批量评估和预取等场景
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回的最相关文档数量
+            
+        Returns:
+            与queries一一对应的相关文档列表
+        """
+        if not queries:
+            return []
+        
+        # 确保向量嵌入已加载
+        self._ensure_embeddings_loaded()
+        
+        if self.use_mock:
+            return [self._mock_search(query, top_k) for query in queries]
+        
+        if not self.documents or len(self.embeddings) == 0:
+            logger.warning("知识库为空，无法搜索")
+            return [[] for _ in queries]
+        
+        try:
+            # 批量编码查询
+            query_embeddings = self._normalize(self.embedding_service.encode(queries))
+            
+            # (查询数, 文档数) 的相似度矩阵
+            similarities = query_embeddings @ self.embeddings.T
+            top_indices = self._top_k_indices(similarities, top_k)
+            
+            return [
+                self._collect_results(similarities[row], top_indices[row])
+                for row in range(len(queries))
+            ]
+        except Exception as e:
+            logger.exception(f"批量搜索文档失败: {str(e)}")
+            return [self._mock_search(query, top_k) for query in queries]
+    
     def _mock_search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
         """
         模拟搜索功能（当向量搜索不可用时）
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+知识库关键词检索的相关性与延迟基准测试
+
+在合成的中文语料上对比旧实现（chat_with_knowledge_base 中的整数加分 match_score，全量扫描）
+与倒排索引上的BM25打分（堆选取top-k）。
+语料由若干主题构成：同一主题的文档反复出现该主题的关键词，文档长短不一，
+并按长度混入其他主题的关键词作为干扰；
+查询由某个主题的一到两个关键词组成，该主题的文档即为相关文档。
+
+用法:
+    cd backend
+    python benchmarks/bench_bm25.py
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.utils.inverted_index import InvertedIndex
+
+SIZES = [1_000, 5_000, 20_000]
+DOCS_PER_TOPIC = 10  # 主题数随语料规模增长，每个查询平均约有10篇相关文档
+TOPIC_WORDS = 4
+VOCABULARY = 5_000
+DOC_WORDS = (50, 800)  # 文档长度范围（词数）
+NOISE_RATIO = 0.05  # 其他主题关键词占文档长度的比例
+TOP_K = 3
+QUERIES = 100
+SEED = 42
+
+
+def make_words(rng, count):
+    """生成互不相同的双字中文词"""
+    words = set()
+    while len(words) < count:
+        words.add(chr(rng.randrange(0x4E00, 0x9FA5)) + chr(rng.randrange(0x4E00, 0x9FA5)))
+    return list(words)
+
+
+def build_corpus(size, topics, rng):
+    """构造语料，返回 (文档字典, 每个主题的关键词, 每个文档所属主题)"""
+    words = make_words(rng, VOCABULARY + topics * TOPIC_WORDS)
+    background, topic_pool = words[:VOCABULARY], words[VOCABULARY:]
+    topic_words = [topic_pool[i * TOPIC_WORDS:(i + 1) * TOPIC_WORDS] for i in range(topics)]
+    # 背景词按Zipf分布采样
+    weights = [1.0 / (rank + 1) for rank in range(VOCABULARY)]
+
+    documents, labels = {}, {}
+    for doc_no in range(size):
+        topic = rng.randrange(topics)
+        length = rng.randint(*DOC_WORDS)
+        body = rng.choices(background, weights=weights, k=length)
+        body += rng.choices(topic_words[topic], k=rng.randint(2, 6))
+        # 干扰：按文档长度混入其他主题的关键词，长文档更容易"碰巧"包含查询词
+        body += [rng.choice(topic_words[rng.randrange(topics)]) for _ in range(int(length * NOISE_RATIO))]
+        rng.shuffle(body)
+        title = ''.join(rng.sample(topic_words[topic], 1) + rng.choices(background, k=3))
+        documents[str(doc_no)] = {'title': title, 'content': '，'.join(body)}
+        labels[str(doc_no)] = topic
+    return documents, topic_words, labels
+
+
+def legacy_rank(documents, user_query):
+    """旧实现：整数加分后整体排序"""
+    query_lower = user_query.lower()
+    keywords = user_query.lower().split()
+    relevant_documents = []
+    for doc_id, doc in documents.items():
+        doc_content = doc['content'].lower()
+        doc_title = doc['title'].lower()
+        match_score = 0
+        if query_lower in doc_title:
+            match_score += 5
+        if query_lower in doc_content:
+            match_score += 3
+        for keyword in keywords:
+            if len(keyword) > 1:
+                if keyword in doc_title:
+                    match_score += 2
+                if keyword in doc_content:
+                    match_score += 1
+        if match_score > 0:
+            relevant_documents.append((doc_id, match_score))
+    relevant_documents.sort(key=lambda x: x[1], reverse=True)
+    return [doc_id for doc_id, _ in relevant_documents[:TOP_K]]
+
+
+def bm25_rank(index, user_query):
+    """新实现：倒排表上的BM25打分，堆选取top-k"""
+    return [doc_id for doc_id, _ in index.top_k(user_query, TOP_K)]
+
+
+def evaluate(rank, container, queries, labels):
+    """返回 (precision@k, MRR, 每次查询平均耗时毫秒)"""
+    hits, reciprocal, elapsed = 0, 0.0, 0.0
+    for user_query, topic in queries:
+        start = time.perf_counter()
+        ranked = rank(container, user_query)
+        elapsed += time.perf_counter() - start
+
+        relevant = [labels[doc_id] == topic for doc_id in ranked]
+        hits += sum(relevant)
+        reciprocal += next((1.0 / (i + 1) for i, ok in enumerate(relevant) if ok), 0.0)
+    count = len(queries)
+    return hits / (count * TOP_K), reciprocal / count, elapsed / count * 1000
+
+
+def main():
+    print(f"{'文档数':>8} | {'实现':<8} | {'P@3':>6} | {'MRR':>6} | {'ms/查询':>9}")
+    print("-" * 50)
+    for size in SIZES:
+        rng = random.Random(SEED)
+        topics = size // DOCS_PER_TOPIC
+        documents, topic_words, labels = build_corpus(size, topics, rng)
+
+        start = time.perf_counter()
+        index = InvertedIndex()
+        index.build(documents)
+        build_seconds = time.perf_counter() - start
+
+        queries = []
+        for _ in range(QUERIES):
+            topic = rng.randrange(topics)
+            queries.append((' '.join(rng.sample(topic_words[topic], rng.randint(1, 2))), topic))
+
+        legacy = evaluate(legacy_rank, documents, queries, labels)
+        bm25 = evaluate(bm25_rank, index, queries, labels)
+        print(f"{size:>8} | {'旧实现':<8} | {legacy[0]:>6.3f} | {legacy[1]:>6.3f} | {legacy[2]:>9.2f}")
+        print(f"{size:>8} | {'BM25':<8} | {bm25[0]:>6.3f} | {bm25[1]:>6.3f} | {bm25[2]:>9.2f}   (建索引 {build_seconds:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+批量爬取流水线的吞吐量基准测试
+
+启动本地HTTP测试服务，模拟多个站点（127.0.0.1 ~ 127.0.0.N 都指向本机），每个页面是带标题、段落、列表、
+代码和表格的文章，服务端按固定延迟返回。总结阶段用固定耗时的模拟函数代替真实LLM调用。
+对比逐个URL顺序执行（相当于每个URL调用一次 /tech_summaries/crawl）和批量流水线的总耗时、吞吐量
+以及每个URL产出结果的时间，并统计每个站点的最大并发请求数，确认没有超过域名限制。
+
+用法:
+    cd backend
+    python benchmarks/bench_bulk_crawl.py [--urls 120] [--hosts 6] [--page-latency-ms 100] [--llm-latency-ms 300]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.utils.crawler import fetch_url, extract_main_content
+from app.utils.crawl_pipeline import CrawlPipeline, HostLimiter, RateLimiter
+
+
+def build_page(index, sections=30):
+    """生成一篇测试文章"""
+    parts = [f"<html><head><title>测试文章 {index}</title></head><body><nav><a href='/'>首页</a></nav><article>"]
+    for i in range(sections):
+        parts.append(f"<h2>第{i}节 检索增强生成</h2>")
+        parts.append("<p>" + "检索增强生成先从知识库中检索相关文档，再让语言模型基于这些文档生成答案。" * 4 + "</p>")
+        parts.append("<ul>" + "".join(f"<li>要点 {j}：<a href='/doc/{j}'>参考文档</a></li>" for j in range(5)) + "</ul>")
+        parts.append("<pre><code>def retrieve(query):\n    return index.search(query, top_k=5)</code></pre>")
+        parts.append("<table>" + "".join(f"<tr><td>指标{j}</td><td>{j * 10}</td></tr>" for j in range(4)) + "</table>")
+    parts.append("</article><script>var x = 1;</script></body></html>")
+    return "".join(parts).encode('utf-8')
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(('0.0.0.0', 0), _Handler)
+        self.latency = latency
+        self.page = build_page(0)
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+
+    def reset_stats(self):
+        with self.lock:
+            self.active.clear()
+            self.peak.clear()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        host = self.headers.get('Host', '')
+        with server.lock:
+            server.active[host] = server.active.get(host, 0) + 1
+            server.peak[host] = max(server.peak.get(host, 0), server.active[host])
+        try:
+            time.sleep(server.latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(server.page)))
+            self.end_headers()
+            self.wfile.write(server.page)
+        finally:
+            with server.lock:
+                server.active[host] -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--urls', type=int, default=120)
+    parser.add_argument('--hosts', type=int, default=6)
+    parser.add_argument('--page-latency-ms', type=float, default=100)
+    parser.add_argument('--llm-latency-ms', type=float, default=300)
+    parser.add_argument('--fetch-workers', type=int, default=16)
+    parser.add_argument('--max-per-host', type=int, default=2)
+    parser.add_argument('--host-interval', type=float, default=0.05)
+    parser.add_argument('--extract-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--llm-workers', type=int, default=8)
+    parser.add_argument('--llm-rpm', type=float, default=0)
+    args = parser.parse_args()
+
+    server = FixtureServer(args.page_latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    urls = [f"http://127.0.0.{i % args.hosts + 1}:{port}/article/{i}" for i in range(args.urls)]
+
+    def summarize(extracted, url):
+        time.sleep(args.llm_latency_ms / 1000)
+        return {'title': extracted['title'], 'length': len(extracted['content'])}
+
+    def sequential():
+        start = time.perf_counter()
+        for url in urls:
+            summarize(extract_main_content(fetch_url(url), url), url)
+            yield time.perf_counter() - start
+
+    def pipelined():
+        pipeline = CrawlPipeline(
+            fetch=fetch_url, extract=extract_main_content, summarize=summarize,
+            fetch_workers=args.fetch_workers,
+            host_limiter=HostLimiter(max_per_host=args.max_per_host, min_interval=args.host_interval),
+            extract_workers=args.extract_workers, llm_workers=args.llm_workers,
+            rate_limiter=RateLimiter(per_minute=args.llm_rpm)
+        )
+        start = time.perf_counter()
+        for result in pipeline.run(urls):
+            assert result['success'], result['message']
+            yield time.perf_counter() - start
+
+    # 预热：启动提取进程、加载BeautifulSoup
+    list(CrawlPipeline(fetch=fetch_url, extract=extract_main_content, extract_workers=args.extract_workers,
+                       host_limiter=HostLimiter(min_interval=0)).run(urls[:args.hosts]))
+
+    print(f"{args.urls}个URL，{args.hosts}个站点，页面 {len(server.page) // 1024}KB / 延迟{args.page_latency_ms:g}ms，"
+          f"模拟总结延迟{args.llm_latency_ms:g}ms，CPU {os.cpu_count()}核")
+    print(f"{'方式':<16} | {'总耗时(s)':>9} | {'URL/秒':>7} | {'首个结果(s)':>11} | {'p50结果(s)':>10} | {'单站点最大并发':>14}")
+    print("-" * 90)
+    for label, run in (('逐个顺序执行', sequential), ('批量流水线', pipelined)):
+        server.reset_stats()
+        times = list(run())
+        total = times[-1]
+        print(f"{label:<14} | {total:>9.2f} | {len(times) / total:>7.1f} | {times[0]:>11.2f} | "
+              f"{statistics.median(times):>10.2f} | {max(server.peak.values()):>14}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+查询编码合并批处理的负载测试
+
+用32个并发调用方请求 /api/v1/rag/chat，对比逐条编码（EMBEDDING_BATCH_WAIT_MS=0）与合并批处理的吞吐量。
+LLM生成阶段替换为固定回答，只测量检索部分（查询编码 + FAISS搜索）。
+
+安装了sentence-transformers时使用真实模型；否则使用模拟模型：每次前向计算耗时 = 固定开销 + 每条文本的开销，
+并且前向计算互斥执行（真实模型一次前向计算就会占满所有CPU核心，多个小批次并发执行并不会更快）。
+
+用法:
+    cd backend
+    python benchmarks/bench_embedding_batching.py [--requests 2000] [--concurrency 32]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+import statistics
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app
+from app.utils.embedding_service import embedding_service
+from app.utils.flashrag_service import flashrag_service
+from app.utils.startup_optimizer import startup_optimizer
+
+# 模拟模型的耗时参数（秒）
+SIMULATED_PASS_OVERHEAD = 0.008
+SIMULATED_PER_TEXT = 0.0005
+
+
+class SimulatedModel:
+    """模拟的句向量模型，前向计算互斥执行"""
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self._cpu = threading.Lock()
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, **kwargs):
+        with self._cpu:
+            time.sleep(SIMULATED_PASS_OVERHEAD + SIMULATED_PER_TEXT * len(texts))
+        return np.random.rand(len(texts), self.dimension).astype(np.float32)
+
+
+class CountingModel:
+    """统计前向计算次数的模型包装"""
+
+    def __init__(self, model):
+        self.model = model
+        self.passes = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, **kwargs):
+        self.passes += 1
+        return self.model.encode(texts, **kwargs)
+
+
+def prepare(num_documents):
+    """加载模型，构建一个小规模的FlashRAG索引，并替换LLM生成"""
+    try:
+        import sentence_transformers  # noqa: F401
+        model = embedding_service.load()
+        print(f"使用真实模型: {embedding_service.model_name}")
+    except (ImportError, RuntimeError):
+        model = SimulatedModel(embedding_service.dimension)
+        print(f"未安装sentence-transformers，使用模拟模型（每次前向计算 {SIMULATED_PASS_OVERHEAD * 1000:.0f}ms"
+              f" + 每条 {SIMULATED_PER_TEXT * 1000:.1f}ms，互斥执行）")
+    counting = CountingModel(model)
+    embedding_service._model = counting
+
+    documents = [{'id': f"bench-{i}", 'title': f"技术总结{i}", 'content': f"第{i}篇技术总结的内容，介绍检索增强生成与向量索引。"}
+                 for i in range(num_documents)]
+    flashrag_service.upsert_documents(documents, persist=False)
+
+    def generate_answer(query, relevant_docs, provider="deepseek"):
+        return {"success": True, "data": {"answer": "stub", "sources": [], "model": provider}}
+    flashrag_service.generate_answer = generate_answer
+    return counting
+
+
+def run(app, counting, wait_ms, total_requests, concurrency):
+    """以给定的等待窗口运行一轮负载，返回统计结果"""
+    startup_optimizer.embedding_batch_wait_ms = wait_ms
+    embedding_service._batcher = None
+    flashrag_service.cache.clear()
+    counting.passes = 0
+
+    local = threading.local()
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def call(i):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        # 每个查询都不同，避免命中查询缓存
+        response = client.post('/api/v1/rag/chat', json={'query': f"什么是检索增强生成 {wait_ms} {i}"})
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200, response.data
+        with latencies_lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(total_requests)))
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'throughput': total_requests / duration,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'passes': counting.passes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--documents', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    logging.getLogger().setLevel(logging.WARNING)
+    counting = prepare(args.documents)
+
+    configured_wait = startup_optimizer.get_embedding_batch_wait_ms() or 5
+    print(f"{args.concurrency}个并发调用方，共{args.requests}个请求，合并批次上限 {startup_optimizer.get_embedding_max_batch()}")
+    print(f"{'模式':<16} | {'请求/秒':>9} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'前向计算次数':>12}")
+    print("-" * 70)
+    for label, wait_ms in (('逐条编码', 0), (f"合并批处理 {configured_wait:g}ms", configured_wait)):
+        result = run(app, counting, wait_ms, args.requests, args.concurrency)
+        print(f"{label:<16} | {result['throughput']:>9.1f} | {result['p50']:>9.1f} | {result['p95']:>9.1f} | {result['passes']:>12}")
+
+
+if __name__ == '__main__':
+    main()
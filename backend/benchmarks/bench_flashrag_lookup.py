@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+FlashRAG搜索结果定位的微基准测试
+
+对比旧实现（每个命中执行 list(document_map.keys())[idx]）与 ChunkStore 按行号 O(1) 定位，
+文档块规模从1千增长到100万。FAISS本身的向量扫描开销与定位方式无关，这里用随机命中行号模拟。
+
+用法:
+    cd backend
+    python benchmarks/bench_flashrag_lookup.py
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.utils.chunk_store import ChunkStore
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+CHUNKS_PER_DOC = 5
+TOP_K = 5
+QUERIES = 200
+LEGACY_MAX_QUERIES = 20  # 旧实现在大规模下太慢，只跑少量查询
+
+
+def build_corpus(size):
+    """构造指定规模的文档块，同时返回旧结构（dict）和新结构（ChunkStore）"""
+    document_map = {}
+    chunk_store = ChunkStore()
+    for doc_no in range(size // CHUNKS_PER_DOC):
+        doc_id = str(doc_no)
+        records = []
+        for i in range(CHUNKS_PER_DOC):
+            record = {
+                'chunk_id': f"{doc_id}_chunk_{i}",
+                'original_id': doc_id,
+                'title': f"文档{doc_no}",
+                'content': f"文档{doc_no}的第{i}个分块",
+                'metadata': {}
+            }
+            document_map[record['chunk_id']] = record
+            records.append(record)
+        chunk_store.append(doc_id, records)
+    return document_map, chunk_store
+
+
+def legacy_lookup(document_map, indices):
+    """旧实现：每个命中都构造一次全部键的列表"""
+    results = []
+    for idx in indices:
+        if idx != -1 and idx < len(document_map):
+            chunk_id = list(document_map.keys())[idx]
+            results.append(document_map[chunk_id])
+    return results
+
+
+def store_lookup(chunk_store, indices):
+    """新实现：按行号直接定位"""
+    results = []
+    for idx in indices:
+        record = chunk_store.get(int(idx))
+        if record is not None:
+            results.append(record)
+    return results
+
+
+def time_per_query(func, container, queries):
+    """返回每次查询的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for indices in queries:
+        func(container, indices)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    print(f"{'文档块数':>10} | {'旧实现 (µs/查询)':>18} | {'ChunkStore (µs/查询)':>22}")
+    print("-" * 58)
+    for size in SIZES:
+        document_map, chunk_store = build_corpus(size)
+        queries = [[random.randrange(size) for _ in range(TOP_K)] for _ in range(QUERIES)]
+
+        legacy = time_per_query(legacy_lookup, document_map, queries[:LEGACY_MAX_QUERIES])
+        positional = time_per_query(store_lookup, chunk_store, queries)
+        print(f"{size:>10} | {legacy:>18.1f} | {positional:>22.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+网页正文提取的基准测试
+
+生成类似文档站点的大页面（顶部导航、侧边栏目录、多层 .container、带语法高亮的代码块、表格、列表、引用），
+对比基于BeautifulSoup逐轮替换的原实现（extract_main_content_bs4，html.parser）和单遍转换（html_to_markdown）的
+耗时和内存峰值，并确认输出与使用同一解析器的原实现相同。安装了lxml时同时测试 parser='lxml' 的单遍转换。
+
+用法:
+    cd backend
+    python benchmarks/bench_html_extract.py [--sizes 1,2.5,5] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.utils.crawler import extract_main_content_bs4
+from app.utils.html_markdown import html_to_markdown, LXML_AVAILABLE
+
+URL = 'https://docs.example.com/guide/retrieval.html'
+
+
+def build_section(i):
+    return (
+        f'<section id="sec-{i}"><h2 id="h-{i}">{i}. 检索增强生成 <a class="headerlink" href="#h-{i}">¶</a></h2>'
+        f'<p>检索增强生成先从<a href="/guide/index-{i}.html">知识库</a>中检索相关文档，再让<em>语言模型</em>基于这些文档生成答案，'
+        f'<code>top_k</code> 控制检索的文档数量 &amp; 召回率。</p>'
+        '<div class="highlight"><pre><span class="k">def</span> <span class="nf">retrieve</span>(query, top_k=5):\n'
+        '    <span class="n">hits</span> = index.search(query, top_k)\n'
+        '    <span class="k">return</span> [hit.text <span class="k">for</span> hit <span class="ow">in</span> hits]</pre></div>'
+        '<ul><li>向量检索：<code>faiss</code></li><li>关键词检索：BM25<ul><li>中文分词</li><li>停用词</li></ul></li></ul>'
+        '<ol><li>编码查询</li><li>检索文档</li><li>生成回答</li></ol>'
+        '<table class="docutils"><thead><tr><th>参数</th><th>默认值</th></tr></thead>'
+        '<tbody><tr><td><code>top_k</code></td><td>5</td></tr><tr><td>threshold</td><td>0.6</td></tr></tbody></table>'
+        '<blockquote><p>注意：文档过长时需要先分块。</p></blockquote>'
+        f'<img src="/_images/pipeline-{i}.png" alt="流程图 {i}"></section>\n'
+    )
+
+
+def build_page(size_mb):
+    """生成约size_mb MB的文档页面"""
+    target = int(size_mb * 1024 * 1024)
+    sidebar = ''.join(f'<li class="toctree-l1"><a class="reference internal" href="/guide/page-{i}.html">第{i}章</a></li>'
+                      for i in range(300))
+    head = ('<!DOCTYPE html><html lang="zh"><head><meta charset="utf-8"><title>检索增强生成指南</title>'
+            '<link rel="stylesheet" href="/_static/theme.css"><script>var DOCUMENTATION_OPTIONS = {};</script></head>'
+            '<body><nav class="navbar"><div class="container"><a href="/">首页</a><form action="/search"><input name="q"></form></div></nav>'
+            f'<div class="container"><div class="sidebar"><ul>{sidebar}</ul></div>'
+            '<div class="document"><div class="documentation"><div class="container body-content">')
+    tail = ('</div></div></div></div><footer class="container"><p>© 2024</p></footer>'
+            '<script src="/_static/searchtools.js"></script></body></html>')
+    sections = []
+    size = len(head) + len(tail)
+    i = 0
+    while size < target:
+        section = build_section(i)
+        sections.append(section)
+        size += len(section.encode('utf-8'))
+        i += 1
+    return head + ''.join(sections) + tail
+
+
+def measure(extract, html, repeat):
+    """返回 (最短耗时, 内存峰值MB, 结果)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = extract(html, URL)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    extract(html, URL)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1024 / 1024, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,2.5,5')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    parsers = ['html.parser'] + (['lxml'] if LXML_AVAILABLE else [])
+    print(f"{'页面(MB)':>8} | {'解析器':>11} | {'原实现(s)':>9} | {'单遍(s)':>7} | {'加速':>5} | "
+          f"{'原实现峰值(MB)':>14} | {'单遍峰值(MB)':>12} | 输出相同")
+    print("-" * 104)
+    for size_mb in (float(s) for s in args.sizes.split(',')):
+        html = build_page(size_mb)
+        legacy_time, legacy_peak, legacy = measure(extract_main_content_bs4, html, args.repeat)
+        for name in parsers:
+            fast_time, fast_peak, fast = measure(lambda doc, url: html_to_markdown(doc, url, name), html, args.repeat)
+            # 与使用同一解析器的原实现比较
+            expected = legacy if name == 'html.parser' else extract_main_content_bs4(html, URL, name)
+            print(f"{len(html.encode('utf-8')) / 1024 / 1024:>8.2f} | {name:>11} | {legacy_time:>9.2f} | "
+                  f"{fast_time:>7.2f} | {legacy_time / fast_time:>4.1f}x | {legacy_peak:>14.1f} | {fast_peak:>12.1f} | "
+                  f"{expected == fast}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+LLM网关的延迟与握手次数基准测试
+
+启动本地LLM桩服务（默认开启TLS），分别用旧的调用方式（每次 requests.post，新建TCP+TLS连接）
+和LLM网关（长期存在的连接池）发送相同的聊天请求，对比顺序调用和并发调用时的延迟与服务端接受的连接数。
+桩服务的固定处理延迟从结果中扣除，只比较客户端和连接建立的开销。
+
+用法:
+    cd backend
+    python benchmarks/bench_llm_gateway.py [--requests 200] [--concurrency 16] [--latency-ms 50] [--no-tls]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.llm_gateway import LLMGateway
+from llm_stub_server import LLMStubServer
+
+PAYLOAD = {
+    "model": "deepseek-chat",
+    "messages": [
+        {"role": "system", "content": "你是一个智能问答助手。"},
+        {"role": "user", "content": "什么是检索增强生成？"}
+    ],
+    "temperature": 0.3
+}
+HEADERS = {"Content-Type": "application/json", "Authorization": "Bearer stub"}
+
+
+def run(call, total, concurrency):
+    """执行total次调用，返回每次调用的耗时（秒）"""
+    def timed(_):
+        start = time.perf_counter()
+        response = call()
+        assert response.status_code == 200, response.text
+        response.json()
+        return time.perf_counter() - start
+
+    if concurrency <= 1:
+        return [timed(i) for i in range(total)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(timed, range(total)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--no-tls', action='store_true')
+    args = parser.parse_args()
+
+    server = LLMStubServer(latency_ms=args.latency_ms, tls=not args.no_tls).start()
+    url = f"{server.base_url}/v1/chat/completions"
+    verify = server.cert_path or True
+    gateway = LLMGateway(verify=verify)
+
+    clients = [
+        ('requests.post（每次新建连接）', lambda: requests.post(url, headers=HEADERS, json=PAYLOAD, timeout=60, verify=verify)),
+        ('LLM网关（连接池）', lambda: gateway.post(url, json=PAYLOAD, headers=HEADERS, timeout=60))
+    ]
+
+    print(f"桩服务 {server.base_url}（{'TLS' if server.cert_path else '明文'}），固定处理延迟 {args.latency_ms:g}ms，"
+          f"共{args.requests}个请求")
+    print(f"{'客户端':<28} | {'并发':>4} | {'平均开销(ms)':>12} | {'p95开销(ms)':>11} | {'总耗时(s)':>9} | {'连接数':>6}")
+    print("-" * 90)
+    for concurrency in (1, args.concurrency):
+        for label, call in clients:
+            run(call, 2, 1)  # 预热：加载证书、建立事件循环
+            server.reset_stats()
+            start = time.perf_counter()
+            latencies = run(call, args.requests, concurrency)
+            duration = time.perf_counter() - start
+            overheads = sorted((latency - server.latency) * 1000 for latency in latencies)
+            p95 = overheads[int(len(overheads) * 0.95) - 1]
+            print(f"{label:<24} | {concurrency:>4} | {statistics.mean(overheads):>12.2f} | {p95:>11.2f} | "
+                  f"{duration:>9.2f} | {server.connections:>6}")
+
+    print(f"\n网关统计: {gateway.stats()}")
+    gateway.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
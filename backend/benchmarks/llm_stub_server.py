@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+本地LLM桩服务
+
+模拟OpenAI兼容的 /v1/chat/completions（DeepSeek、OpenAI）和Ollama的 /api/chat 接口，
+按配置的延迟返回固定回答，支持流式响应（SSE / 逐行JSON），并统计服务端接受的连接数和请求数，
+用于在不访问外部服务的情况下测量LLM调用的延迟和握手次数。
+开启TLS时使用临时生成的自签名证书（需要openssl命令行），服务端只支持HTTP/1.1。
+
+用法:
+    cd backend
+    python benchmarks/llm_stub_server.py [--port 8765] [--latency-ms 200] [--tls]
+    # 然后把 DEEPSEEK_API_URL 指向 http(s)://127.0.0.1:8765/v1/chat/completions
+"""
+
+import os
+import ssl
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "这是桩服务返回的回答。检索增强生成先从知识库中检索相关文档，再让语言模型基于这些文档生成答案。"
+
+
+def generate_certificate(directory):
+    """用openssl命令行生成localhost的自签名证书，返回 (证书路径, 私钥路径)"""
+    cert_path = os.path.join(directory, 'stub.crt')
+    key_path = os.path.join(directory, 'stub.key')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1', '-nodes',
+        '-days', '1', '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+        '-keyout', key_path, '-out', cert_path
+    ], check=True, capture_output=True)
+    return cert_path, key_path
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持keep-alive
+    disable_nagle_algorithm = True  # 响应头和响应体分两次写出，避免被Nagle算法延迟
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        server = self.server
+        with server.stats_lock:
+            server.requests += 1
+        time.sleep(server.latency)
+
+        ollama = self.path.startswith('/api/')
+        if not body.get('stream'):
+            if ollama:
+                payload = {'message': {'role': 'assistant', 'content': ANSWER}, 'done': True}
+            else:
+                payload = {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ANSWER}}]}
+            data = json.dumps(payload, ensure_ascii=False).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson' if ollama else 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        pieces = [ANSWER[i:i + 8] for i in range(0, len(ANSWER), 8)]
+        for piece in pieces:
+            if ollama:
+                line = json.dumps({'message': {'content': piece}, 'done': False}, ensure_ascii=False) + '\n'
+            else:
+                line = 'data: ' + json.dumps({'choices': [{'delta': {'content': piece}}]}, ensure_ascii=False) + '\n\n'
+            self._write_chunk(line.encode())
+            time.sleep(server.token_interval)
+        self._write_chunk((json.dumps({'done': True}) + '\n' if ollama else 'data: [DONE]\n\n').encode())
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+
+class LLMStubServer(ThreadingHTTPServer):
+    """LLM桩服务，统计接受的连接数（即客户端的TCP握手次数，开启TLS时也是TLS握手次数）"""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency_ms=200, token_interval_ms=20, tls=False):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.latency = latency_ms / 1000
+        self.token_interval = token_interval_ms / 1000
+        self.connections = 0
+        self.requests = 0
+        self.stats_lock = threading.Lock()
+        self.cert_path = None
+        if tls:
+            self._cert_dir = tempfile.TemporaryDirectory()
+            self.cert_path, key_path = generate_certificate(self._cert_dir.name)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.cert_path, key_path)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    def get_request(self):
+        request = super().get_request()
+        with self.stats_lock:
+            self.connections += 1
+        return request
+
+    @property
+    def base_url(self):
+        scheme = 'https' if self.cert_path else 'http'
+        return f"{scheme}://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        """在后台线程中运行"""
+        threading.Thread(target=self.serve_forever, name='llm-stub', daemon=True).start()
+        return self
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.connections = 0
+            self.requests = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=200)
+    parser.add_argument('--token-interval-ms', type=float, default=20)
+    parser.add_argument('--tls', action='store_true')
+    args = parser.parse_args()
+
+    server = LLMStubServer(args.port, args.latency_ms, args.token_interval_ms, args.tls)
+    print(f"LLM桩服务: {server.base_url}/v1/chat/completions , {server.base_url}/api/chat")
+    if server.cert_path:
+        print(f"自签名证书: {server.cert_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n连接数 {server.connections}，请求数 {server.requests}")
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app.utils.answer_cache import AnswerCache
+
+class TestAnswerCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'answers.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_shared_between_instances(self):
+        """不同实例（模拟多个worker进程）共享同一个数据库"""
+        AnswerCache(self.path).set('k', 'v1', {'success': True, 'data': {'answer': '回答'}})
+        other = AnswerCache(self.path)
+        self.assertEqual(other.get('k', 'v1'), {'success': True, 'data': {'answer': '回答'}})
+        self.assertEqual(other.stats()['hits'], 1)
+
+    def test_knowledge_base_version_mismatch(self):
+        """知识库版本变化后视为未命中，清理时删除旧版本的条目"""
+        cache = AnswerCache(self.path)
+        cache.set('k', 'v1', {'answer': 1})
+        self.assertIsNone(cache.get('k', 'v2'))
+        self.assertEqual(cache.prune('v2'), 1)
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_prunes_least_recently_accessed(self):
+        """超过条目数上限时淘汰最久未访问的条目"""
+        cache = AnswerCache(self.path, max_entries=10)
+        for i in range(15):
+            cache.set(f"k{i}", 'v1', {'answer': i})
+        self.assertLessEqual(cache.stats()['size'], 10)
+        self.assertIsNone(cache.get('k0', 'v1'))
+        self.assertEqual(cache.get('k14', 'v1'), {'answer': 14})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+from app.utils import background_jobs
+from app.utils.job_queue import JobQueue
+
+class FakeApp:
+    """只提供app_context，记录任务是否在应用上下文中执行"""
+
+    def __init__(self):
+        self.active = False
+
+    @contextmanager
+    def app_context(self):
+        self.active = True
+        try:
+            yield
+        finally:
+            self.active = False
+
+
+class TestBackgroundJobs(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'background.db')
+        self.app = FakeApp()
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def make_queue(self):
+        """模拟一个worker进程：同一个数据库文件上的独立队列实例"""
+        queue = JobQueue(self.path, workers=0, dedup_ttl=0)
+
+        def handler(job, params):
+            self.calls.append(self.app.active)
+            job.update('indexing 1/1')
+            return {'documents': params['batch_size']}
+        with mock.patch.object(background_jobs, 'background_job_queue', queue):
+            background_jobs.register_app_job(self.app, 'knowledge_base_init', handler)
+        return queue
+
+    def test_shared_between_processes(self):
+        """任一进程都能查询任务，执行中的同名任务只有一个，完成后再次提交会重新执行"""
+        first, second = self.make_queue(), self.make_queue()
+        job, created = first.submit('knowledge_base_init', {'batch_size': 2}, dedup_key='knowledge_base_init')
+        self.assertTrue(created)
+        same, created = second.submit('knowledge_base_init', {'batch_size': 2}, dedup_key='knowledge_base_init')
+        self.assertEqual((same['id'], created), (job['id'], False))
+        self.assertEqual(second.get(job['id'])['status'], 'pending')
+
+        self.assertTrue(second.run_next())
+        self.assertFalse(first.run_next())
+        job = first.get(job['id'])
+        self.assertEqual((job['status'], job['stage'], job['result']), ('completed', 'indexing 1/1', {'documents': 2}))
+        self.assertEqual(self.calls, [True])
+
+        rerun, created = first.submit('knowledge_base_init', {'batch_size': 2}, dedup_key='knowledge_base_init')
+        self.assertTrue(created)
+        self.assertNotEqual(rerun['id'], job['id'])
+
+if __name__ == "__main__":
+    unittest.main()
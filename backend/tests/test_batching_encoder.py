@@ -0,0 +1,48 @@
+import threading
+import unittest
+import numpy as np
+from app.utils.embedding_service import BatchingEncoder
+
+def _encode(texts):
+    return np.array([[float(text)] for text in texts], dtype=np.float32)
+
+class TestBatchingEncoder(unittest.TestCase):
+    def test_concurrent_requests_share_a_batch(self):
+        """等待窗口内的并发请求合并为一次编码，结果按请求拆分返回"""
+        batches = []
+        def encode(texts):
+            batches.append(len(texts))
+            return _encode(texts)
+
+        encoder = BatchingEncoder(encode, max_batch=64, wait_ms=200)
+        results = {}
+        def call(i):
+            results[i] = encoder.encode([str(i), str(i + 100)])
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(len(batches), 8)
+        self.assertEqual(sum(batches), 16)
+        for i in range(8):
+            self.assertEqual(results[i][:, 0].tolist(), [i, i + 100])
+
+    def test_errors_are_delivered_to_callers(self):
+        """编码失败时异常传递给每个调用方，后续请求不受影响"""
+        calls = []
+        def encode(texts):
+            calls.append(texts)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return _encode(texts)
+
+        encoder = BatchingEncoder(encode, max_batch=4, wait_ms=0)
+        with self.assertRaises(RuntimeError):
+            encoder.encode(['1'])
+        self.assertEqual(encoder.encode(['2'])[0, 0], 2.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+from app.utils.chunk_store import ChunkStore
+
+def _records(doc_id, count):
+    return [{'chunk_id': f"{doc_id}_chunk_{i}", 'original_id': doc_id} for i in range(count)]
+
+class TestChunkStore(unittest.TestCase):
+    def test_rows_line_up_with_records(self):
+        """行号与追加顺序一致，同一文档的分块连续"""
+        store = ChunkStore()
+        self.assertEqual(store.append('a', _records('a', 3)), range(0, 3))
+        self.assertEqual(store.append('b', _records('b', 2)), range(3, 5))
+        self.assertEqual(store.get(4)['chunk_id'], 'b_chunk_1')
+        self.assertIsNone(store.get(5))
+        self.assertIsNone(store.get(-1))
+
+    def test_remove_and_compact(self):
+        """删除后行号不复用，压缩后重新分配连续行号"""
+        store = ChunkStore()
+        store.append('a', _records('a', 2))
+        store.append('b', _records('b', 2))
+        self.assertEqual(store.remove('a'), range(0, 2))
+        self.assertIsNone(store.get(0))
+        self.assertEqual(len(store), 2)
+
+        mapping = store.compact()
+        self.assertEqual(mapping, [-1, -1, 0, 1])
+        self.assertEqual(store.get_rows('b'), range(0, 2))
+        self.assertEqual(store.get(0)['chunk_id'], 'b_chunk_0')
+        self.assertEqual(store.tombstones, 0)
+
+if __name__ == "__main__":
+    unittest.main()
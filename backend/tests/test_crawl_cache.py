@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.utils import crawler
+from app.utils.crawl_cache import CrawlCache, freshness_lifetime
+
+PAGE = '<html><head><title>缓存</title></head><body><article><p>正文</p></article></body></html>'
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """/etag 带ETag且每次都要重新验证，/fresh 缓存60秒，/nostore 禁止缓存"""
+
+    requests = []
+
+    def do_GET(self):
+        PageHandler.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/etag' and self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            return
+        body = PAGE.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.path == '/etag':
+            self.send_header('ETag', '"v1"')
+            self.send_header('Cache-Control', 'no-cache')
+        elif self.path == '/fresh':
+            self.send_header('Cache-Control', 'public, max-age=60')
+        else:
+            self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCrawlCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = CrawlCache(os.path.join(self.temp_dir, 'crawl.db'))
+        PageHandler.requests = []
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_freshness_lifetime(self):
+        self.assertIsNone(freshness_lifetime({'Cache-Control': 'no-store, max-age=60'}, 0))
+        self.assertEqual(freshness_lifetime({'Cache-Control': 'no-cache'}, 0), 0)
+        self.assertEqual(freshness_lifetime({'Cache-Control': 'max-age=60, s-maxage=30'}, 0), 30)
+        self.assertEqual(freshness_lifetime({'Expires': 'Thu, 01 Jan 2026 00:10:00 GMT',
+                                             'Date': 'Thu, 01 Jan 2026 00:00:00 GMT'}, 0), 600)
+        self.assertEqual(freshness_lifetime({}, 0), 0)
+
+    def test_conditional_get_reuses_cached_page(self):
+        """需要重新验证的页面带上ETag请求，服务器返回304时使用缓存的HTML"""
+        url = f"{self.base}/etag"
+        self.assertEqual(crawler.fetch_page(url, self.cache), (PAGE, 'downloaded'))
+        self.assertEqual(crawler.fetch_page(url, self.cache), (PAGE, 'revalidated'))
+        self.assertEqual(PageHandler.requests, [('/etag', None), ('/etag', '"v1"')])
+
+    def test_fresh_page_skips_request(self):
+        """max-age内不发请求；no-store的页面每次都下载"""
+        for _ in range(3):
+            self.assertEqual(crawler.fetch_page(f"{self.base}/fresh", self.cache)[0], PAGE)
+            self.assertEqual(crawler.fetch_page(f"{self.base}/nostore", self.cache)[1], 'downloaded')
+        self.assertEqual([path for path, _ in PageHandler.requests], ['/fresh'] + ['/nostore'] * 3)
+        self.assertEqual(self.cache.stats()['fresh'], 2)
+
+    def test_unchanged_content_skips_extraction(self):
+        """内容相同的页面只提取一次"""
+        url = f"{self.base}/fresh"
+        with mock.patch.object(crawler, 'extract_main_content', wraps=crawler.extract_main_content) as extract:
+            first = crawler.extract_main_content_cached(PAGE, url, self.cache)
+            second = crawler.extract_main_content_cached(PAGE, url, self.cache)
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(first['content'], '正文')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import time
+import threading
+import unittest
+from app.utils.crawl_pipeline import CrawlPipeline, HostLimiter, RateLimiter, interleave_by_host
+
+
+def extract_title(html, url):
+    """模块级函数，可以在提取进程中执行"""
+    return {'title': html.upper(), 'url': url}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        self.now += seconds
+
+
+class TestCrawlPipeline(unittest.TestCase):
+    def make_pipeline(self, fetch, summarize=None, **kwargs):
+        kwargs.setdefault('extract_workers', 0)
+        kwargs.setdefault('host_limiter', HostLimiter(max_per_host=8, min_interval=0))
+        kwargs.setdefault('rate_limiter', RateLimiter(per_minute=0))
+        return CrawlPipeline(fetch=fetch, extract=extract_title, summarize=summarize, **kwargs)
+
+    def test_results_for_every_url(self):
+        """每个URL产出一条结果，重复的URL只下载一次，失败记录出错的阶段"""
+        fetched = []
+
+        def fetch(url):
+            fetched.append(url)
+            if 'bad' in url:
+                raise IOError('404')
+            return url.rsplit('/', 1)[-1]
+
+        def summarize(extracted, url):
+            if extracted['title'] == 'NOSUM':
+                raise ValueError('LLM失败')
+            return extracted['title']
+
+        urls = ['http://a.com/x', 'http://b.com/bad', 'http://a.com/x', 'http://c.com/nosum']
+        results = sorted(self.make_pipeline(fetch, summarize).run(urls), key=lambda r: r['index'])
+
+        self.assertEqual([r['index'] for r in results], [0, 1, 2, 3])
+        self.assertEqual(sorted(fetched), ['http://a.com/x', 'http://b.com/bad', 'http://c.com/nosum'])
+        self.assertEqual((results[0]['success'], results[0]['data']), (True, 'X'))
+        self.assertEqual(results[2]['data'], 'X')
+        self.assertEqual((results[1]['success'], results[1]['stage'], results[1]['message']), (False, 'fetching', '404'))
+        self.assertEqual((results[3]['success'], results[3]['stage']), (False, 'summarizing'))
+
+    def test_results_streamed_as_completed(self):
+        """慢的URL不会阻塞其他URL的结果"""
+        release = threading.Event()
+
+        def fetch(url):
+            if 'slow' in url:
+                release.wait(5)
+            return 'page'
+
+        results = self.make_pipeline(fetch).run(['http://slow.com/', 'http://fast.com/'])
+        first = next(results)
+        self.assertEqual(first['url'], 'http://fast.com/')
+        release.set()
+        self.assertEqual(next(results)['url'], 'http://slow.com/')
+
+    def test_per_host_concurrency(self):
+        """同一域名同时进行的下载数不超过限制"""
+        lock = threading.Lock()
+        active = {}
+        peak = {}
+
+        def fetch(url):
+            host = url.split('/')[2]
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(0.02)
+            with lock:
+                active[host] -= 1
+            return 'page'
+
+        urls = [f'http://{host}.com/{i}' for host in ('a', 'b') for i in range(6)]
+        pipeline = self.make_pipeline(fetch, fetch_workers=8, host_limiter=HostLimiter(max_per_host=2, min_interval=0))
+        self.assertEqual(len(list(pipeline.run(urls))), 12)
+        self.assertEqual(peak, {'a.com': 2, 'b.com': 2})
+
+    def test_process_pool_extract(self):
+        """在进程池中提取正文"""
+        pipeline = self.make_pipeline(lambda url: 'page', extract_workers=1)
+        results = list(pipeline.run(['http://a.com/1', 'http://a.com/2']))
+        self.assertEqual({r['data']['title'] for r in results}, {'PAGE'})
+
+    def test_host_interval(self):
+        """同一域名的请求按最小间隔错开，不同域名互不影响"""
+        clock = FakeClock()
+        limiter = HostLimiter(max_per_host=4, min_interval=0.5, clock=clock, sleep=clock.sleep)
+        for url in ('http://a.com/1', 'http://b.com/1', 'http://a.com/2'):
+            with limiter.slot(url):
+                pass
+        self.assertEqual(clock.sleeps, [0.5])
+
+    def test_rate_limiter(self):
+        """超过速率时等待到令牌补满"""
+        clock = FakeClock()
+        limiter = RateLimiter(per_minute=120, burst=2, clock=clock, sleep=clock.sleep)
+        for _ in range(4):
+            limiter.acquire()
+        self.assertEqual(clock.sleeps, [0.5, 0.5])
+
+    def test_interleave_by_host(self):
+        urls = ['http://a.com/1', 'http://a.com/2', 'http://a.com/3', 'http://b.com/1']
+        self.assertEqual(interleave_by_host(urls), ['http://a.com/1', 'http://b.com/1', 'http://a.com/2', 'http://a.com/3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.utils import crawler
+
+ARTICLE = '<html><head>{meta}<title>编码</title></head><body><article><h1>标题</h1><p>中文正文 {index}</p></article></body></html>'
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    """/gbk 只在meta中声明编码，/big 声明了超过上限的长度，/endless 没有长度、一直发送"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/endless':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            chunk = b'<p>' + b'x' * 8192 + b'</p>'
+            try:
+                for _ in range(10000):
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            self.close_connection = True
+            return
+
+        if self.path == '/gbk':
+            body = ARTICLE.format(meta='<meta charset="gb2312">', index=1).encode('gbk')
+            content_type = 'text/html'
+        elif self.path == '/big':
+            body = b'<p>' + b'x' * 300000 + b'</p>'
+            content_type = 'text/html; charset=utf-8'
+        else:
+            body = ARTICLE.format(meta='', index='x' * 200000).encode('utf-8')
+            content_type = 'text/html; charset=utf-8'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端超过上限后主动断开连接
+        pass
+
+
+class TestCrawlerStreaming(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = QuietServer(('127.0.0.1', 0), StreamHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_declared_encoding(self):
+        self.assertEqual(crawler.declared_encoding('text/html; charset=GBK', b''), 'gb18030')
+        self.assertEqual(crawler.declared_encoding('text/html', b'<meta http-equiv="Content-Type" '
+                                                                b'content="text/html; charset=utf-8">'), 'utf-8')
+        self.assertEqual(crawler.declared_encoding('text/html; charset=utf-8', b'\xef\xbb\xbf<p>'), 'utf-8-sig')
+        self.assertIsNone(crawler.declared_encoding('text/html; charset=unknown', b'<p>'))
+
+    def test_meta_charset(self):
+        """响应头没有声明编码时使用<meta>中的编码"""
+        html, source = crawler.fetch_page(f"{self.base}/gbk", cache=None)
+        self.assertEqual(source, 'downloaded')
+        self.assertIn('中文正文 1', html)
+
+    def test_size_limit(self):
+        """声明的长度或实际读取的字节数超过上限时放弃"""
+        with self.assertRaises(crawler.PageTooLarge):
+            crawler.fetch_page(f"{self.base}/big", cache=None, max_bytes=100000)
+        with mock.patch.object(crawler, 'CRAWL_MAX_PAGE_BYTES', 100000):
+            with self.assertRaises(crawler.PageTooLarge):
+                crawler.fetch_page(f"{self.base}/endless", cache=None)
+
+    def test_incremental_extraction(self):
+        """边下载边解析的结果与下载完成后提取相同"""
+        url = f"{self.base}/page"
+        html, _ = crawler.fetch_page(url, cache=None)
+        data = crawler.fetch_and_extract(url, cache=None)
+        self.assertEqual(data, crawler.extract_main_content(html, url))
+        self.assertTrue(data['content'].startswith('# 标题'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from app.utils.embedding_store import EmbeddingStore
+
+
+def vectors(*values):
+    """每个值生成一行向量，便于检查读回的是哪一条"""
+    return np.array([[value, value + 0.5] for value in values], dtype=np.float32)
+
+
+class TestEmbeddingStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def new_store(self, **kwargs):
+        return EmbeddingStore(self.tmp_dir, 'test-model', **kwargs)
+
+    def segment_files(self, store):
+        return sorted(name for name in os.listdir(store.store_dir) if name.endswith('.npy'))
+
+    def test_round_trip(self):
+        """写入后按哈希读回，缺失的位置单独返回，重复写入不产生新分段"""
+        store = self.new_store()
+        store.put_many(['a', 'b'], vectors(1, 2))
+        embeddings, missing = store.get_many(['b', 'x', 'a'])
+        self.assertEqual(missing, [1])
+        np.testing.assert_array_equal(embeddings[[0, 2]], vectors(2, 1))
+
+        store.put_many(['a'], vectors(9))
+        self.assertEqual(len(self.segment_files(store)), 1)
+        self.assertEqual(store.get_many(['x']), (None, [0]))
+
+        half = self.new_store(dtype='float16')
+        half.put_many(['a'], vectors(1))
+        np.testing.assert_allclose(half.get_many(['a'])[0], vectors(1))
+
+    def test_other_instance_sees_manifest(self):
+        """另一个进程的实例通过清单读到已写入的向量，之后的写入也会重新加载"""
+        writer = self.new_store()
+        writer.put_many(['a'], vectors(1))
+        reader = self.new_store()
+        np.testing.assert_array_equal(reader.get_many(['a'])[0], vectors(1))
+
+        writer.put_many(['b'], vectors(2))
+        np.testing.assert_array_equal(reader.get_many(['a', 'b'])[0], vectors(1, 2))
+        reader.put_many(['b', 'c'], vectors(2, 3))
+        self.assertEqual(len(writer), 2)
+        self.assertEqual(writer.get_many(['c'])[1], [])
+
+    def test_compaction_keeps_large_segment_and_drops_unused(self):
+        """合并只重写较小的分段，清理不再使用的向量，合并后其他实例仍能读取"""
+        live = {str(i) for i in range(100)}
+        store = self.new_store(max_segments=3, live_hashes=lambda: live)
+        store.put_many([str(i) for i in range(100)], vectors(*range(100)))
+        base = store.entries['0'][0]
+
+        live.discard('0')
+        for i in range(100, 102):
+            live.add(str(i))
+            store.put_many([str(i)], vectors(i))
+        store.put_many(['unused'], vectors(-1))  # 分段数超过上限，合并三个小分段
+
+        self.assertEqual(store.entries['1'][0], base)
+        self.assertNotIn('0', store.entries)
+        self.assertIn('unused', store.entries)  # 刚写入的向量本次不清理
+        self.assertEqual(len(self.segment_files(store)), 2)
+        reader = self.new_store()
+        keys = ['1', '99', '100', '101', 'unused']
+        np.testing.assert_array_equal(reader.get_many(keys)[0], vectors(1, 99, 100, 101, -1))
+
+        # 大分段中超过一半的向量不再使用时，它也被重写
+        live.difference_update(str(i) for i in range(60))
+        for i in range(103, 106):
+            live.add(str(i))
+            store.put_many([str(i)], vectors(i))
+        self.assertNotEqual(store.entries['99'][0], base)
+        self.assertNotIn(base, self.segment_files(store))
+        self.assertEqual(len(store), len(live))
+        np.testing.assert_array_equal(self.new_store().get_many(['60', '105'])[0], vectors(60, 105))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import faiss
+import numpy as np
+from app.utils.chunk_store import ChunkStore
+from app.utils.knowledge_base import KnowledgeBase
+from app.utils.startup_optimizer import startup_optimizer
+from app.utils.flashrag_service import FlashRAGService
+
+KEYWORDS = ['alpha', 'beta', 'gamma', 'delta']
+
+
+class FakeEmbeddingService:
+    """按文本包含的关键词生成向量的句向量服务，查询与文档包含相同关键词时距离为0"""
+
+    dimension = len(KEYWORDS)
+
+    def __init__(self):
+        self.encoded = []  # 每次encode的文本，用于检查哪些文档被重新向量化
+
+    def load(self):
+        return self
+
+    def encode(self, texts, batch_size=None, normalize=False):
+        self.encoded.extend(texts)
+        return np.array([[float(word in text.lower()) for word in KEYWORDS] for text in texts], dtype=np.float32)
+
+    def encode_queries(self, texts):
+        return self.encode(texts)
+
+
+class TestFlashRAGIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.kb_path = f"{self.tmp_dir}/kb.json"
+        patcher = mock.patch.object(startup_optimizer, 'should_enable_vector_cache', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.knowledge_base = KnowledgeBase(self.kb_path)
+        self.knowledge_base.add_documents([
+            {'id': 'a', 'title': 'A', 'content': 'alpha'},
+            {'id': 'b', 'title': 'B', 'content': 'beta'},
+        ])
+        self.encoder = FakeEmbeddingService()
+        self.service = self.new_service(self.knowledge_base)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def new_service(self, knowledge_base=None):
+        """创建共享同一知识库文件和索引目录的服务，相当于另一个worker进程"""
+        service = FlashRAGService(knowledge_base or KnowledgeBase(self.kb_path), self.encoder, f"{self.tmp_dir}/flashrag")
+        service.persist_delay = 0
+        return service
+
+    def top_id(self, query, service=None):
+        return (service or self.service).search(query, top_k=1)[0]['id']
+
+    def test_delete_and_compaction_remap_ids(self):
+        """删除文档后不再检索到它，压缩后FAISS向量ID与新行号一致"""
+        self.service.upsert_documents([{'id': 'c', 'title': 'C', 'content': 'gamma'}])
+        self.assertTrue(self.service.delete_document('a'))
+        self.assertNotIn('a', [doc['id'] for doc in self.service.search('alpha', top_k=5)])
+
+        with mock.patch.object(ChunkStore, 'needs_compaction', return_value=True):
+            self.assertTrue(self.service.delete_document('b'))
+        store = self.service.chunk_store
+        self.assertEqual(store.tombstones, 0)
+        self.assertEqual(store.get_rows('c'), range(0, 1))
+        self.assertEqual(list(faiss.vector_to_array(self.service.index.id_map)), [0])
+        self.assertEqual(self.top_id('gamma'), 'c')
+        self.assertEqual([doc['id'] for doc in self.service.search('beta', top_k=5)], ['c'])
+
+    def test_upsert_replaces_document_chunks(self):
+        """更新文档时替换其分块，索引中的向量数与有效分块数一致"""
+        self.service.upsert_document('a', 'A', 'delta')
+        self.assertEqual(self.top_id('delta'), 'a')
+        self.assertEqual(self.service.index.ntotal, len(self.service.chunk_store))
+        self.assertEqual(self.service.sync(), (0, 0))
+
+    def test_search_applies_changes_from_other_process(self):
+        """其他进程写入知识库后，检索前只重新向量化变化的文档"""
+        other = KnowledgeBase(self.kb_path)
+        other.add_document('c', 'C', 'gamma')
+        other.add_document('a', 'A', 'delta')
+        other.remove_document('b')
+
+        self.encoder.encoded.clear()
+        self.assertEqual(self.top_id('gamma'), 'c')
+        self.assertEqual(len(self.encoder.encoded), 3)  # 两篇文档各一个分块，加一次查询
+        self.assertEqual(self.top_id('delta'), 'a')
+        self.assertEqual(sorted(self.service.chunk_store.doc_rows), ['a', 'c'])
+        self.assertEqual(self.service.sync(), (0, 0))
+
+    def test_reload_saved_index(self):
+        """保存的索引重新加载后不需要重新向量化"""
+        self.knowledge_base.add_document('c', 'C', 'gamma')
+        self.service.upsert_document('c', 'C', 'gamma')
+        self.encoder.encoded.clear()
+        reloaded = self.new_service()
+        self.assertTrue(reloaded._index_mmapped)
+        self.assertEqual(reloaded._doc_digests, self.service._doc_digests)
+        self.assertEqual(self.top_id('gamma', reloaded), 'c')
+        self.assertEqual(self.encoder.encoded, ['gamma'])
+
+    def test_reload_index_saved_by_stale_worker(self):
+        """其他worker保存的索引缺少本进程写入的文档时，重新加载后补齐缺少的文档"""
+        other = self.new_service()
+        self.knowledge_base.add_document('c', 'C', 'gamma')
+        self.service.upsert_document('c', 'C', 'gamma')
+        other.knowledge_base.add_document('d', 'D', 'delta')
+        other.upsert_document('d', 'D', 'delta')
+
+        self.encoder.encoded.clear()
+        reloaded = self.new_service()
+        self.assertEqual(sorted(reloaded._doc_digests), ['a', 'b', 'd'])
+        self.assertEqual(self.top_id('gamma', reloaded), 'c')
+        self.assertEqual(len(self.encoder.encoded), 2)  # 只向量化缺少的文档和查询
+        self.assertEqual(sorted(reloaded.chunk_store.doc_rows), ['a', 'b', 'c', 'd'])
+
+    def test_saves_are_debounced(self):
+        """延迟期间的多次更新合并为一次写盘"""
+        self.service.persist_delay = 60
+        with mock.patch.object(self.service, '_persist_index', wraps=self.service._persist_index) as persist:
+            self.service.upsert_document('c', 'C', 'gamma')
+            self.service.delete_document('a')
+            self.assertEqual(persist.call_count, 0)
+            self.service.save()
+            self.assertEqual(persist.call_count, 1)
+        self.assertEqual(sorted(self.new_service()._doc_digests), ['b', 'c'])
+
+    def test_commit_bulk_upsert(self):
+        """批量写入知识库后同步并立即保存索引，索引不可用时全量重建"""
+        self.service.persist_delay = 60
+        self.knowledge_base.add_documents([{'id': 'c', 'title': 'C', 'content': 'gamma'}])
+        self.service.commit_bulk_upsert()
+        self.assertEqual(sorted(self.new_service()._doc_digests), ['a', 'b', 'c'])
+
+        self.service.index = None
+        self.service.commit_bulk_upsert()
+        self.assertEqual(sorted(self.service.chunk_store.doc_rows), ['a', 'b', 'c'])
+        self.assertEqual(self.top_id('gamma'), 'c')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import random
+import unittest
+from app.utils.crawler import extract_main_content, extract_main_content_bs4
+from app.utils.html_markdown import html_to_markdown, LXML_AVAILABLE
+
+URL = 'https://example.com/docs/page.html'
+
+DOCUMENTS = [
+    # 正文区域、标题、段落中的链接和代码、列表嵌套、表格、引用、图片
+    '<html><head><title> 指南 </title></head><body><nav><a href="/">首页</a></nav><article>'
+    '<h1>标题 <code>x</code></h1><p>段落 <a href="/a">链接</a> 和 <code>code</code> &amp; 实体</p>'
+    '<ul><li>一<ul><li>嵌套</li></ul></li><li><p>段落项</p></li></ul><ol><li>甲</li><li>乙<ul><li>丙</li></ul></li></ol>'
+    '<pre><span>def</span> f():\n    return 1</pre><table><tr><th>键</th><th>值</th></tr><tr><td>a</td><td><p>1</p></td></tr></table>'
+    '<blockquote>引用\n第二行</blockquote><div><a href="/b">外部链接</a> <a>无地址</a> <img src="/i.png"> <img alt="" src="x.png">'
+    '<a href="/c"><img src="/in-link.png"></a></div></article><script>var a = 1;</script></body></html>',
+    # 多个候选元素按序列化长度选择，meta中的编码在序列化时被替换
+    '<div class="container"><meta charset="gbk"><p>短</p></div><div class="container"><p>更长一些的内容</p></div>',
+    '<div class="container a  b"><meta charset="gb18030"><p>x</p></div><div class="container a b"><p>yy</p></div>',
+    # 没有候选元素时使用body，没有body时使用整个文档
+    '<html><body><h2>二级</h2>文本<!-- 注释 --><form><p>表单</p></form><iframe>框架</iframe></body></html>',
+    '<!DOCTYPE html><title>无正文</title><p>a<p>b</p>c',
+    # 未闭合的标签、多余的结束标签、空白、pre中的空白、ruby注音
+    '<main><p>一<p>二</div></p>\n\n   \n<pre>  \n  保留  \n</pre><ruby>漢<rt>kan</rt></ruby><br></br><p/></main>',
+    # 被替换元素中的标题不再存在
+    '<article><code><title>代码中的标题</title></code></article><title>第二个标题</title>',
+]
+
+
+def random_document(rng, depth=0):
+    tags = ['div', 'span', 'p', 'h2', 'ul', 'ol', 'li', 'pre', 'code', 'table', 'tr', 'td', 'blockquote', 'a', 'img',
+            'script', 'form', 'article', 'section', 'title']
+    texts = [' ', '\n', '文本', 'a &amp; b', '&#169;', '&lt;x&gt;', '\n\n\nfoo\n\n\n']
+    attributes = ['', ' class="container"', ' class="content post"', ' href="/x"', ' href="http://e.com"',
+                  ' src="/i.png"', ' alt=""', ' id="content"']
+    parts = []
+    for _ in range(rng.randint(0, 4 if depth < 4 else 1)):
+        if rng.random() < 0.4:
+            parts.append(rng.choice(texts))
+        else:
+            tag = rng.choice(tags)
+            closing = f'</{tag}>' if rng.random() < 0.85 else ''
+            parts.append(f'<{tag}{rng.choice(attributes)}>{random_document(rng, depth + 1)}{closing}')
+    return ''.join(parts)
+
+
+class TestHtmlMarkdown(unittest.TestCase):
+    def test_same_output_as_bs4(self):
+        """单遍转换的输出与原实现逐字相同"""
+        for html in DOCUMENTS:
+            with self.subTest(html=html[:60]):
+                result = html_to_markdown(html, URL)
+                self.assertIsNotNone(result)
+                self.assertEqual(result, extract_main_content_bs4(html, URL))
+
+    def test_random_documents(self):
+        """随机生成的文档（包括未闭合和错误嵌套的标签）输出相同"""
+        rng = random.Random(7)
+        for _ in range(300):
+            html = random_document(rng)
+            result = html_to_markdown(html, URL)
+            if result is not None:
+                self.assertEqual(result, extract_main_content_bs4(html, URL), html)
+
+    def test_unsupported_falls_back(self):
+        """标题中嵌套元素和嵌套过深时交给原实现"""
+        nested_title = '<html><head><title><b>粗体标题</b></title></head><body><p>正文</p></body></html>'
+        self.assertIsNone(html_to_markdown(nested_title, URL))
+        self.assertEqual(extract_main_content(nested_title, URL), extract_main_content_bs4(nested_title, URL))
+
+        deep = '<div>' * 400 + '内容'
+        self.assertIsNone(html_to_markdown(deep, URL))
+        self.assertEqual(extract_main_content(deep, URL)['content'], '内容')
+
+    @unittest.skipUnless(LXML_AVAILABLE, '未安装lxml')
+    def test_lxml_same_output_as_bs4(self):
+        """使用lxml解析时输出与使用lxml的原实现相同"""
+        rng = random.Random(11)
+        for html in DOCUMENTS + [random_document(rng) for _ in range(300)]:
+            result = html_to_markdown(html, URL, 'lxml')
+            if result is not None:
+                self.assertEqual(result, extract_main_content_bs4(html, URL, 'lxml'), html)
+
+    def test_unknown_parser(self):
+        with self.assertRaises(ValueError):
+            html_to_markdown('<p>x</p>', URL, 'html5lib')
+
+
+if __name__ == '__main__':
+    unittest.main()
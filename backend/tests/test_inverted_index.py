@@ -0,0 +1,64 @@
+import unittest
+from app.utils.inverted_index import InvertedIndex, tokenize
+
+class TestInvertedIndex(unittest.TestCase):
+    def test_tokenize_mixed_text(self):
+        """中文切分为二元组，英文按词小写输出"""
+        self.assertEqual(tokenize('检索增强RAG'), ['检索', '索增', '增强', 'rag'])
+        self.assertEqual(tokenize('学'), ['学'])
+        self.assertEqual(tokenize('Docker 2.0'), ['docker', '2', '0'])
+
+    def test_candidates_and_incremental_update(self):
+        """候选集包含全部查询词，增删文档后索引同步更新"""
+        index = InvertedIndex()
+        index.add_document('1', 'RAG检索增强', '检索增强生成')
+        index.add_document('2', 'Docker入门', '容器技术')
+        self.assertEqual(index.candidates('检索增强'), {'1'})
+        self.assertEqual(index.candidates('docker 容器'), {'2'})
+        self.assertIsNone(index.candidates('学'))
+
+        index.add_document('1', 'Docker进阶', '镜像构建')
+        self.assertEqual(index.candidates('docker 入门'), {'2'})
+        self.assertEqual(index.candidates('检索'), set())
+
+        index.remove_document('2')
+        self.assertEqual(index.candidates('docker入门'), set())
+        self.assertEqual(index.postings['docker'], {'1': 2})
+
+    def test_candidates_keep_partial_words(self):
+        """英文片段不参与过滤，部分单词的查询不会漏掉文档"""
+        index = InvertedIndex()
+        index.add_document('1', 'FlashRAG', 'python数据处理')
+        self.assertIsNone(index.candidates('rag'))
+        self.assertIsNone(index.candidates('pyth'))
+        self.assertEqual(index.candidates('on数据'), {'1'})
+        self.assertIsNone(index.candidates('flash rag'))
+
+    def test_candidates_filter_interior_words(self):
+        """两侧都有分隔符的英文词和数字按整词过滤"""
+        index = InvertedIndex()
+        index.add_document('1', 'Docker', '使用docker部署python 3服务')
+        index.add_document('2', 'Python', 'python 2 and python 3')
+        self.assertEqual(index.candidates('a python 3'), {'1', '2'})
+        self.assertEqual(index.candidates('2 and python 3'), {'2'})
+        self.assertEqual(index.candidates('用docker部'), {'1'})
+        self.assertEqual(index.candidates(' dock '), set())
+
+    def test_bm25_ranking(self):
+        """词频高、文档短的文档排在前面，统计量随删除同步更新"""
+        index = InvertedIndex()
+        index.add_document('long', '数据库', '缓存 ' + '其他内容 ' * 50)
+        index.add_document('short', '缓存设计', '缓存 缓存 redis')
+        index.add_document('none', 'Docker入门', '容器技术')
+
+        ranked = index.top_k('缓存', k=3)
+        self.assertEqual([doc_id for doc_id, _ in ranked], ['short', 'long'])
+        self.assertGreater(ranked[0][1], ranked[1][1])
+        self.assertEqual(index.top_k('缓存', k=1)[0][0], 'short')
+
+        index.remove_document('short')
+        self.assertEqual(index.total_length, sum(index.doc_lengths.values()))
+        self.assertEqual([doc_id for doc_id, _ in index.top_k('缓存 redis')], ['long'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from app.utils.job_queue import JobQueue
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'jobs.db')
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def make_queue(self, **kwargs):
+        """workers=0时不启动后台线程，由测试调用run_next执行任务"""
+        queue = JobQueue(self.path, workers=0, **kwargs)
+
+        def handler(job, params):
+            self.calls.append(params)
+            job.update('working')
+            if params.get('fail'):
+                raise RuntimeError('boom')
+            return {'echo': params['value']}
+        queue.register('echo', handler)
+        return queue
+
+    def test_run_and_result(self):
+        """任务执行后保存结果和状态"""
+        queue = self.make_queue()
+        job, created = queue.submit('echo', {'value': '值'})
+        self.assertTrue(created)
+        self.assertEqual(job['status'], 'pending')
+        self.assertTrue(queue.run_next())
+        self.assertFalse(queue.run_next())
+        job = queue.get(job['id'])
+        self.assertEqual((job['status'], job['stage'], job['result']), ('completed', 'working', {'echo': '值'}))
+
+    def test_failure(self):
+        """处理函数抛出异常时任务失败，记录错误信息"""
+        queue = self.make_queue()
+        job, _ = queue.submit('echo', {'value': 1, 'fail': True})
+        queue.run_next()
+        job = queue.get(job['id'])
+        self.assertEqual((job['status'], job['error']), ('failed', 'boom'))
+
+    def test_deduplication(self):
+        """相同去重键的任务在执行中和完成后共用；失败后重新提交会新建任务"""
+        queue = self.make_queue()
+        first, _ = queue.submit('echo', {'value': 1}, dedup_key='a')
+        second, created = queue.submit('echo', {'value': 1}, dedup_key='a')
+        self.assertEqual((second['id'], created), (first['id'], False))
+        queue.run_next()
+        third, created = queue.submit('echo', {'value': 1}, dedup_key='a')
+        self.assertEqual((third['id'], third['status'], created), (first['id'], 'completed', False))
+        self.assertEqual(len(self.calls), 1)
+
+        failed, _ = queue.submit('echo', {'value': 2, 'fail': True}, dedup_key='b')
+        queue.run_next()
+        retried, created = queue.submit('echo', {'value': 2}, dedup_key='b')
+        self.assertTrue(created)
+        self.assertNotEqual(retried['id'], failed['id'])
+
+    def test_survives_restart(self):
+        """进程在执行任务时退出，租期到期后由新进程重新执行，超过最大次数后标记失败"""
+        queue = self.make_queue(lease=0.05, max_attempts=2)
+        job, _ = queue.submit('echo', {'value': 1})
+        self.assertIsNotNone(queue._claim())  # 领取后未完成，模拟进程崩溃
+
+        restarted = self.make_queue(lease=0.05, max_attempts=2)
+        self.assertFalse(restarted.run_next())  # 租期未到，不重复执行
+        time.sleep(0.06)
+        self.assertIsNotNone(restarted._claim())
+        time.sleep(0.06)
+        self.assertFalse(restarted.run_next())
+        job = restarted.get(job['id'])
+        self.assertEqual((job['status'], job['attempts']), ('failed', 2))
+
+    def test_worker_threads(self):
+        """后台worker执行提交的任务"""
+        queue = JobQueue(self.path, workers=2, poll_interval=0.05)
+        done = threading.Event()
+        queue.register('echo', lambda job, params: done.set() or params)
+        job, _ = queue.submit('echo', {'value': 1})
+        self.assertTrue(done.wait(5))
+        for _ in range(100):
+            if queue.get(job['id'])['status'] == 'completed':
+                break
+            time.sleep(0.01)
+        self.assertEqual(queue.get(job['id'])['result'], {'value': 1})
+        queue.stop(timeout=1)
+
+if __name__ == "__main__":
+    unittest.main()
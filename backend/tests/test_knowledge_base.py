@@ -0,0 +1,107 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from app.utils import knowledge_base as knowledge_base_module
+from app.utils.knowledge_base import KnowledgeBase
+
+class TestKnowledgeBaseJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'kb.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_writes_append_to_journal_and_survive_reload(self):
+        """增删只追加日志，重新加载后重放日志得到相同内容"""
+        kb = KnowledgeBase(self.path)
+        kb.add_document('1', 'RAG', '检索增强生成')
+        self.assertEqual(kb.add_documents([{'id': 2, 'title': 'Docker', 'content': '容器'}]), 1)
+        kb.remove_document('1')
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {})
+
+        reloaded = KnowledgeBase(self.path)
+        self.assertEqual(list(reloaded.get_all_documents()), ['2'])
+        self.assertEqual(reloaded.content_hash(), kb.content_hash())
+
+    def test_refresh_sees_other_instance_and_compaction(self):
+        """其他实例的写入和日志压缩都能通过refresh同步"""
+        writer = KnowledgeBase(self.path)
+        reader = KnowledgeBase(self.path)
+        writer.add_document('1', 'RAG', '检索增强生成')
+        self.assertEqual(reader.get_document('1')['title'], 'RAG')
+        self.assertEqual(reader.search_documents('检索')[0]['id'], '1')
+
+        writer.compact()
+        self.assertEqual(os.path.getsize(writer.journal_path), 0)
+        writer.add_document('2', 'Docker', '容器')
+        self.assertEqual(sorted(reader.get_all_documents()), ['1', '2'])
+        self.assertFalse(reader.refresh())
+
+    def test_search_matches_partial_words(self):
+        """查询是某个英文单词的一部分时仍然能搜到"""
+        kb = KnowledgeBase(self.path)
+        kb.add_document('1', 'FlashRAG', 'python数据处理')
+        kb.add_document('2', 'Docker', '容器')
+        self.assertEqual([doc['id'] for doc in kb.search_documents('rag')], ['1'])
+        self.assertEqual([doc['id'] for doc in kb.search_documents('pyth')], ['1'])
+        self.assertEqual([doc['id'] for doc in kb.search_documents('on数据')], ['1'])
+
+    def test_compaction_threshold(self):
+        """日志操作数达到阈值后合并到快照"""
+        original = knowledge_base_module.JOURNAL_COMPACT_MIN_OPS
+        knowledge_base_module.JOURNAL_COMPACT_MIN_OPS = 3
+        try:
+            kb = KnowledgeBase(self.path)
+            kb.add_documents([{'id': i, 'title': f't{i}', 'content': 'c'} for i in range(3)])
+            with open(self.path, encoding='utf-8') as f:
+                self.assertEqual(len(json.load(f)), 3)
+            self.assertEqual(os.path.getsize(kb.journal_path), 0)
+        finally:
+            knowledge_base_module.JOURNAL_COMPACT_MIN_OPS = original
+
+    def test_search_holds_lock_while_other_thread_refreshes(self):
+        """搜索过程中其他线程refresh应用其他进程的写入，不会修改正在遍历的文档集合"""
+        writer = KnowledgeBase(self.path)
+        reader = KnowledgeBase(self.path)
+        writer.add_documents([{'id': i, 'title': f'RAG {i}', 'content': '检索增强生成'} for i in range(10)])
+        reader.refresh()
+        candidates = reader.index.candidates
+
+        def candidates_then_refresh(query):
+            # 在搜索读取文档集合之前，让其他线程同步另一个实例的写入
+            writer.add_document('new', 'RAG new', '检索增强生成')
+            thread = threading.Thread(target=reader.refresh)
+            thread.start()
+            thread.join(0.5)
+            threads.append(thread)
+            return candidates(query)
+
+        threads = []
+        reader.index.candidates = candidates_then_refresh
+        try:
+            results = reader.search_documents('rag')
+        finally:
+            reader.index.candidates = candidates
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(results), 10)
+        self.assertEqual(len(reader.search_documents('rag')), 11)
+
+    def test_snapshot_matches_content_hash(self):
+        """snapshot返回的文档和摘要与同一时刻的知识库一致"""
+        kb = KnowledgeBase(self.path)
+        kb.add_document('1', 'RAG', '检索增强生成')
+        generation, documents, digests = kb.snapshot()
+        self.assertEqual(generation, kb.generation)
+        self.assertEqual(list(documents), ['1'])
+        self.assertEqual(f"{digests['1']:032x}", kb.content_hash())
+        documents.clear()
+        self.assertEqual(list(kb.get_all_documents()), ['1'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import asyncio
+import unittest
+from app.utils.llm_gateway import LLMGateway, LLMGatewayError
+from app.utils.llm_stream import iter_openai_deltas
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from llm_stub_server import LLMStubServer, ANSWER
+
+class TestLLMGateway(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LLMStubServer(latency_ms=0, token_interval_ms=0).start()
+        cls.url = f"{cls.server.base_url}/v1/chat/completions"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.reset_stats()
+        self.gateway = LLMGateway()
+
+    def tearDown(self):
+        self.gateway.close()
+
+    def test_post_reuses_connection(self):
+        """连续的请求复用同一个连接"""
+        for _ in range(5):
+            response = self.gateway.post(self.url, json={'messages': []}, timeout=10)
+            self.assertEqual(response.json()['choices'][0]['message']['content'], ANSWER)
+        self.assertEqual(self.server.requests, 5)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.gateway.stats()['connections'], 1)
+
+    def test_stream_lines(self):
+        """流式响应逐行返回，结束后连接回到连接池"""
+        lines = list(self.gateway.stream_lines(self.url, json={'stream': True}, timeout=10))
+        self.assertEqual(''.join(iter_openai_deltas(lines)), ANSWER)
+        self.gateway.post(self.url, json={}, timeout=10)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_async_api(self):
+        """异步接口可以在调用方自己的事件循环中使用"""
+        async def run():
+            responses = await asyncio.gather(*(self.gateway.apost(self.url, json={}, timeout=10) for _ in range(3)))
+            lines = [line async for line in self.gateway.astream_lines(self.url, json={'stream': True}, timeout=10)]
+            return responses, lines
+        responses, lines = asyncio.run(run())
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(''.join(iter_openai_deltas(lines)), ANSWER)
+
+    def test_connection_error(self):
+        """连接失败抛出LLMGatewayError"""
+        with self.assertRaises(LLMGatewayError):
+            self.gateway.post('http://127.0.0.1:9/v1/chat/completions', json={}, timeout=2)
+
+if __name__ == "__main__":
+    unittest.main()
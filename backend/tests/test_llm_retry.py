@@ -0,0 +1,126 @@
+import unittest
+from app.utils.llm_gateway import LLMGatewayError
+from app.utils.llm_retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_open_and_recover(self):
+        """连续失败达到阈值后熔断，恢复时间后只放行一个探测调用"""
+        clock = FakeClock()
+        breaker = CircuitBreaker('test', failure_threshold=2, recovery_timeout=10, clock=clock)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        clock.now = 10
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        clock.now = 20
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats()['trips'], 2)
+
+    def test_release_keeps_state(self):
+        """release不计成功也不计失败：half_open时保持half_open，并允许下一个探测调用"""
+        clock = FakeClock()
+        breaker = CircuitBreaker('test', failure_threshold=1, recovery_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        self.assertTrue(breaker.allow())
+        breaker.release()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('test', failure_threshold=3, recovery_timeout=30)
+        self.sleeps = []
+        self.policy = RetryPolicy(max_attempts=3, deadline=60, base_delay=1, max_delay=4,
+                                  breakers=lambda provider: self.breaker, sleep=self.sleeps.append)
+
+    def failing(self, errors, result='ok'):
+        calls = []
+        def attempt(timeout):
+            calls.append(timeout)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return result
+        return attempt, calls
+
+    def test_retry_then_succeed(self):
+        """可重试的错误按带抖动的指数退避重试"""
+        attempt, calls = self.failing([LLMGatewayError('503', status_code=503), LLMGatewayError('timeout', timeout=True)])
+        self.assertEqual(self.policy.call('test', attempt, timeout=10), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(0 <= self.sleeps[0] <= 1 and 0 <= self.sleeps[1] <= 2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_client_error_not_retried(self):
+        """4xx错误不重试，也不计入熔断"""
+        attempt, calls = self.failing([LLMGatewayError('401', status_code=401)])
+        with self.assertRaises(LLMGatewayError):
+            self.policy.call('test', attempt, timeout=10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.breaker.stats()['consecutive_failures'], 0)
+
+    def test_client_error_does_not_close_breaker(self):
+        """half_open时的探测请求返回4xx，熔断器不会因此恢复，之前的失败次数也不清零"""
+        clock = FakeClock()
+        self.breaker = CircuitBreaker('test', failure_threshold=2, recovery_timeout=10, clock=clock)
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        clock.now = 10
+        attempt, calls = self.failing([LLMGatewayError('400', status_code=400)])
+        with self.assertRaises(LLMGatewayError):
+            self.policy.call('test', attempt, timeout=10)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(self.breaker.stats()['consecutive_failures'], 2)
+
+    def test_open_breaker_fails_fast(self):
+        """熔断后不再发出请求"""
+        attempt, calls = self.failing([LLMGatewayError('down')] * 10)
+        with self.assertRaises(LLMGatewayError):
+            self.policy.call('test', attempt, timeout=10)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.policy.call('test', attempt, timeout=10)
+        self.assertEqual(len(calls), 3)
+
+    def test_deadline(self):
+        """单次尝试的超时不超过总时限，剩余时限不足以等待时不再重试"""
+        policy = RetryPolicy(max_attempts=5, deadline=0.5, breakers=lambda provider: self.breaker,
+                             sleep=self.sleeps.append)
+        policy.backoff = lambda attempt: 1.0
+        attempt, calls = self.failing([LLMGatewayError('down')] * 5)
+        with self.assertRaises(LLMGatewayError):
+            policy.call('test', attempt, timeout=10)
+        self.assertLessEqual(calls[0], 0.5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_total_delay_cap(self):
+        """所有等待之和不超过max_total_delay，用完后不再重试"""
+        policy = RetryPolicy(max_attempts=5, deadline=60, max_total_delay=2.5,
+                             breakers=lambda provider: CircuitBreaker('test', failure_threshold=10),
+                             sleep=self.sleeps.append)
+        policy.backoff = lambda attempt: 1.0
+        attempt, calls = self.failing([LLMGatewayError('down')] * 5)
+        with self.assertRaises(LLMGatewayError):
+            policy.call('test', attempt, timeout=10)
+        self.assertEqual(self.sleeps, [1.0, 1.0, 0.5])
+        self.assertEqual(len(calls), 4)
+
+if __name__ == "__main__":
+    unittest.main()
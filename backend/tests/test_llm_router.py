@@ -0,0 +1,96 @@
+import time
+import threading
+import unittest
+from app.utils.llm_gateway import LLMGatewayError
+from app.utils.llm_retry import CircuitBreaker
+from app.utils.llm_router import LLMRouter
+
+class TestLLMRouter(unittest.TestCase):
+    def setUp(self):
+        self.breakers = {name: CircuitBreaker(name, failure_threshold=1) for name in ('deepseek', 'openai', 'ollama')}
+        self.router = LLMRouter(hedging=True, min_samples=3, min_hedge_delay=0.05,
+                                breakers=self.breakers.__getitem__)
+
+    def record(self, provider, latency, ok=True, times=5):
+        for _ in range(times):
+            self.router.stats_for(provider).record(latency, ok)
+
+    def test_route(self):
+        """首选提供商健康时排在最前，其余按延迟排序，熔断或错误率过高的排在最后"""
+        self.record('openai', 2.0)
+        self.record('ollama', 1.0)
+        self.assertEqual(self.router.route('deepseek', ['deepseek', 'openai', 'ollama']),
+                         ['deepseek', 'ollama', 'openai'])
+        self.breakers['deepseek'].record_failure()
+        self.record('ollama', 1.0, ok=False, times=10)
+        self.assertEqual(self.router.route('deepseek', ['deepseek', 'openai', 'ollama']),
+                         ['openai', 'ollama', 'deepseek'])
+
+    def test_hedge(self):
+        """首选提供商超过p95仍未返回时对冲，采用先返回的回答"""
+        self.record('deepseek', 0.05)
+
+        def request(provider):
+            time.sleep(1.0 if provider == 'deepseek' else 0.01)
+            return f'answer from {provider}'
+
+        start = time.monotonic()
+        provider, answer = self.router.call('deepseek', request, ['deepseek', 'openai'])
+        self.assertEqual((provider, answer), ('openai', 'answer from openai'))
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual((self.router.hedges, self.router.hedge_wins), (1, 1))
+        self.assertEqual(self.router.hedges_abandoned, 1)
+
+    def test_no_hedge_without_p95(self):
+        """首选提供商的样本不足、还没有p95时不对冲，只等首选提供商返回"""
+        self.record('deepseek', 0.05, times=2)
+        calls = []
+
+        def request(provider):
+            calls.append(provider)
+            time.sleep(0.2)
+            return provider
+
+        self.assertEqual(self.router.call('deepseek', request, ['deepseek', 'openai']), ('deepseek', 'deepseek'))
+        self.assertEqual((calls, self.router.hedges), (['deepseek'], 0))
+
+    def test_hedging_disabled(self):
+        """关闭对冲时在调用方线程中依次尝试，失败后改用下一个提供商"""
+        router = LLMRouter(hedging=False, min_samples=3, min_hedge_delay=0.05, breakers=self.breakers.__getitem__)
+        for _ in range(5):
+            router.stats_for('deepseek').record(0.01, True)
+        threads = []
+
+        def request(provider):
+            threads.append(threading.current_thread())
+            if provider == 'deepseek':
+                raise LLMGatewayError('down')
+            return 'ok'
+
+        self.assertEqual(router.call('deepseek', request, ['deepseek', 'openai']), ('openai', 'ok'))
+        self.assertEqual(threads, [threading.current_thread()] * 2)
+        self.assertEqual((router.hedges, router.failovers), (0, 1))
+
+    def test_failover(self):
+        """首选提供商失败后立即改用下一个提供商，全部失败时抛出最后的错误"""
+        def request(provider):
+            if provider == 'deepseek':
+                raise LLMGatewayError('down')
+            return 'ok'
+
+        self.assertEqual(self.router.call('deepseek', request, ['deepseek', 'openai']), ('openai', 'ok'))
+        self.assertEqual(self.router.failovers, 1)
+        self.assertEqual(self.router.stats()['providers']['deepseek']['error_rate'], 1.0)
+
+        def failing(provider):
+            raise LLMGatewayError(provider)
+        with self.assertRaises(LLMGatewayError):
+            self.router.call('deepseek', failing, ['deepseek', 'openai'])
+
+    def test_no_providers(self):
+        """没有可用的提供商时抛出LLMGatewayError"""
+        with self.assertRaises(LLMGatewayError):
+            self.router.call('deepseek', lambda provider: 'ok', [])
+
+if __name__ == "__main__":
+    unittest.main()
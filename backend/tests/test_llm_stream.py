@@ -0,0 +1,40 @@
+import json
+import unittest
+from app.utils.llm_stream import iter_openai_deltas, iter_ollama_deltas, LLMStreamError
+from app.utils.sse import format_event
+
+class TestLLMStream(unittest.TestCase):
+    def test_openai_deltas(self):
+        """解析SSE数据行，忽略注释、空行和没有内容的数据块，遇到[DONE]结束"""
+        lines = [
+            ': keep-alive',
+            '',
+            'data: ' + json.dumps({'choices': [{'delta': {'role': 'assistant'}}]}),
+            'data: ' + json.dumps({'choices': [{'delta': {'content': '你好'}}]}, ensure_ascii=False),
+            'data: ' + json.dumps({'choices': [{'delta': {'content': '，世界'}}]}, ensure_ascii=False),
+            'data: [DONE]',
+            'data: ' + json.dumps({'choices': [{'delta': {'content': '多余'}}]}, ensure_ascii=False)
+        ]
+        self.assertEqual(list(iter_openai_deltas(lines)), ['你好', '，世界'])
+
+    def test_openai_error_chunk(self):
+        """流式响应中的错误抛出LLMStreamError"""
+        lines = ['data: ' + json.dumps({'error': {'message': 'rate limited'}})]
+        with self.assertRaises(LLMStreamError):
+            list(iter_openai_deltas(lines))
+
+    def test_ollama_deltas(self):
+        """解析Ollama逐行JSON，done为true时结束"""
+        lines = [
+            json.dumps({'message': {'content': 'a'}, 'done': False}),
+            json.dumps({'message': {'content': 'b'}, 'done': True}),
+            json.dumps({'message': {'content': 'c'}, 'done': False})
+        ]
+        self.assertEqual(list(iter_ollama_deltas(lines)), ['a', 'b'])
+
+    def test_format_event(self):
+        """SSE事件以空行结束，数据为JSON"""
+        self.assertEqual(format_event('delta', {'content': '文本'}), 'event: delta\ndata: {"content": "文本"}\n\n')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import time
+import unittest
+from app.utils.lru_cache import LRUCache
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        """超过容量时淘汰最久未使用的条目"""
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (3, 1, 1))
+
+    def test_ttl_expiration(self):
+        """过期条目视为未命中"""
+        cache = LRUCache(max_entries=4, ttl=0.05)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=60)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_byte_budget(self):
+        """占用内存超过上限时淘汰最久未使用的条目，单个超限的值不缓存"""
+        cache = LRUCache(max_entries=10, max_bytes=100, size_of=len)
+        cache.set('a', 'x' * 40)
+        cache.set('b', 'x' * 40)
+        cache.set('c', 'x' * 40)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['bytes'], 80)
+        cache.set('d', 'x' * 200)
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(len(cache), 2)
+
+    def test_generation_invalidation(self):
+        """数据源版本变化后缓存整体失效，旧版本计算的值不写入"""
+        source = {'generation': 0}
+        cache = LRUCache(max_entries=10, generation=lambda: source['generation'])
+        cache.set('a', 1)
+        stale = cache.current_generation()
+        source['generation'] += 1
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+        cache.set('b', 2, generation=stale)
+        self.assertIsNone(cache.get('b'))
+        cache.set('b', 2, generation=cache.current_generation())
+        self.assertEqual(cache.get('b'), 2)
+
+if __name__ == "__main__":
+    unittest.main()
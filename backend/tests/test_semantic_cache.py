@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+from app.utils.semantic_cache import SemanticCache
+
+class TestSemanticCache(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.base = rng.standard_normal(16).astype(np.float32)
+        self.similar = self.base + 0.05 * rng.standard_normal(16).astype(np.float32)
+        self.other = rng.standard_normal(16).astype(np.float32)
+
+    def test_reuses_answer_for_similar_question(self):
+        """相似问题且文档块相同时复用回答"""
+        cache = SemanticCache(threshold=0.9)
+        cache.store(self.base, ['a_chunk_0', 'b_chunk_1'], 'deepseek', {'answer': 1})
+        self.assertEqual(cache.lookup(self.similar, ['b_chunk_1', 'a_chunk_0'], 'deepseek'), {'answer': 1})
+        self.assertIsNone(cache.lookup(self.other, ['a_chunk_0', 'b_chunk_1'], 'deepseek'))
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_requires_same_chunks_and_provider(self):
+        """文档块或提供商不同时不复用，记为near_miss"""
+        cache = SemanticCache(threshold=0.9)
+        cache.store(self.base, ['a_chunk_0'], 'deepseek', {'answer': 1})
+        self.assertIsNone(cache.lookup(self.base, ['a_chunk_1'], 'deepseek'))
+        self.assertIsNone(cache.lookup(self.base, ['a_chunk_0'], 'openai'))
+        self.assertEqual(cache.stats()['near_misses'], 2)
+
+    def test_eviction_and_generation(self):
+        """超过容量时淘汰最久未使用的条目，知识库版本变化后整体失效"""
+        source = {'generation': 0}
+        cache = SemanticCache(threshold=0.9, max_entries=1, generation=lambda: source['generation'])
+        cache.store(self.base, ['a'], 'deepseek', {'answer': 1})
+        cache.store(self.other, ['b'], 'deepseek', {'answer': 2})
+        self.assertIsNone(cache.lookup(self.base, ['a'], 'deepseek'))
+        self.assertEqual(cache.lookup(self.other, ['b'], 'deepseek'), {'answer': 2})
+
+        source['generation'] += 1
+        self.assertIsNone(cache.lookup(self.other, ['b'], 'deepseek'))
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from app.utils.vector_knowledge_base import VectorKnowledgeBase
+
+
+class TestVectorKnowledgeBase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.kb = VectorKnowledgeBase(cache_dir=self.temp_dir)
+        # 模拟向量已加载的状态
+        self.kb._model_loaded = True
+        self.kb._embeddings_loaded = True
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_add_documents_keeps_vectors_aligned(self):
+        """编码失败时不加入文档，之后加入的文档与向量仍然一一对应"""
+        with mock.patch.object(self.kb, '_encode_texts', side_effect=RuntimeError('编码失败')):
+            self.assertEqual(self.kb.add_documents([{'title': 'a', 'content': 'a'}]), 0)
+        self.assertEqual(self.kb.documents, [])
+
+        vectors = np.eye(2, 4, dtype=np.float32)
+        with mock.patch.object(self.kb, '_encode_texts', return_value=vectors):
+            docs = [{'title': 'b', 'content': 'b'}, {'title': 'c', 'content': 'c'}]
+            self.assertEqual(self.kb.add_documents(docs), 2)
+        self.assertEqual([doc['id'] for doc in self.kb.documents], ['doc1', 'doc2'])
+        self.assertEqual(self.kb._embedding_count, len(self.kb.documents))
+
+
+if __name__ == "__main__":
+    unittest.main()